@@ -1,5 +1,9 @@
 import pytest
+from django.core.cache import cache
 
+from apps.products.services.category_tree import reset_category_tree_snapshot
+from apps.products.services.filter_engine import reset_filter_engine
+from apps.products.services.suggest import reset_suggest_index
 from apps.users.models import User
 from apps.users.tests.factories import UserFactory
 
@@ -9,6 +13,14 @@ def media_storage(settings, tmpdir):
     settings.MEDIA_ROOT = tmpdir.strpath
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    reset_category_tree_snapshot()
+    reset_suggest_index()
+    reset_filter_engine()
+
+
 @pytest.fixture
 def user(db) -> User:
     return UserFactory()
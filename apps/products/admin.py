@@ -1,6 +1,7 @@
 from decimal import ROUND_CEILING
 
 from django.contrib import admin
+from django.db.models import Q
 from django.utils.html import format_html
 from treebeard.admin import TreeAdmin
 from treebeard.forms import movenodeform_factory
@@ -14,6 +15,15 @@ from apps.products.models import (
     ProductProperty,
     ProductPropertyValue,
 )
+from apps.products.services.prices import get_recalculation_progress
+from apps.products.services.search import search_products
+
+RECALCULATION_STATUSES = {
+    "queued": "в очереди",
+    "running": "выполняется",
+    "done": "завершен",
+    "failed": "ошибка",
+}
 
 
 class PropertyInline(admin.TabularInline):
@@ -36,7 +46,16 @@ class CategoryAdmin(TreeAdmin):
     list_filter = ["is_published"]
     inlines = [PropertyInline]
     search_fields = ["parsed_name", "name"]
-    readonly_fields = ["updated_date", "created_date", "parse_url"]
+    readonly_fields = [
+        "updated_date",
+        "created_date",
+        "parse_url",
+        "parse_etag",
+        "parse_last_modified",
+        "parse_content_hash",
+        "price_recalculation_progress",
+    ]
+    raw_id_fields = ["size_property", "mark_property", "length_property"]
     form = movenodeform_factory(Category)
     fieldsets = [
         (
@@ -48,6 +67,7 @@ class CategoryAdmin(TreeAdmin):
                     "description",
                     "weight_coefficient",
                     "price_coefficient",
+                    "price_recalculation_progress",
                     "is_published",
                     "_position",
                     "_ref_node_id",
@@ -63,6 +83,13 @@ class CategoryAdmin(TreeAdmin):
                     "parse_url",
                     "last_parsed_at",
                     "is_parsing_successful",
+                    "size_property",
+                    "mark_property",
+                    "length_property",
+                    "is_mark_parsed",
+                    "parse_etag",
+                    "parse_last_modified",
+                    "parse_content_hash",
                 ],
             },
         ),
@@ -88,6 +115,17 @@ class CategoryAdmin(TreeAdmin):
 
     cat_name.short_description = "Название категории"
 
+    def price_recalculation_progress(self, obj):
+        progress = get_recalculation_progress(obj.id) if obj.id else None
+        if not progress:
+            return "-"
+        status = RECALCULATION_STATUSES.get(progress["status"], progress["status"])
+        if progress["status"] in ("running", "done"):
+            return f"{status}: {progress['done']} из {progress['total']} товаров"
+        return status
+
+    price_recalculation_progress.short_description = "Пересчет цен"
+
 
 class ProductPropertyInline(admin.TabularInline):
     model = ProductPropertyValue
@@ -159,15 +197,30 @@ class ProductAdmin(admin.ModelAdmin):
         "ton_price",
         "unit_price",
         "meter_price",
+        "primary_category",
     ]
+    list_select_related = ["primary_category"]
     # inlines = [ProductCategoriesInline, PropertyValueInline]
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Поиск по поисковому вектору товара вместо icontains по названию,
+        который просматривает всю таблицу. Число ищется и как id, и в
+        названиях ("57" - диаметр трубы)
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        found = search_products(search_term, queryset)
+        if search_term.isdigit():
+            found = queryset.filter(
+                Q(id=search_term) | Q(id__in=found.order_by().values("id"))
+            )
+        return found, False
+
     def cat_price_coefficient(self, obj):
-        main_category = obj.categories.filter(
-            product_categories__is_primary=True
-        ).first()
-        if main_category:
-            return main_category.price_coefficient
+        if obj.primary_category:
+            return obj.primary_category.price_coefficient
         else:
             return "-"
 
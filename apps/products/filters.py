@@ -1,6 +1,8 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
 from apps.products.models import Product, ProductPropertyValue
+from apps.products.services.properties import normalize_property_value
 
 
 class CharInFilter(filters.BaseInFilter, filters.CharFilter):
@@ -8,18 +10,34 @@ class CharInFilter(filters.BaseInFilter, filters.CharFilter):
 
 
 class ProductFilter(filters.FilterSet):
-    # min_price = filters.NumberFilter(field_name="price", lookup_expr="gte")
-    # max_price = filters.NumberFilter(field_name="price", lookup_expr="lte")
+    min_price = filters.NumberFilter(
+        field_name="effective_ton_price", lookup_expr="gte"
+    )
+    max_price = filters.NumberFilter(
+        field_name="effective_ton_price", lookup_expr="lte"
+    )
     gost = filters.CharFilter(method="params_filter")
     diametr = filters.CharFilter(method="params_filter")
     thickness = filters.CharFilter(method="params_filter")
+    ordering = filters.OrderingFilter(
+        fields=(
+            ("effective_ton_price", "price"),
+            ("effective_meter_price", "meter_price"),
+            ("effective_unit_price", "unit_price"),
+            ("name", "name"),
+        )
+    )
 
     class Meta:
         model = Product
-        fields = ("name", "gost", "diametr", "thickness")
+        fields = ("name", "gost", "diametr", "thickness", "min_price", "max_price")
 
     def params_filter(self, queryset, name, value):
+        # Старые фильтры по вхождению строки, для точных значений и диапазонов
+        # используются фасеты ?prop[code]=
         property_values = ProductPropertyValue.objects.filter(
-            property__slug=name, value__icontains=value
+            product=OuterRef("pk"),
+            property__code=name,
+            normalized_value__icontains=normalize_property_value(value),
         )
-        return queryset.filter(properties_through__in=property_values)
+        return queryset.filter(Exists(property_values))
@@ -0,0 +1,99 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models.query import QuerySet
+
+from apps.products.models import Category, Product, ProductCategories
+from apps.products.services.categories import get_subtree_products
+
+
+class Rollback(Exception):
+    pass
+
+
+def get_union_products(category: Category) -> QuerySet:
+    """
+    Прежняя реализация: UNION продуктов по каждой листовой категории
+    """
+    qs = category.products.filter(is_published=True)
+    for leaf_category in category.get_descendants().filter(
+        is_published=True, numchild=0
+    ):
+        qs = qs.union(leaf_category.products.filter(is_published=True))
+    return qs
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнение выборки продуктов родительской категории через UNION "
+        "и через префикс пути на сгенерированных данных (данные откатываются)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100_000)
+        parser.add_argument("--leaves", type=int, default=50)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                category = self.create_fixture(options["products"], options["leaves"])
+                for name, qs in (
+                    ("union", get_union_products(category)),
+                    (
+                        "path",
+                        get_subtree_products(category).order_by("-in_stock", "id"),
+                    ),
+                ):
+                    self.benchmark(name, qs, options["repeat"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_fixture(self, products_count: int, leaves_count: int) -> Category:
+        root = Category.add_root(name="benchmark", is_published=True)
+        leaves = [
+            root.add_child(name=f"benchmark {n}", is_published=True)
+            for n in range(leaves_count)
+        ]
+        products = Product.objects.bulk_create(
+            [
+                Product(
+                    name=f"benchmark {n}",
+                    slug=f"benchmark-{n}",
+                    is_published=True,
+                    in_stock=bool(n % 3),
+                    primary_category=leaves[n % leaves_count],
+                )
+                for n in range(products_count)
+            ],
+            batch_size=5000,
+        )
+        ProductCategories.objects.bulk_create(
+            [
+                ProductCategories(
+                    product=product, category=leaves[n % leaves_count], is_primary=True
+                )
+                for n, product in enumerate(products)
+            ],
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.stdout.write(f"{products_count} продуктов в {leaves_count} категориях")
+        return root
+
+    def benchmark(self, name: str, qs: QuerySet, repeat: int) -> None:
+        timings = []
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            qs.count()
+            list(qs[:20])
+            list(qs[1000:1020])
+            timings.append(time.perf_counter() - started_at)
+        self.stdout.write(
+            f"{name}: мин. {min(timings) * 1000:.1f} мс, "
+            f"сред. {sum(timings) / len(timings) * 1000:.1f} мс "
+            "(count + 2 страницы)"
+        )
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.2 on 2026-10-17 22:58
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def clean_duplicates(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    ProductCategories = apps.get_model("products", "ProductCategories")
+
+    # Пустой URL парсинга у товаров, добавленных вручную, заменяем на NULL
+    Product.objects.filter(parse_url="").update(parse_url=None)
+    # У дублей по URL парсинга оставляем URL только у самого раннего товара
+    duplicates = (
+        Product.objects.exclude(parse_url=None)
+        .values("parse_url")
+        .annotate(first_id=Min("id"), count=Count("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        Product.objects.filter(parse_url=duplicate["parse_url"]).exclude(
+            id=duplicate["first_id"]
+        ).update(parse_url=None)
+
+    # Повторные привязки товара к одной категории: оставляем главную
+    duplicates = (
+        ProductCategories.objects.values("product_id", "category_id")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        links = ProductCategories.objects.filter(
+            product_id=duplicate["product_id"], category_id=duplicate["category_id"]
+        ).order_by("-is_primary", "id")
+        ProductCategories.objects.filter(
+            id__in=[link.id for link in links[1:]]
+        ).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0036_product_custom_meter_price_product_custom_unit_price"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="product",
+            name="parse_url",
+            field=models.URLField(
+                blank=True, max_length=500, null=True, verbose_name="URL парсинга"
+            ),
+        ),
+        migrations.RunPython(clean_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="product",
+            name="parse_url",
+            field=models.URLField(
+                blank=True,
+                max_length=500,
+                null=True,
+                unique=True,
+                verbose_name="URL парсинга",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="productcategories",
+            unique_together={("product", "category")},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-17 23:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0037_product_parse_url_unique"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="productcategories",
+            index=models.Index(
+                fields=["category", "is_primary"], name="product_category_primary_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,168 @@
+# Generated by Django 4.2.2 on 2026-10-17 23:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Настройки парсинга категорий, которые раньше были зашиты в код парсера
+SIZE_CODES = {
+    "vysota-h": [
+        "Балки (Двутавр)",
+        "Балки (Двутавр) низколегированные",
+        "Швеллер",
+        "Швеллер гнутый",
+        "Швеллер низколегированный",
+        "Уголок неравнополочный",
+        "Уголок нержавеющий никельсодержащий",
+        "Уголок равнополочный",
+        "Уголок равнополочный низколегированный",
+        "Уголок равнополочный судостроительный",
+        "Лист г/к",
+        "Лист г/к конструкционный",
+        "Лист г/к мостостроительный",
+        "Лист г/к низколегированный",
+        "Лист г/к Ст3",
+        "Лист г/к судостроительный",
+        "Лист нержавеющий без никеля",
+        "Лист нержавеющий никельсодержащий",
+        "Лист нержавеющий ПВЛ",
+        "Лист оцинкованный",
+        "Лист рифленый",
+        "Лист холоднокатанный х/к",
+        "Лист холоднокатанный х/к Ст",
+        "Лист просечно-вытяжной (ПВЛ)",
+    ],
+    "shirina-b": [
+        "Полоса оцинкованная",
+        "Квадрат  горячекатаный",
+        "Полоса г/к",
+        "Полоса г/к оцинкованная",
+        "Полоса нержавеющая никельсодержащая",
+    ],
+}
+LENGTH_CODES = {
+    "poverkhnost": [
+        "Лист г/к",
+        "Лист г/к конструкционный",
+        "Лист г/к мостостроительный",
+        "Лист г/к низколегированный",
+        "Лист г/к Ст3",
+        "Лист г/к судостроительный",
+        "Лист нержавеющий без никеля",
+        "Лист нержавеющий никельсодержащий",
+        "Лист нержавеющий ПВЛ",
+        "Лист оцинкованный",
+        "Лист рифленый",
+        "Лист холоднокатанный х/к",
+        "Лист холоднокатанный х/к Ст",
+        "Лист просечно-вытяжной (ПВЛ)",
+    ],
+}
+MARK_CODES = {
+    "dlina": [
+        "Лист рифленый",
+    ],
+    "shirina-b": [
+        "Рулоны г/к",
+        "Рулоны нержавеющие",
+        "Рулоны оцинкованные",
+        "Рулоны оцинкованные с полимерным покрытием",
+        "Рулоны х/к",
+    ],
+    "stenka": [
+        "Трубы стальные горячедеформированные",
+        "Трубы стальные холоднодеформированные",
+    ],
+    "profil": [
+        "Профнастил Н114",
+        "Профнастил Н57",
+        "Профнастил Н60",
+        "Профнастил Н75",
+        "Профнастил НС35",
+        "Профнастил НС44",
+        "Профнастил окрашенный",
+        "Профнастил оцинкованный",
+        "Профнастил С10",
+        "Профнастил С20",
+        "Профнастил С21",
+        "Профнастил С44",
+        "Профнастил С8",
+    ],
+}
+MARK_IS_NONE = [
+    "Трубы оцинкованные квадратные",
+    "Трубы оцинкованные круглые",
+    "Трубы оцинкованные прямоугольные",
+    "Доборные элементы",
+    "Саморезы кровельные",
+]
+
+
+def fill_parse_properties(apps, schema_editor):
+    Category = apps.get_model("products", "Category")
+    ProductProperty = apps.get_model("products", "ProductProperty")
+
+    property_ids = dict(ProductProperty.objects.values_list("code", "id"))
+    for field_name, codes in (
+        ("size_property_id", SIZE_CODES),
+        ("length_property_id", LENGTH_CODES),
+        ("mark_property_id", MARK_CODES),
+    ):
+        for code, names in codes.items():
+            if code in property_ids:
+                Category.objects.filter(parsed_name__in=names).update(
+                    **{field_name: property_ids[code]}
+                )
+    Category.objects.filter(parsed_name__in=MARK_IS_NONE).update(is_mark_parsed=False)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0038_productcategories_category_primary_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="is_mark_parsed",
+            field=models.BooleanField(
+                default=True, verbose_name="Сохранять марку при парсинге"
+            ),
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="length_property",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="products.productproperty",
+                verbose_name="Свойство для длины",
+            ),
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="mark_property",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="products.productproperty",
+                verbose_name="Свойство для марки",
+            ),
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="size_property",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="products.productproperty",
+                verbose_name="Свойство для размера",
+            ),
+        ),
+        migrations.RunPython(fill_parse_properties, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.2 on 2026-10-17 23:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0039_category_parse_properties"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="parse_content_hash",
+            field=models.CharField(
+                blank=True, max_length=64, verbose_name="Хэш страницы парсинга"
+            ),
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="parse_etag",
+            field=models.CharField(blank=True, max_length=250, verbose_name="ETag"),
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="parse_last_modified",
+            field=models.CharField(
+                blank=True, max_length=100, verbose_name="Last-Modified"
+            ),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.2 on 2026-10-17 23:10
+
+import re
+from decimal import Decimal
+
+from django.db import migrations, models
+
+NUMERIC_VALUE_REGEX = re.compile(r"^\s*([0-9]{1,16}(?:[.,][0-9]+)?)\s*(?:-|$)")
+
+
+def normalize_property_value(value):
+    value = re.sub(r"\s+", " ", value).strip().lower().replace(",", ".")
+    return re.sub(r"(?<=\d)х(?=\d)", "x", value)
+
+
+def parse_numeric_value(value):
+    match = NUMERIC_VALUE_REGEX.match(value)
+    if match is None:
+        return None
+    return Decimal(match.group(1).replace(",", ".")).quantize(Decimal("0.0001"))
+
+
+def fill_parsed_values(apps, schema_editor):
+    ProductPropertyValue = apps.get_model("products", "ProductPropertyValue")
+
+    batch = []
+    for property_value in ProductPropertyValue.objects.only("id", "value").iterator(
+        chunk_size=2000
+    ):
+        property_value.numeric_value = parse_numeric_value(property_value.value)
+        property_value.normalized_value = normalize_property_value(property_value.value)
+        batch.append(property_value)
+        if len(batch) == 2000:
+            ProductPropertyValue.objects.bulk_update(
+                batch, ["numeric_value", "normalized_value"]
+            )
+            batch = []
+    ProductPropertyValue.objects.bulk_update(
+        batch, ["numeric_value", "normalized_value"]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0040_category_parse_validators"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productpropertyvalue",
+            name="normalized_value",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=250,
+                verbose_name="Нормализованное значение",
+            ),
+        ),
+        migrations.AddField(
+            model_name="productpropertyvalue",
+            name="numeric_value",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=4,
+                editable=False,
+                max_digits=20,
+                null=True,
+                verbose_name="Числовое значение",
+            ),
+        ),
+        migrations.RunPython(fill_parsed_values, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="productpropertyvalue",
+            index=models.Index(
+                fields=["property", "numeric_value"], name="property_numeric_value_idx"
+            ),
+        ),
+    ]
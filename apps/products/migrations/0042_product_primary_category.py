@@ -0,0 +1,59 @@
+# Generated by Django 4.2.2 on 2026-10-17 23:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Min, OuterRef, Subquery
+
+
+def fill_primary_category(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    ProductCategories = apps.get_model("products", "ProductCategories")
+
+    # У товаров с несколькими главными категориями оставляем самую раннюю
+    first_primary_ids = (
+        ProductCategories.objects.filter(is_primary=True)
+        .values("product_id")
+        .annotate(first_id=Min("id"))
+        .values("first_id")
+    )
+    ProductCategories.objects.filter(is_primary=True).exclude(
+        id__in=first_primary_ids
+    ).update(is_primary=False)
+
+    Product.objects.update(
+        primary_category_id=Subquery(
+            ProductCategories.objects.filter(
+                product_id=OuterRef("pk"), is_primary=True
+            ).values("category_id")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0041_property_value_numeric"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="primary_category",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="primary_products",
+                to="products.category",
+                verbose_name="Главная категория",
+            ),
+        ),
+        migrations.RunPython(fill_primary_category, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="productcategories",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("is_primary", True)),
+                fields=("product",),
+                name="product_single_primary_category",
+            ),
+        ),
+    ]
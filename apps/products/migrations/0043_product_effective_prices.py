@@ -0,0 +1,87 @@
+# Generated by Django 4.2.2 on 2026-10-17 23:15
+
+from django.db import migrations, models
+
+FILL_EFFECTIVE_PRICES = """
+UPDATE products_product AS product SET
+    effective_ton_price = CASE
+        WHEN ton_price.value = 0 THEN 0
+        ELSE (FLOOR(ROUND(ton_price.value * coefficient.value) / 100) + 1) * 100
+    END,
+    effective_meter_price = CEIL(
+        CASE
+            WHEN product.custom_meter_price <> 0 THEN product.custom_meter_price
+            ELSE product.meter_price
+        END * coefficient.value
+    ),
+    effective_unit_price = CEIL(
+        CASE
+            WHEN product.custom_unit_price <> 0 THEN product.custom_unit_price
+            ELSE product.unit_price
+        END * coefficient.value
+    )
+FROM products_product AS source
+CROSS JOIN LATERAL (
+    SELECT CASE
+        WHEN source.custom_ton_price <> 0 THEN source.custom_ton_price
+        ELSE source.ton_price
+    END AS value
+) AS ton_price
+CROSS JOIN LATERAL (
+    SELECT COALESCE(
+        (
+            SELECT category.price_coefficient
+            FROM products_category AS category
+            WHERE category.id = source.primary_category_id
+        ),
+        1
+    ) AS value
+) AS coefficient
+WHERE source.id = product.id
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0042_product_primary_category"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="effective_meter_price",
+            field=models.DecimalField(
+                db_index=True,
+                decimal_places=2,
+                default=0.0,
+                editable=False,
+                max_digits=20,
+                verbose_name="Итоговая цена за метр",
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="effective_ton_price",
+            field=models.DecimalField(
+                db_index=True,
+                decimal_places=2,
+                default=0.0,
+                editable=False,
+                max_digits=20,
+                verbose_name="Итоговая цена за тонну",
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="effective_unit_price",
+            field=models.DecimalField(
+                db_index=True,
+                decimal_places=2,
+                default=0.0,
+                editable=False,
+                max_digits=20,
+                verbose_name="Итоговая цена за штуку",
+            ),
+        ),
+        migrations.RunSQL(FILL_EFFECTIVE_PRICES, migrations.RunSQL.noop),
+    ]
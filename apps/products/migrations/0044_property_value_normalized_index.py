@@ -0,0 +1,19 @@
+# Generated by Django 4.2.2 on 2026-10-17 23:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0043_product_effective_prices"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="productpropertyvalue",
+            index=models.Index(
+                fields=["property", "normalized_value"],
+                name="property_normalized_value_idx",
+            ),
+        ),
+    ]
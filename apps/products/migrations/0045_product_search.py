@@ -0,0 +1,93 @@
+# Generated by Django 4.2.2 on 2026-10-17 23:31
+
+import re
+from collections import defaultdict
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+TOKEN_REGEX = re.compile(r"[0-9a-zа-я]+(?:[.\-][0-9a-zа-я]+)*")
+TOKEN_PARTS_REGEX = re.compile(r"(?<=\d)x(?=\d)|-")
+
+
+def tokenize(text):
+    text = text.lower().replace("ё", "е")
+    text = re.sub(r"(?<=\d)\s*[xх*×]\s*(?=\d)", "x", text)
+    text = re.sub(r"(?<=\d),(?=\d)", ".", text)
+    tokens = []
+    for token in TOKEN_REGEX.findall(text):
+        tokens.append(token)
+        tokens.extend(part for part in TOKEN_PARTS_REGEX.split(token) if part)
+    return list(dict.fromkeys(tokens))
+
+
+def fill_search_vectors(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    ProductPropertyValue = apps.get_model("products", "ProductPropertyValue")
+
+    values = defaultdict(list)
+    for product_id, value in ProductPropertyValue.objects.values_list(
+        "product_id", "value"
+    ).iterator(chunk_size=2000):
+        values[product_id].append(value)
+    rows = []
+    for product_id, name in Product.objects.values_list("id", "name").iterator(
+        chunk_size=2000
+    ):
+        lexemes = [(token, "A") for token in tokenize(name)]
+        lexemes.extend((token, "B") for token in tokenize(" ".join(values[product_id])))
+        vector = " ".join(
+            f"'{token}':{position}{weight}"
+            for position, (token, weight) in enumerate(lexemes, start=1)
+        )
+        rows.append((vector, product_id))
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            "UPDATE products_product SET search_vector = %s::tsvector WHERE id = %s",
+            rows,
+        )
+
+
+def create_trigram_index(apps, schema_editor):
+    """
+    pg_trgm ставится, только если расширение есть на сервере БД,
+    без него поиск работает на одном полнотекстовом индексе
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS product_name_trgm_idx "
+            "ON products_product USING gin (name gin_trgm_ops)"
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute("DROP INDEX IF EXISTS product_name_trgm_idx")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0044_property_value_normalized_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="product_search_vector_idx"
+            ),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
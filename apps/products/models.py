@@ -1,10 +1,14 @@
 from functools import partial
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django_extensions.db.models import AutoSlugField
 from slugify import slugify
 from treebeard.mp_tree import MP_Node
 
+SLUGIFY_FUNCTION = partial(slugify, replacements=[["я", "ya"], ["/", ""]])
+
 
 class BaseModel(models.Model):
     created_date = models.DateTimeField(auto_now_add=True)
@@ -25,7 +29,7 @@ class SEOModel(models.Model):
         editable=True,
         blank=False,
         populate_from="name",
-        slugify_function=partial(slugify, replacements=[["я", "ya"], ["/", ""]]),
+        slugify_function=SLUGIFY_FUNCTION,
         max_length=150,
     )
     seo_title = models.CharField(max_length=350, blank=True, verbose_name="SEO Title")
@@ -59,15 +63,59 @@ class Category(BaseModel, SEOModel, MP_Node):
     is_parsing_successful = models.BooleanField(
         verbose_name="Парсинг успешный", default=False
     )
+    # Валидаторы последнего ответа mc.ru и хэш страницы: по ним повторная
+    # загрузка неизменившейся страницы не разбирается и не пишется в БД
+    parse_etag = models.CharField(verbose_name="ETag", max_length=250, blank=True)
+    parse_last_modified = models.CharField(
+        verbose_name="Last-Modified", max_length=100, blank=True
+    )
+    parse_content_hash = models.CharField(
+        verbose_name="Хэш страницы парсинга", max_length=64, blank=True
+    )
     image = models.ImageField(
         verbose_name="Изображение", upload_to="categories/", blank=True
     )
+    # Свойства, в которые парсер записывает столбцы таблицы товаров mc.ru.
+    # Если свойство не задано, используется свойство по умолчанию
+    size_property = models.ForeignKey(
+        "ProductProperty",
+        verbose_name="Свойство для размера",
+        on_delete=models.SET_NULL,
+        related_name="+",
+        blank=True,
+        null=True,
+    )
+    mark_property = models.ForeignKey(
+        "ProductProperty",
+        verbose_name="Свойство для марки",
+        on_delete=models.SET_NULL,
+        related_name="+",
+        blank=True,
+        null=True,
+    )
+    length_property = models.ForeignKey(
+        "ProductProperty",
+        verbose_name="Свойство для длины",
+        on_delete=models.SET_NULL,
+        related_name="+",
+        blank=True,
+        null=True,
+    )
+    is_mark_parsed = models.BooleanField(
+        verbose_name="Сохранять марку при парсинге", default=True
+    )
 
     node_order_by = ["name"]
 
     def __str__(self) -> str:
         return self.name if self.name else self.parsed_name
 
+    def get_ancestor_paths(self) -> list[str]:
+        # Пути предков вычисляются из собственного path без запроса к БД
+        return [
+            self.path[:end] for end in range(self.steplen, len(self.path), self.steplen)
+        ]
+
     class Meta:
         verbose_name = "Категория"
         verbose_name_plural = "Категории"
@@ -105,8 +153,25 @@ class ProductProperty(BaseModel):
 class Product(BaseModel, SEOModel):
     # images
     name = models.CharField(verbose_name="Название продукта", max_length=500)
+    # Заданный заранее slug не перегенерируется при создании, иначе bulk_create
+    # делает запрос на проверку уникальности для каждого товара
+    slug = AutoSlugField(
+        verbose_name="slug",
+        editable=True,
+        blank=False,
+        populate_from="name",
+        slugify_function=SLUGIFY_FUNCTION,
+        overwrite_on_add=False,
+        max_length=150,
+    )
     description = models.TextField(verbose_name="Описание", max_length=2500, blank=True)
-    parse_url = models.URLField(verbose_name="URL парсинга", blank=True, max_length=500)
+    parse_url = models.URLField(
+        verbose_name="URL парсинга",
+        blank=True,
+        null=True,
+        unique=True,
+        max_length=500,
+    )
     unit_price = models.DecimalField(
         verbose_name="Цена за штуку",
         max_digits=20,
@@ -149,12 +214,48 @@ class Product(BaseModel, SEOModel):
         default=0.00,
         help_text="Приоритет отображения цены выше, чем у спаршеной",
     )
+    # Итоговые цены для витрины: своя или спаршенная цена с коэфициентом
+    # главной категории. Пересчитываются в apps.products.services.prices
+    effective_ton_price = models.DecimalField(
+        verbose_name="Итоговая цена за тонну",
+        max_digits=20,
+        decimal_places=2,
+        default=0.00,
+        editable=False,
+        db_index=True,
+    )
+    effective_meter_price = models.DecimalField(
+        verbose_name="Итоговая цена за метр",
+        max_digits=20,
+        decimal_places=2,
+        default=0.00,
+        editable=False,
+        db_index=True,
+    )
+    effective_unit_price = models.DecimalField(
+        verbose_name="Итоговая цена за штуку",
+        max_digits=20,
+        decimal_places=2,
+        default=0.00,
+        editable=False,
+        db_index=True,
+    )
     categories = models.ManyToManyField(
         Category,
         verbose_name="Категории",
         related_name="products",
         through="ProductCategories",
     )
+    # Копия главной категории из ProductCategories (is_primary=True),
+    # поддерживается сигналами и парсером
+    primary_category = models.ForeignKey(
+        Category,
+        verbose_name="Главная категория",
+        on_delete=models.SET_NULL,
+        related_name="primary_products",
+        blank=True,
+        null=True,
+    )
     properties = models.ManyToManyField(
         ProductProperty,
         verbose_name="Свойства",
@@ -162,6 +263,9 @@ class Product(BaseModel, SEOModel):
         through="ProductPropertyValue",
     )
     in_stock = models.BooleanField(verbose_name="В наличии", default=True)
+    # Токены названия и значений свойств для поиска,
+    # заполняются в apps.products.services.search
+    search_vector = SearchVectorField(null=True, editable=False)
     always_in_stock = models.BooleanField(
         verbose_name="Всегда в наличии",
         default=False,
@@ -174,6 +278,9 @@ class Product(BaseModel, SEOModel):
     class Meta:
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
+        indexes = [
+            GinIndex(fields=["search_vector"], name="product_search_vector_idx"),
+        ]
 
 
 class ProductCategories(models.Model):
@@ -188,6 +295,21 @@ class ProductCategories(models.Model):
         verbose_name="Отображать в категории?", default=False
     )
 
+    class Meta:
+        unique_together = ("product", "category")
+        indexes = [
+            models.Index(
+                fields=["category", "is_primary"], name="product_category_primary_idx"
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product"],
+                condition=models.Q(is_primary=True),
+                name="product_single_primary_category",
+            ),
+        ]
+
 
 class ProductPropertyValue(models.Model):
     product = models.ForeignKey(
@@ -197,9 +319,35 @@ class ProductPropertyValue(models.Model):
         ProductProperty, on_delete=models.CASCADE, related_name="values_through"
     )
     value = models.CharField(verbose_name="Значение", max_length=250, blank=True)
+    # Заполняются из value при записи: по ним сортировка, фильтры и фасеты
+    # по свойствам идут по индексу
+    numeric_value = models.DecimalField(
+        verbose_name="Числовое значение",
+        max_digits=20,
+        decimal_places=4,
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    normalized_value = models.CharField(
+        verbose_name="Нормализованное значение",
+        max_length=250,
+        blank=True,
+        editable=False,
+    )
 
     class Meta:
         unique_together = ("product", "property")
+        indexes = [
+            models.Index(
+                fields=["property", "numeric_value"],
+                name="property_numeric_value_idx",
+            ),
+            models.Index(
+                fields=["property", "normalized_value"],
+                name="property_normalized_value_idx",
+            ),
+        ]
         verbose_name = "Значение свойства продукта"
         verbose_name_plural = "Значения свойств продукта"
         ordering = ("property__ordering",)
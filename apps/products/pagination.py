@@ -1,7 +1,21 @@
+import base64
+import binascii
+import hashlib
+import json
 from collections import OrderedDict
 
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
 from rest_framework.pagination import LimitOffsetPagination as _LimitOffsetPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from apps.products.services.cache import PRODUCTS_VERSION, get_cache_versions
 
 
 def get_paginated_response(
@@ -20,16 +34,122 @@ def get_paginated_response(
     return Response(data=serializer.data)
 
 
-class LimitOffsetPagination(_LimitOffsetPagination):
+def estimate_count(queryset) -> int:
+    """
+    Оценка количества строк по статистике планировщика Postgres без
+    выполнения запроса
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class CachedCountMixin:
+    """
+    Количество объектов для пагинации кэшируется по тексту запроса (в нем
+    категория и фильтры) и версиям данных, которые вьюсет отдает методом
+    get_count_version_names. Фильтры по свойствам и цене зависят от значений,
+    которые меняются без версии категории, поэтому количество с фильтрами
+    зависит еще и от версии товаров. Для выборок без фильтров, которые по оценке
+    Postgres больше count_estimate_threshold, отдается оценка. Оценка
+    ошибается в разы, поэтому до count_estimate_threshold *
+    count_estimate_margin количество считается точно
+    """
+
+    count_cache_timeout = 10 * 60
+    count_estimate_threshold = 10_000
+    count_estimate_margin = 2
+    # Параметры навигации и сортировки не меняют количество
+    unfiltered_query_params = ("limit", "offset", "cursor", "pagination", "ordering")
+
+    def get_cached_count(self, queryset, request, view=None) -> tuple[int, bool]:
+        # Список id из движка фильтров знает свое количество
+        if not isinstance(queryset, QuerySet):
+            return len(queryset), False
+        queryset = queryset.order_by()
+        if queryset.query.is_empty():
+            return 0, False
+        version_names = []
+        if hasattr(view, "get_count_version_names"):
+            version_names = view.get_count_version_names()
+        if self.is_filtered(request):
+            version_names = [*version_names, PRODUCTS_VERSION]
+        versions = get_cache_versions(version_names)
+        raw_key = f"{queryset.query}:{versions}"
+        key = "count:" + hashlib.md5(raw_key.encode("utf-8")).hexdigest()
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+        count, is_estimated = None, False
+        if connection.vendor == "postgresql" and not self.is_filtered(request):
+            estimate = estimate_count(queryset)
+            if estimate >= self.count_estimate_threshold * self.count_estimate_margin:
+                count, is_estimated = estimate, True
+        if count is None:
+            count = queryset.count()
+        cache.set(key, (count, is_estimated), self.count_cache_timeout)
+        return count, is_estimated
+
+    def is_filtered(self, request) -> bool:
+        return any(
+            param not in self.unfiltered_query_params for param in request.query_params
+        )
+
+
+class LimitOffsetPagination(CachedCountMixin, _LimitOffsetPagination):
     default_limit = 10
     max_limit = 50
 
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count, self.count_is_estimated = self.get_cached_count(
+            queryset, request, view
+        )
+        self.offset = self.get_offset(request)
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+
+        # По оценке страницы не отсекаем, а о следующей странице узнаем
+        # по лишней строке
+        if not self.count_is_estimated and (
+            self.count == 0 or self.offset > self.count
+        ):
+            return []
+        start, end = self.offset, self.offset + self.limit
+        if not self.count_is_estimated:
+            return list(queryset[start:end])
+        end += 1
+        page = list(queryset[start:end])
+        self.has_next = len(page) > self.limit
+        return page[: self.limit]
+
+    def get_next_link(self):
+        if not self.count_is_estimated:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(
+            url, self.offset_query_param, self.offset + self.limit
+        )
+
     def get_paginated_data(self, data):
         return OrderedDict(
             [
                 ("limit", self.limit),
                 ("offset", self.offset),
                 ("count", self.count),
+                ("count_is_estimated", self.count_is_estimated),
                 ("next", self.get_next_link()),
                 ("previous", self.get_previous_link()),
                 ("results", data),
@@ -47,6 +167,150 @@ class LimitOffsetPagination(_LimitOffsetPagination):
                     ("limit", self.limit),
                     ("offset", self.offset),
                     ("count", self.count),
+                    ("count_is_estimated", self.count_is_estimated),
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+
+class KeysetPagination(CachedCountMixin, BasePagination):
+    """
+    Постраничная навигация по курсору: следующая страница выбирается
+    условием "после последней строки" по полям сортировки queryset, а не
+    OFFSET, поэтому дальние страницы не медленнее первых. К сортировке
+    добавляется id, чтобы позиция была однозначной. NULL в Postgres
+    при сортировке по возрастанию идут последними, по убыванию - первыми,
+    условия курсора это учитывают.
+    Количество считается только для первой страницы (без курсора): на
+    следующих оно уже известно клиенту и отдается как null
+    """
+
+    cursor_query_param = "cursor"
+    limit_query_param = "limit"
+    default_limit = 20
+    max_limit = 50
+    invalid_cursor_message = "Неверный курсор"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.count, self.count_is_estimated = None, False
+        if not request.query_params.get(self.cursor_query_param):
+            self.count, self.count_is_estimated = self.get_cached_count(
+                queryset, request, view
+            )
+        ordering = list(queryset.query.order_by)
+        if not ordering and queryset.query.default_ordering:
+            ordering = list(queryset.model._meta.ordering)
+        if not any(field.lstrip("-") in ("id", "pk") for field in ordering):
+            ordering.append("id")
+        self.ordering = [
+            (field.lstrip("-"), field.startswith("-")) for field in ordering
+        ]
+
+        values, self.is_reverse = self.decode_cursor(request)
+        ordering = self.ordering
+        if self.is_reverse:
+            ordering = [(field, not descending) for field, descending in ordering]
+        queryset = queryset.order_by(
+            *[f"-{field}" if descending else field for field, descending in ordering]
+        )
+        if values is not None:
+            queryset = queryset.filter(
+                self.get_after_condition(queryset.model, ordering, values)
+            )
+
+        page = list(queryset[: self.limit + 1])
+        has_more = len(page) > self.limit
+        page = page[: self.limit]
+        if self.is_reverse:
+            page.reverse()
+        self.has_next = has_more if not self.is_reverse else True
+        self.has_previous = has_more if self.is_reverse else values is not None
+        self.page = page
+        return page
+
+    def get_limit(self, request) -> int:
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.default_limit
+        return min(max(limit, 1), self.max_limit)
+
+    def get_after_condition(self, model, ordering, values) -> Q:
+        """
+        Строки после позиции values в порядке ordering:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q(pk__in=[])
+        equal_prefix = Q()
+        for (field, descending), value in zip(ordering, values):
+            nullable = self.is_nullable(model, field)
+            if value is None:
+                # NULL последний при возрастании и первый при убывании
+                after = Q(**{f"{field}__isnull": False}) if descending else Q(pk__in=[])
+                equal = Q(**{f"{field}__isnull": True})
+            else:
+                after = Q(**{f"{field}__{'lt' if descending else 'gt'}": value})
+                if nullable and not descending:
+                    after |= Q(**{f"{field}__isnull": True})
+                equal = Q(**{field: value})
+            condition |= equal_prefix & after
+            equal_prefix &= equal
+        return condition
+
+    def is_nullable(self, model, field: str) -> bool:
+        # Аннотации (например, значение свойства) считаем допускающими NULL
+        try:
+            return model._meta.get_field(field).null
+        except FieldDoesNotExist:
+            return True
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            values, is_reverse = cursor["v"], bool(cursor.get("r"))
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, is_reverse
+
+    def encode_cursor(self, obj, is_reverse: bool) -> str:
+        values = [getattr(obj, field) for field, _ in self.ordering]
+        cursor = {"v": values}
+        if is_reverse:
+            cursor["r"] = 1
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(cursor, cls=DjangoJSONEncoder).encode("utf-8")
+        ).decode("ascii")
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, encoded
+        )
+
+    def get_next_link(self) -> str | None:
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], is_reverse=False)
+
+    def get_previous_link(self) -> str | None:
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], is_reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("limit", self.limit),
+                    ("count", self.count),
+                    ("count_is_estimated", self.count_is_estimated),
                     ("next", self.get_next_link()),
                     ("previous", self.get_previous_link()),
                     ("results", data),
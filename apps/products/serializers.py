@@ -1,10 +1,11 @@
-import math
-
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
 from apps.products.models import NavigationItem
-from apps.products.services.categories import get_children_categories
+from apps.products.services.categories import (
+    get_category_ancestors,
+    get_children_categories,
+)
 from apps.utils.custom import create_breadcrumbs
 
 
@@ -33,12 +34,92 @@ class SEOMixin(serializers.Serializer):
 
 class ProductFilterSerializer(serializers.Serializer):
     name = serializers.CharField(required=False)
-    # price = serializers.DecimalField(required=False, max_digits=20, decimal_places=2)
+    min_price = serializers.DecimalField(
+        required=False, max_digits=20, decimal_places=2
+    )
+    max_price = serializers.DecimalField(
+        required=False, max_digits=20, decimal_places=2
+    )
+    ordering = serializers.ChoiceField(
+        required=False,
+        choices=[
+            "price",
+            "-price",
+            "meter_price",
+            "-meter_price",
+            "unit_price",
+            "-unit_price",
+            "name",
+            "-name",
+        ],
+    )
     gost = serializers.CharField(required=False)
     diametr = serializers.CharField(required=False)
     thickness = serializers.CharField(required=False)
 
 
+class ProductSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+
+
+class ProductBatchInputSerializer(serializers.Serializer):
+    MAX_ITEMS = 300
+
+    slugs = serializers.ListField(
+        child=serializers.CharField(max_length=255), required=False, default=list
+    )
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, default=list
+    )
+
+    def validate(self, attrs):
+        count = len(attrs["slugs"]) + len(attrs["ids"])
+        if not count:
+            raise serializers.ValidationError("Передайте slugs или ids товаров")
+        if count > self.MAX_ITEMS:
+            raise serializers.ValidationError(
+                f"Не больше {self.MAX_ITEMS} товаров за запрос"
+            )
+        return attrs
+
+
+class ProductBatchOutputSerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    slug = serializers.CharField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    in_stock = serializers.SerializerMethodField(read_only=True)
+    ton_price_with_coef = serializers.IntegerField(
+        source="effective_ton_price", read_only=True
+    )
+    meter_price_with_coef = serializers.IntegerField(
+        source="effective_meter_price", read_only=True
+    )
+    unit_price_with_coef = serializers.IntegerField(
+        source="effective_unit_price", read_only=True
+    )
+
+    def get_in_stock(self, obj) -> bool:
+        return obj.always_in_stock or obj.in_stock
+
+
+class SuggestInputSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    limit = serializers.IntegerField(
+        required=False, min_value=1, max_value=20, default=5
+    )
+
+
+class SuggestItemSerializer(serializers.Serializer):
+    name = serializers.CharField(read_only=True)
+    slug = serializers.CharField(read_only=True)
+
+
+class SuggestOutputSerializer(serializers.Serializer):
+    categories = SuggestItemSerializer(many=True, read_only=True)
+    products = SuggestItemSerializer(many=True, read_only=True)
+    dimensions = serializers.ListField(child=serializers.CharField(), read_only=True)
+
+
 class ProductPropertySerializer(serializers.Serializer):
     id = serializers.ReadOnlyField(source="property.id")
     name = serializers.ReadOnlyField(source="property.name")
@@ -72,34 +153,19 @@ class ProductListOutputSerializer(serializers.Serializer):
     def get_in_stock(self, obj):
         return obj.always_in_stock if obj.always_in_stock else obj.in_stock
 
+    # Итоговые цены с коэфициентом главной категории хранятся в Продукте
     def get_unit_price_with_coef(self, obj):
-        primary_category = obj.categories.filter(
-            product_categories__is_primary=True
-        ).first()
-        unit_price = obj.custom_unit_price or obj.unit_price
-        return math.ceil(unit_price * primary_category.price_coefficient)
+        return int(obj.effective_unit_price)
 
     def get_meter_price_with_coef(self, obj):
-        primary_category = obj.categories.filter(
-            product_categories__is_primary=True
-        ).first()
-        meter_price = obj.custom_meter_price or obj.meter_price
-        return math.ceil(meter_price * primary_category.price_coefficient)
+        return int(obj.effective_meter_price)
 
     def get_ton_price_with_coef(self, obj):
-        primary_category = obj.categories.filter(
-            product_categories__is_primary=True
-        ).first()
-        ton_price = obj.custom_ton_price if obj.custom_ton_price else obj.ton_price
-        if not ton_price:
-            return 0
-        return (round(ton_price * primary_category.price_coefficient) // 100 + 1) * 100
+        return int(obj.effective_ton_price)
 
     @extend_schema_field(ProductPropertySerializer(many=True))
     def get_properties(self, obj):
-        return ProductPropertySerializer(
-            obj.properties_through.filter(property__is_display_in_list=True), many=True
-        ).data
+        return ProductPropertySerializer(obj.display_properties, many=True).data
 
 
 class ProductDetailOutputSerializer(ProductListOutputSerializer, SEOMixin):
@@ -111,21 +177,43 @@ class ProductDetailOutputSerializer(ProductListOutputSerializer, SEOMixin):
     )
 
     def get_category(self, obj):
-        return obj.categories.filter(product_categories__is_primary=True).first().name
+        return obj.primary_category.name
 
     def get_breadcrumbs(self, obj):
-        category = obj.categories.filter(product_categories__is_primary=True).first()
+        category = obj.primary_category
         last_item = {
             "level": category.depth + 1,
             "name": obj.name,
             "href": f"/product/{obj.slug}",
             "disabled": True,
         }
-        breadcrumbs = create_breadcrumbs(category, disable_last=False)
+        breadcrumbs = create_breadcrumbs(
+            category, disable_last=False, ancestors=get_category_ancestors(category)
+        )
         breadcrumbs.append(last_item)
         return breadcrumbs
 
 
+class CategoryFacetValueSerializer(serializers.Serializer):
+    value = serializers.CharField(read_only=True)
+    normalized_value = serializers.CharField(read_only=True)
+    count = serializers.IntegerField(read_only=True)
+
+
+class CategoryFacetSerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    code = serializers.CharField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    units = serializers.CharField(read_only=True)
+    min = serializers.DecimalField(
+        read_only=True, max_digits=20, decimal_places=4, allow_null=True
+    )
+    max = serializers.DecimalField(
+        read_only=True, max_digits=20, decimal_places=4, allow_null=True
+    )
+    values = CategoryFacetValueSerializer(read_only=True, many=True)
+
+
 class CategoryFilterSerializer(serializers.Serializer):
     name = serializers.CharField(required=False)
 
@@ -147,7 +235,7 @@ class CategoryDetailOutputSerializer(CategoryListOutputSerializer, SEOMixin):
     subcategories = serializers.SerializerMethodField()
 
     def get_breadcrumbs(self, obj):
-        breadcrumbs = create_breadcrumbs(obj)
+        breadcrumbs = create_breadcrumbs(obj, ancestors=get_category_ancestors(obj))
         return breadcrumbs
 
     def get_product_properties(self, obj):
@@ -191,6 +279,7 @@ class NavigationDetailOutputSerializer(serializers.Serializer):
 
 
 class CatalogLeftMenuSerializer(serializers.Serializer):
+    # Сериализует дерево из get_category_tree
     id = serializers.IntegerField(read_only=True)
     name = serializers.CharField(read_only=True)
     depth = serializers.IntegerField(read_only=True)
@@ -199,9 +288,8 @@ class CatalogLeftMenuSerializer(serializers.Serializer):
     image = serializers.ImageField(read_only=True, use_url=False)
 
     def get_submenu(self, obj):
-        submenu = get_children_categories(obj.slug)
         return CatalogLeftMenuSerializer(
-            submenu,
+            obj.submenu_items,
             many=True,
             required=False,
         ).data
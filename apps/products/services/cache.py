@@ -0,0 +1,205 @@
+import hashlib
+from collections.abc import Callable, Iterable
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils.cache import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from apps.products.models import Category, Product, ProductCategories
+
+VERSION_KEY_PREFIX = "version"
+RESPONSE_KEY_PREFIX = "response"
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Дерево категорий: меню, корневые и дочерние категории, хлебные крошки
+CATEGORIES_VERSION = "categories"
+# Свойства товаров и их привязка к категориям
+PROPERTIES_VERSION = "properties"
+# Названия и публикация товаров: подсказки поиска
+PRODUCT_NAMES_VERSION = "product-names"
+# Товары, их категории и значения свойств: движок фильтров каталога
+CATALOG_VERSION = "catalog"
+# Любые изменения товаров и значений их свойств: количество товаров
+# с фильтрами и результатов поиска
+PRODUCTS_VERSION = "products"
+
+
+def get_category_version_name(category_id: int) -> str:
+    return f"category:{category_id}"
+
+
+def get_product_version_name(product_id: int) -> str:
+    return f"product:{product_id}"
+
+
+def get_cache_versions(names: list[str]) -> list[int]:
+    """
+    Текущие версии групп закэшированных данных. Версия входит в ключи
+    кэша, поэтому ее увеличение делает все прежние записи группы устаревшими
+    """
+    keys = [f"{VERSION_KEY_PREFIX}:{name}" for name in names]
+    versions = cache.get_many(keys)
+    missing = {key: 1 for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+    return [versions.get(key, 1) for key in keys]
+
+
+def get_cache_version(name: str) -> int:
+    return get_cache_versions([name])[0]
+
+
+def bump_cache_version(*names: str) -> None:
+    for name in names:
+        key = f"{VERSION_KEY_PREFIX}:{name}"
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Ключа нет - версия по умолчанию 1, следующая 2
+            cache.set(key, 2, timeout=None)
+
+
+def bump_cache_version_on_commit(*names: str) -> None:
+    """
+    Увеличивает версии после фиксации транзакции, иначе параллельный
+    запрос успеет закэшировать старые данные под новой версией
+    """
+    transaction.on_commit(lambda: bump_cache_version(*names))
+
+
+def bump_categories_versions(category_ids: Iterable[int]) -> None:
+    bump_cache_version(*map(get_category_version_name, category_ids))
+
+
+def get_affected_category_ids(category: Category) -> list[int]:
+    """
+    Категория, ее предки и потомки: в выдачу родительских категорий
+    попадают товары всех листовых потомков
+    """
+    return list(
+        Category.objects.filter(
+            Q(path__startswith=category.path)
+            | Q(path__in=category.get_ancestor_paths())
+        ).values_list("id", flat=True)
+    )
+
+
+def get_affected_category_ids_by_id(category_ids: Iterable[int]) -> set[int]:
+    """
+    То же для нескольких категорий по id одним запросом. Id уже удаленных
+    категорий возвращаются как есть
+    """
+    category_ids = set(category_ids)
+    if not category_ids:
+        return set()
+    condition = Q(id__in=category_ids)
+    for category in Category.objects.filter(id__in=category_ids).only("path"):
+        condition |= Q(path__startswith=category.path)
+        condition |= Q(path__in=category.get_ancestor_paths())
+    return category_ids | set(
+        Category.objects.filter(condition).values_list("id", flat=True)
+    )
+
+
+def get_affected_category_version_names(category_ids: Iterable[int]) -> list[str]:
+    return [
+        get_category_version_name(category_id)
+        for category_id in get_affected_category_ids_by_id(category_ids)
+    ]
+
+
+def get_product_category_version_names(
+    product_id: int, *category_ids: int
+) -> list[str]:
+    """
+    Версии всех категорий товара (и переданных category_ids) и их веток:
+    товар есть в выдаче и фасетах каждой из них
+    """
+    linked_ids = ProductCategories.objects.filter(product_id=product_id).values_list(
+        "category_id", flat=True
+    )
+    return get_affected_category_version_names({*linked_ids, *category_ids})
+
+
+def get_product_version_names(slug: str) -> list[str] | None:
+    """
+    Карточка товара зависит от самого товара, коэфициента его главной
+    категории, дерева категорий (хлебные крошки) и свойств
+    """
+    product = Product.objects.filter(slug=slug).values("id", "primary_category_id")
+    product = product.first()
+    if product is None:
+        return None
+    return [
+        get_product_version_name(product["id"]),
+        get_category_version_name(product["primary_category_id"]),
+        CATEGORIES_VERSION,
+        PROPERTIES_VERSION,
+    ]
+
+
+def get_response_cache_key(
+    name: str, request, kwargs: dict, versions: list[int]
+) -> str:
+    params = urlencode(
+        sorted(
+            (key, value)
+            for key, values in request.query_params.lists()
+            for value in values
+        )
+    )
+    raw_key = f"{name}:{sorted(kwargs.items())}:{params}:{versions}"
+    return hashlib.md5(raw_key.encode("utf-8")).hexdigest()
+
+
+def cache_response(version_names: list[str] | Callable[..., list[str] | None]):
+    """
+    Кэширует данные ответа метода вьюсета. Ключ строится по вьюсету, методу,
+    параметрам URL, отсортированным параметрам запроса и версиям групп
+    version_names (список или функция от slug и других параметров URL,
+    None - не кэшировать). Хэш ключа отдается как ETag, и на запрос
+    с совпадающим If-None-Match ответ 304 отдается без обращения к данным
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            names = (
+                version_names(**kwargs) if callable(version_names) else version_names
+            )
+            if names is None:
+                return method(view, request, *args, **kwargs)
+
+            key = get_response_cache_key(
+                f"{view.basename}:{method.__name__}",
+                request,
+                kwargs,
+                get_cache_versions(names),
+            )
+            etag = f'"{key}"'
+            if etag in parse_etags(request.headers.get("If-None-Match", "")):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                data = cache.get(f"{RESPONSE_KEY_PREFIX}:{key}")
+                if data is None:
+                    response = method(view, request, *args, **kwargs)
+                    if response.status_code != status.HTTP_200_OK:
+                        return response
+                    cache.set(
+                        f"{RESPONSE_KEY_PREFIX}:{key}",
+                        response.data,
+                        RESPONSE_CACHE_TIMEOUT,
+                    )
+                else:
+                    response = Response(data)
+            response["ETag"] = etag
+            return response
+
+        return wrapper
+
+    return decorator
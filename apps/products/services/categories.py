@@ -1,114 +1,159 @@
-from django.db.models import CharField, F, FloatField, Func, OuterRef, Subquery, Value
-from django.db.models.functions import Cast
+from django.core.cache import cache
+from django.db.models import Exists, F, FilteredRelation, OuterRef, Q
 from django.db.models.query import QuerySet
 from rest_framework.exceptions import NotFound
 
 from apps.products.filters import ProductFilter
-from apps.products.models import Category, Product, ProductPropertyValue
-from apps.utils.custom import get_object_or_None
+from apps.products.models import Category, Product, ProductCategories, ProductProperty
+from apps.products.services.cache import (
+    PROPERTIES_VERSION,
+    RESPONSE_CACHE_TIMEOUT,
+    get_cache_versions,
+    get_category_version_name,
+)
+from apps.products.services.category_tree import get_category_tree_snapshot
+from apps.products.services.facets import FacetFilter, apply_facet_filters, get_facets
+from apps.products.services.products import annotate_product_list
 
 
-def get_category_list() -> QuerySet:
+def get_category_list() -> list[Category]:
     """
-    Возвращает список объектов. Реализована фильтрация.
+    Возвращает список опубликованных категорий
     """
-    qs = Category.objects.filter(is_published=True)
-    return qs
+    snapshot = get_category_tree_snapshot()
+    return [category for category in snapshot.by_path.values() if category.is_published]
 
 
-def get_root_categories() -> QuerySet:
+def get_root_categories() -> list[Category]:
     """
-    Возвращает список объектов. Реализована фильтрация.
+    Возвращает список опубликованных корневых категорий
     """
-    qs = Category.get_root_nodes().filter(is_published=True)
-    return qs
+    return get_category_tree_snapshot().get_roots()
 
 
-def get_children_categories(slug: str) -> QuerySet:
-    category = get_object_or_None(Category, slug=slug)
+def get_category(slug: str) -> Category:
+    category = get_category_tree_snapshot().get_by_slug(slug)
     if category is None:
         raise NotFound(f"Категория slug={slug} не существует")
+    return category
 
-    return category.get_children().filter(is_published=True)
 
+def get_children_categories(slug: str) -> list[Category]:
+    return get_category_tree_snapshot().get_children(get_category(slug))
 
-def get_category_product_list(slug: str, filters: dict = None) -> QuerySet:
+
+def get_category_tree() -> list[Category]:
+    """
+    Дерево опубликованных категорий для меню каталога из снимка дерева:
+    дети каждой категории лежат в атрибуте submenu_items
+    """
+    return get_category_tree_snapshot().menu
+
+
+def get_category_ancestors(category: Category) -> list[Category]:
+    """
+    Предки категории по префиксам ее path из снимка дерева. Если снимок
+    еще не знает о предке, предки запрашиваются из БД
+    """
+    ancestors = get_category_tree_snapshot().get_ancestors(category)
+    if ancestors is None:
+        return list(category.get_ancestors())
+    return ancestors
+
+
+def get_category_products(category: Category) -> QuerySet:
+    """
+    Опубликованные товары категории, для родительской категории - товары
+    ее листовых потомков
+    """
+    if not get_category_tree_snapshot().is_leaf(category):
+        return get_subtree_products(category)
+    return category.products.filter(is_published=True)
+
+
+def get_sort_property(category: Category) -> ProductProperty | None:
+    """
+    Свойство, по значению которого сортируются товары листовой категории
+    """
+    return category.product_properties.exclude(
+        code__in=[
+            "gost",
+            "marka-stali",
+            "poverkhnost",
+            "occvet",
+            "ves-metra",
+            "ves-shtuki",
+            "tolshina-stenki",
+        ]
+    ).first()
+
+
+def get_category_product_list(
+    slug: str, filters: dict = None, facet_filters: dict[str, FacetFilter] = None
+) -> QuerySet:
     filters = filters or {}
 
-    category = get_object_or_None(Category, slug=slug)
-    if category is None:
-        raise NotFound(f"Категория slug={slug} не существует")
+    category = get_category(slug)
+    qs = apply_facet_filters(
+        get_category_products(category), category, facet_filters or {}
+    )
 
-    qs = category.products.filter(is_published=True)
-    # Если категория является родительской - сформируем список продуктов
-    # из дочерних категорий
-    if not category.is_leaf():
-        leafs_categories = category.get_descendants().filter(
-            is_published=True, numchild=0
-        )
-        for leaf_category in leafs_categories:
-            qs = qs.union(leaf_category.products.filter(is_published=True))
+    # Товары родительской категории сортируются по наличию, листовой -
+    # по значению первого свойства категории
+    if not get_category_tree_snapshot().is_leaf(category):
+        qs = qs.order_by("-in_stock", "id")
     else:
-        first_property = category.product_properties.exclude(
-            code__in=[
-                "gost",
-                "marka-stali",
-                "poverkhnost",
-                "occvet",
-                "ves-metra",
-                "ves-shtuki",
-                "tolshina-stenki",
-            ]
-        ).first()
+        first_property = get_sort_property(category)
         if first_property:
+            # Значение свойства присоединяется по уникальному (product, property),
+            # а сортировка идет по заранее разобранному числовому значению
             qs = qs.annotate(
-                property_value=Cast(
-                    Subquery(
-                        ProductPropertyValue.objects.filter(
-                            property_id=first_property.id, product_id=OuterRef("pk")
-                        ).values(
-                            property_value=Func(
-                                F("value"),
-                                Value(","),
-                                Value("."),
-                                function="REPLACE",
-                                output_field=CharField(),
-                            )
-                        )[
-                            :1
-                        ]
-                    ),
-                    output_field=FloatField(),
+                first_property_value=FilteredRelation(
+                    "properties_through",
+                    condition=Q(properties_through__property_id=first_property.id),
                 ),
-                # Если нужно рассчитать цены на лету
-                # meter_weight=Cast(
-                #     Subquery(
-                #         ProductPropertyValue.objects.filter(
-                #             property__code="ves-metra", product_id=OuterRef("pk")
-                #         ).values(
-                #             property_value=Func(
-                #                 F("value"),
-                #                 Value(","),
-                #                 Value("."),
-                #                 function="REPLACE",
-                #                 output_field=CharField(),
-                #             )
-                #         )[
-                #             :1
-                #         ]
-                #     ),
-                #     output_field=FloatField(),
-                # ),
-                # dlina=Cast(
-                #     Subquery(
-                #         ProductPropertyValue.objects.filter(
-                #             property__code="dlina", product_id=OuterRef("pk")
-                #         ).values(property_value=F("value"))[:1]
-                #     ),
-                #     output_field=CharField(),
-                # ),
+                property_value=F("first_property_value__numeric_value"),
             ).order_by("-in_stock", "property_value")
-    return ProductFilter(filters, qs).qs
+    qs = ProductFilter(filters, qs).qs
+    # id в конце сортировки делает порядок однозначным: страницы
+    # не теряют и не повторяют товары с одинаковыми ценой или значением
+    if "id" not in qs.query.order_by:
+        qs = qs.order_by(*qs.query.order_by, "id")
+    return annotate_product_list(qs)
+
+
+def get_category_facets(slug: str) -> list[dict]:
+    """
+    Фасеты категории для фильтров. Кэшируются до изменения товаров
+    и значений их свойств в ветке категории или свойств
+    """
+    category = get_category(slug)
+    versions = get_cache_versions(
+        [get_category_version_name(category.id), PROPERTIES_VERSION]
+    )
+    key = f"facets:{category.id}:{versions}"
+    facets = cache.get(key)
+    if facets is None:
+        facets = get_facets(category, get_category_products(category))
+        cache.set(key, facets, RESPONSE_CACHE_TIMEOUT)
+    return facets
+
+
+def get_subtree_products(category: Category) -> QuerySet:
+    """
+    Опубликованные продукты категории и ее опубликованных листовых потомков.
+    Потомки выбираются одним запросом по префиксу пути treebeard,
+    продукт попадает в выборку один раз независимо от числа категорий.
+    """
+    categories = Q(category=category) | Q(
+        category__path__startswith=category.path,
+        category__is_published=True,
+        category__numchild=0,
+    )
+    return Product.objects.filter(
+        Exists(ProductCategories.objects.filter(categories, product=OuterRef("pk"))),
+        is_published=True,
+    )
 
 
 def add_category_products_properties(category: Category) -> None:
@@ -117,9 +162,7 @@ def add_category_products_properties(category: Category) -> None:
     категории, если она является главной для этих продуктов
     """
 
-    products = Product.objects.filter(
-        product_categories__category=category, product_categories__is_primary=True
-    )
+    products = Product.objects.filter(primary_category=category)
     if products is None:
         return
     for product in products:
@@ -0,0 +1,121 @@
+import time
+
+from apps.products.models import Category
+from apps.products.services.cache import CATEGORIES_VERSION, get_cache_version
+
+# Как часто процесс сверяет версию дерева в кэше, секунды
+SNAPSHOT_CHECK_INTERVAL = 1
+# Снимок перечитывается и без смены версии, например если он был загружен
+# в транзакции, которую потом откатили
+SNAPSHOT_MAX_AGE = 5 * 60
+
+_snapshot = None
+_checked_at = 0.0
+
+
+class CategoryTreeSnapshot:
+    """
+    Снимок всего дерева категорий в памяти процесса. Категории загружаются
+    одним запросом, после загрузки снимок и его объекты не изменяются
+    """
+
+    def __init__(self, categories: list[Category], version: int):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.by_slug = {category.slug: category for category in categories}
+        self.by_path = {category.path: category for category in categories}
+        self.roots = []
+        self.children = {category.path: [] for category in categories}
+        for category in sorted(categories, key=lambda category: category.path):
+            if category.depth == 1:
+                self.roots.append(category)
+            elif category.path[: -Category.steplen] in self.children:
+                self.children[category.path[: -Category.steplen]].append(category)
+        self.menu = self._build_menu()
+
+    def _build_menu(self) -> list[Category]:
+        """
+        Дерево опубликованных категорий для меню: дети каждой категории
+        лежат в атрибуте submenu_items, ветки неопубликованных категорий
+        в меню не попадают
+        """
+
+        def fill_submenu(category):
+            category.submenu_items = self.get_children(category)
+            for child in category.submenu_items:
+                fill_submenu(child)
+            return category
+
+        roots = [fill_submenu(category) for category in self.get_roots()]
+        return sorted(roots, key=lambda category: category.ordering)
+
+    def get_by_slug(self, slug: str) -> Category | None:
+        return self.by_slug.get(slug)
+
+    def get_roots(self, only_published: bool = True) -> list[Category]:
+        return [
+            category
+            for category in self.roots
+            if category.is_published or not only_published
+        ]
+
+    def get_children(
+        self, category: Category, only_published: bool = True
+    ) -> list[Category]:
+        return [
+            child
+            for child in self.children.get(category.path, [])
+            if child.is_published or not only_published
+        ]
+
+    def get_ancestors(self, category: Category) -> list[Category] | None:
+        """
+        Предки по префиксам path. None, если снимок не знает о каком-то предке
+        """
+        ancestors = [self.by_path.get(path) for path in category.get_ancestor_paths()]
+        return None if None in ancestors else ancestors
+
+    def get_descendants(self, category: Category) -> list[Category]:
+        return [
+            descendant
+            for path, descendant in self.by_path.items()
+            if path.startswith(category.path) and path != category.path
+        ]
+
+    def is_leaf(self, category: Category) -> bool:
+        return not self.children.get(category.path)
+
+
+def get_category_tree_snapshot() -> CategoryTreeSnapshot:
+    """
+    Снимок дерева категорий процесса. Не чаще раза в SNAPSHOT_CHECK_INTERVAL
+    сверяет версию дерева в кэше и перечитывает категории, если версия
+    сменилась - так изменение в админке доходит до всех воркеров
+    """
+    global _snapshot, _checked_at
+
+    snapshot, now = _snapshot, time.monotonic()
+    if snapshot is not None and now - _checked_at < SNAPSHOT_CHECK_INTERVAL:
+        return snapshot
+
+    version = get_cache_version(CATEGORIES_VERSION)
+    _checked_at = now
+    if (
+        snapshot is None
+        or snapshot.version != version
+        or now - snapshot.loaded_at > SNAPSHOT_MAX_AGE
+    ):
+        snapshot = CategoryTreeSnapshot(
+            list(Category.objects.order_by("path")), version
+        )
+        _snapshot = snapshot
+    return snapshot
+
+
+def reset_category_tree_snapshot() -> None:
+    """
+    Сбрасывает снимок текущего процесса, чтобы процесс, изменивший
+    категорию, сразу видел изменения
+    """
+    global _snapshot
+    _snapshot = None
@@ -0,0 +1,279 @@
+import asyncio
+import queue
+import threading
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+import httpx
+from django.conf import settings
+from loguru import logger
+
+# Как часто загрузка проверяет, не остановил ли ее потребитель, секунды
+STOP_CHECK_INTERVAL = 0.05
+# Ответы, после которых запрос повторяется
+RETRY_STATUS_CODES = {httpx.codes.TOO_MANY_REQUESTS}
+# Верхняя граница паузы из заголовка Retry-After, секунды
+MAX_RETRY_AFTER = 60
+
+
+@dataclass
+class CrawlRequest:
+    key: int
+    url: str
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class CrawledPage:
+    key: int
+    url: str
+    status_code: int | None = None
+    text: str = ""
+    headers: dict[str, str] = field(default_factory=dict)
+    error: str | None = None
+
+    @property
+    def is_not_modified(self) -> bool:
+        return self.status_code == httpx.codes.NOT_MODIFIED
+
+
+@dataclass
+class CrawlStats:
+    pages: int = 0
+    not_modified: int = 0
+    errors: int = 0
+    bytes: int = 0
+    started_at: float = 0.0
+    finished_at: float = 0.0
+
+    @property
+    def elapsed(self) -> float:
+        finished_at = self.finished_at or time.monotonic()
+        return max(finished_at - self.started_at, 0.0)
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.pages / self.elapsed if self.elapsed else 0.0
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты запросов: не больше `rate` запросов в секунду
+    с допустимой "пачкой" в `burst` запросов
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Crawler:
+    """
+    Асинхронный краулер страниц с общим пулом соединений, ограничением числа
+    одновременных запросов и ограничением частоты запросов к каждому хосту.
+
+    Загрузка идет в отдельном потоке, а `crawl()` отдает страницы в порядке
+    запросов по мере готовности, поэтому разбор и запись в БД выполняются
+    параллельно с загрузкой. Если потребитель перестал читать страницы,
+    незавершенные запросы отменяются.
+    """
+
+    def __init__(
+        self,
+        *,
+        concurrency: int | None = None,
+        rate_limit: float | None = None,
+        rate_burst: int | None = None,
+        timeout: float | None = None,
+        retries: int | None = None,
+        backoff: float = 1.0,
+        headers: dict[str, str] | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self.concurrency = concurrency or settings.PARSER_CONCURRENCY
+        self.rate_limit = rate_limit or settings.PARSER_RATE_LIMIT
+        self.rate_burst = rate_burst or settings.PARSER_RATE_BURST
+        self.timeout = timeout or settings.PARSER_TIMEOUT
+        self.retries = settings.PARSER_RETRIES if retries is None else retries
+        # Пауза перед повтором: backoff * 2 ** номер попытки, секунды
+        self.backoff = backoff
+        self.headers = headers or {}
+        self.transport = transport
+        self.stats = CrawlStats()
+        self._buckets: dict[str, TokenBucket] = {}
+
+    def crawl(self, requests: list[CrawlRequest]) -> Iterator[CrawledPage]:
+        pages: queue.Queue = queue.Queue(maxsize=self.concurrency * 2)
+        stop = threading.Event()
+        finished = object()
+
+        def put(item) -> None:
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=STOP_CHECK_INTERVAL)
+                    return
+                except queue.Full:
+                    continue
+
+        def run() -> None:
+            try:
+                asyncio.run(self._crawl(requests, put, stop))
+            except Exception as e:
+                logger.exception("Краулер завершился с ошибкой: {}", e)
+            finally:
+                put(finished)
+
+        thread = threading.Thread(target=run, name="crawler", daemon=True)
+        self.stats = CrawlStats(started_at=time.monotonic())
+        thread.start()
+        # Страницы, загруженные раньше предыдущих по порядку запросов
+        buffered: dict[int, CrawledPage] = {}
+        next_index = 0
+        try:
+            while True:
+                item = pages.get()
+                if item is finished:
+                    break
+                index, page = item
+                buffered[index] = page
+                while next_index in buffered:
+                    yield buffered.pop(next_index)
+                    next_index += 1
+            for index in sorted(buffered):
+                yield buffered[index]
+        finally:
+            stop.set()
+            thread.join()
+            self.stats.finished_at = time.monotonic()
+
+    async def _crawl(self, requests: list[CrawlRequest], put, stop) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self._buckets = {}
+        limits = httpx.Limits(
+            max_connections=self.concurrency,
+            max_keepalive_connections=self.concurrency,
+        )
+        async with httpx.AsyncClient(
+            headers=self.headers,
+            limits=limits,
+            timeout=self.timeout,
+            follow_redirects=True,
+            transport=self.transport,
+        ) as client:
+
+            async def worker(index: int, request: CrawlRequest) -> None:
+                if stop.is_set():
+                    return
+                async with semaphore:
+                    if stop.is_set():
+                        return
+                    page = await self._fetch(client, request, stop)
+                if page is not None:
+                    await asyncio.to_thread(put, (index, page))
+
+            tasks = [
+                asyncio.create_task(worker(index, request))
+                for index, request in enumerate(requests)
+            ]
+            watcher = asyncio.create_task(self._cancel_on_stop(tasks, stop))
+            try:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            finally:
+                watcher.cancel()
+
+    @staticmethod
+    async def _cancel_on_stop(tasks: list[asyncio.Task], stop) -> None:
+        while not stop.is_set():
+            await asyncio.sleep(STOP_CHECK_INTERVAL)
+        for task in tasks:
+            task.cancel()
+
+    async def _fetch(
+        self, client: httpx.AsyncClient, request: CrawlRequest, stop
+    ) -> CrawledPage | None:
+        """
+        Загружает страницу с повторами при сетевых ошибках, ответах 5xx и 429.
+        None, если загрузку остановили
+        """
+        bucket = self._get_bucket(request.url)
+        error = None
+        for attempt in range(self.retries + 1):
+            await bucket.acquire()
+            if stop.is_set():
+                return None
+            delay = self.backoff * 2**attempt
+            try:
+                response = await client.get(request.url, headers=request.headers)
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                if not self._is_retryable(response) or attempt == self.retries:
+                    return self._make_page(request, response)
+                error = f"HTTP {response.status_code}"
+                delay = max(delay, self._get_retry_after(response))
+            logger.warning(
+                "Ошибка загрузки {} (попытка {}): {}", request.url, attempt + 1, error
+            )
+            await asyncio.sleep(delay)
+
+        self.stats.errors += 1
+        return CrawledPage(key=request.key, url=request.url, error=error)
+
+    @staticmethod
+    def _is_retryable(response: httpx.Response) -> bool:
+        return response.is_server_error or response.status_code in RETRY_STATUS_CODES
+
+    @staticmethod
+    def _get_retry_after(response: httpx.Response) -> float:
+        """
+        Пауза из заголовка Retry-After в секундах, дата в нем не поддерживается
+        """
+        try:
+            retry_after = float(response.headers.get("retry-after", 0))
+        except ValueError:
+            return 0.0
+        return min(max(retry_after, 0.0), MAX_RETRY_AFTER)
+
+    def _make_page(
+        self, request: CrawlRequest, response: httpx.Response
+    ) -> CrawledPage:
+        page = CrawledPage(
+            key=request.key,
+            url=request.url,
+            status_code=response.status_code,
+            text=response.text,
+            headers=dict(response.headers),
+        )
+        if response.is_error:
+            page.error = f"HTTP {response.status_code}"
+            self.stats.errors += 1
+        elif page.is_not_modified:
+            self.stats.not_modified += 1
+        else:
+            self.stats.pages += 1
+            self.stats.bytes += len(response.content)
+        return page
+
+    def _get_bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate_limit, self.rate_burst)
+        return self._buckets[host]
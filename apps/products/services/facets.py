@@ -0,0 +1,144 @@
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, Exists, Min, OuterRef, QuerySet
+from rest_framework.exceptions import ValidationError
+
+from apps.products.models import Category, ProductPropertyValue
+from apps.products.services.properties import normalize_property_value
+
+FACET_PARAM_REGEX = re.compile(r"^prop\[(?P<code>[\w-]+)\](?:\[(?P<bound>min|max)\])?$")
+
+
+@dataclass
+class FacetFilter:
+    """
+    Фильтр по одному свойству: точные значения (любое из) по нормализованному
+    значению и/или диапазон по числовому
+    """
+
+    values: list[str] = field(default_factory=list)
+    min: Decimal | None = None
+    max: Decimal | None = None
+
+
+def parse_facet_params(query_params) -> dict[str, FacetFilter]:
+    """
+    Разбирает параметры ?prop[code]=value (можно несколько раз),
+    ?prop[code][min]= и ?prop[code][max]=
+    """
+    facet_filters = {}
+    for key, values in query_params.lists():
+        match = FACET_PARAM_REGEX.match(key)
+        if match is None:
+            continue
+        facet_filter = facet_filters.setdefault(match["code"], FacetFilter())
+        if match["bound"] is None:
+            facet_filter.values.extend(
+                normalize_property_value(value) for value in values if value.strip()
+            )
+            continue
+        try:
+            bound = Decimal(values[-1].replace(",", "."))
+        except InvalidOperation:
+            raise ValidationError({key: "Ожидается число"})
+        setattr(facet_filter, match["bound"], bound)
+    return facet_filters
+
+
+def get_facet_properties(category: Category) -> QuerySet:
+    """
+    Свойства, по которым фильтруется и считаются фасеты категории
+    """
+    return category.product_properties.filter(is_display_in_list=True)
+
+
+def get_facet_property_ids(category: Category, codes) -> dict[str, int]:
+    """
+    id свойств по кодам из фильтров. Код свойства, по которому категория
+    не фильтруется, - ошибка запроса
+    """
+    properties = dict(
+        get_facet_properties(category).filter(code__in=codes).values_list("code", "id")
+    )
+    unknown_codes = set(codes) - set(properties)
+    if unknown_codes:
+        raise ValidationError(
+            {
+                f"prop[{code}]": "Фильтр по свойству недоступен в категории"
+                for code in sorted(unknown_codes)
+            }
+        )
+    return properties
+
+
+def apply_facet_filters(
+    products: QuerySet, category: Category, facet_filters: dict[str, FacetFilter]
+) -> QuerySet:
+    """
+    Каждое свойство фильтруется своим EXISTS по индексам
+    (property, normalized_value) и (property, numeric_value)
+    """
+    if not facet_filters:
+        return products
+
+    properties = get_facet_property_ids(category, facet_filters)
+    for code, facet_filter in facet_filters.items():
+        values = ProductPropertyValue.objects.filter(
+            product=OuterRef("pk"), property_id=properties[code]
+        )
+        if facet_filter.values:
+            values = values.filter(normalized_value__in=facet_filter.values)
+        if facet_filter.min is not None:
+            values = values.filter(numeric_value__gte=facet_filter.min)
+        if facet_filter.max is not None:
+            values = values.filter(numeric_value__lte=facet_filter.max)
+        products = products.filter(Exists(values))
+    return products
+
+
+def get_facets(category: Category, products: QuerySet) -> list[dict]:
+    """
+    Значения свойств категории с количеством товаров, а также минимум
+    и максимум числовых значений. Считается одним запросом с группировкой
+    по (свойство, нормализованное значение)
+    """
+    properties = list(get_facet_properties(category).order_by("ordering", "id"))
+    facets = {
+        property.id: {
+            "id": property.id,
+            "code": property.code,
+            "name": property.name,
+            "units": property.units,
+            "min": None,
+            "max": None,
+            "values": [],
+        }
+        for property in properties
+    }
+    rows = (
+        ProductPropertyValue.objects.filter(
+            property_id__in=facets, product__in=products.order_by().values("id")
+        )
+        .exclude(normalized_value="")
+        .values("property_id", "normalized_value")
+        .annotate(label=Min("value"), number=Min("numeric_value"), count=Count("id"))
+        .order_by("property_id", "number", "normalized_value")
+    )
+    for row in rows:
+        facet = facets[row["property_id"]]
+        facet["values"].append(
+            {
+                "value": row["label"],
+                "normalized_value": row["normalized_value"],
+                "count": row["count"],
+            }
+        )
+        number = row["number"]
+        if number is not None:
+            if facet["min"] is None or number < facet["min"]:
+                facet["min"] = number
+            if facet["max"] is None or number > facet["max"]:
+                facet["max"] = number
+    return list(facets.values())
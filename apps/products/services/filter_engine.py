@@ -0,0 +1,472 @@
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Iterable, Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Q, QuerySet
+from loguru import logger
+
+from apps.products.models import (
+    Category,
+    Product,
+    ProductCategories,
+    ProductPropertyValue,
+)
+from apps.products.services.cache import (
+    CATALOG_VERSION,
+    VERSION_KEY_PREFIX,
+    get_cache_version,
+)
+from apps.products.services.categories import get_category, get_sort_property
+from apps.products.services.category_tree import get_category_tree_snapshot
+from apps.products.services.facets import FacetFilter, get_facet_property_ids
+from apps.products.services.products import annotate_product_list
+
+# Как часто процесс сверяет версию каталога в кэше, секунды
+ENGINE_CHECK_INTERVAL = 1
+# Изменения каталога по версиям для догрузки движком, секунды
+CHANGES_TIMEOUT = 60 * 60
+CHANGES_KEY = "catalog-changes:{}"
+# Больше версий за раз - движок перестраивается целиком
+MAX_INCREMENTAL_VERSIONS = 100
+# Доля устаревших порядковых номеров, после которой движок перестраивается
+MAX_RETIRED_SHARE = 0.2
+# Результат меньше этой доли каталога сортируется сам, больший -
+# выбирается из заранее отсортированного массива
+PRESORTED_SHARE = 0.05
+
+_engine = None
+_checked_at = 0.0
+_rebuild_lock = threading.Lock()
+_apply_lock = threading.Lock()
+_dirty = threading.local()
+
+
+class CatalogFilterEngine:
+    """
+    Товары каталога в памяти процесса для фильтрации страниц категорий.
+    Каждому опубликованному товару присвоен порядковый номер, категории и
+    значения свойств хранят множества номеров своих товаров, поэтому фильтр
+    - это пересечение множеств.
+    При догрузке изменений товар получает новый номер, а старый попадает
+    в retired: уже выданные множества не изменяются, только заменяются.
+    Опубликованный движок не изменяется: изменения догружаются в его копию,
+    которая заменяет его одним присваиванием, поэтому запросы других потоков
+    не видят наполовину догруженного состояния
+    """
+
+    def __init__(self, version: int):
+        self.version = version
+        self.ids: list[int] = []
+        self.ordinals: dict[int, int] = {}
+        self.retired: frozenset[int] = frozenset()
+        self.in_stock: frozenset[int] = frozenset()
+        self.categories: dict[int, frozenset[int]] = {}
+        # property_id -> нормализованное значение -> номера товаров
+        self.values: dict[int, dict[str, frozenset[int]]] = defaultdict(dict)
+        # property_id -> нормализованное значение -> числовое значение
+        self.numbers: dict[int, dict[str, float]] = defaultdict(dict)
+        self._subtrees = {}
+        self._orders = {}
+
+    def load(self, products: QuerySet) -> None:
+        """
+        Добавляет опубликованные товары из products с новыми номерами
+        """
+        in_stock, retired = set(), set()
+        for product_id, is_in_stock in products.filter(is_published=True).values_list(
+            "id", "in_stock"
+        ):
+            if product_id in self.ordinals:
+                retired.add(self.ordinals[product_id])
+            self.ordinals[product_id] = len(self.ids)
+            self.ids.append(product_id)
+            if is_in_stock:
+                in_stock.add(self.ordinals[product_id])
+        loaded = products.filter(is_published=True).values("id")
+
+        # Товар, опубликованный между запросами, догрузится со своей версией
+        categories = defaultdict(set)
+        for product_id, category_id in ProductCategories.objects.filter(
+            product__in=loaded
+        ).values_list("product_id", "category_id"):
+            if product_id in self.ordinals:
+                categories[category_id].add(self.ordinals[product_id])
+
+        values = defaultdict(lambda: defaultdict(set))
+        numbers = defaultdict(dict)
+        for (
+            product_id,
+            property_id,
+            value,
+            number,
+        ) in ProductPropertyValue.objects.filter(product__in=loaded).values_list(
+            "product_id", "property_id", "normalized_value", "numeric_value"
+        ):
+            if product_id not in self.ordinals:
+                continue
+            values[property_id][value].add(self.ordinals[product_id])
+            if number is not None:
+                numbers[property_id][value] = float(number)
+
+        # Множества и словари значений заменяются новыми объектами, а не
+        # дополняются: копия движка делит их с исходным
+        for category_id, ordinals in categories.items():
+            self.categories[category_id] = self.categories.get(
+                category_id, frozenset()
+            ).union(ordinals)
+        for property_id, property_values in values.items():
+            current = dict(self.values.get(property_id, {}))
+            for value, ordinals in property_values.items():
+                current[value] = current.get(value, frozenset()).union(ordinals)
+            self.values[property_id] = current
+        for property_id, property_numbers in numbers.items():
+            self.numbers[property_id] = {
+                **self.numbers.get(property_id, {}),
+                **property_numbers,
+            }
+        self.in_stock = self.in_stock.union(in_stock)
+        self.retired = self.retired.union(retired)
+        self._subtrees, self._orders = {}, {}
+
+    def copy(self, version: int) -> "CatalogFilterEngine":
+        """
+        Копия для догрузки изменений. Множества номеров неизменяемые и
+        делятся с исходным движком, копируются только контейнеры
+        """
+        engine = CatalogFilterEngine(version)
+        engine.ids = list(self.ids)
+        engine.ordinals = dict(self.ordinals)
+        engine.retired, engine.in_stock = self.retired, self.in_stock
+        engine.categories = dict(self.categories)
+        engine.values = defaultdict(dict, self.values)
+        engine.numbers = defaultdict(dict, self.numbers)
+        return engine
+
+    def apply_changes(
+        self, product_ids: Iterable[int], category_ids: Iterable[int], version: int
+    ) -> "CatalogFilterEngine":
+        """
+        Новый движок версии version, в котором перечитаны измененные товары
+        и товары измененных категорий
+        """
+        engine = self.copy(version)
+        engine.reload(product_ids, category_ids)
+        return engine
+
+    def reload(self, product_ids: Iterable[int], category_ids: Iterable[int]):
+        """
+        Перечитывает товары на месте - только в еще не опубликованной копии
+        """
+        product_ids, category_ids = set(product_ids), set(category_ids)
+        products = Product.objects.filter(
+            Q(id__in=product_ids)
+            | Q(
+                id__in=ProductCategories.objects.filter(
+                    category_id__in=category_ids
+                ).values("product_id")
+            )
+        )
+        # Снятые с публикации и удаленные товары не перечитываются
+        self.retired = self.retired.union(
+            self.ordinals.pop(product_id)
+            for product_id in product_ids
+            if product_id in self.ordinals
+        )
+        self.load(products)
+
+    @property
+    def is_fragmented(self) -> bool:
+        return len(self.retired) > len(self.ids) * MAX_RETIRED_SHARE
+
+    def get_category_ordinals(self, category: Category) -> frozenset[int]:
+        """
+        Товары категории, для родительской - товары ее опубликованных
+        листовых потомков, как в get_subtree_products
+        """
+        snapshot = get_category_tree_snapshot()
+        if snapshot.is_leaf(category):
+            return self.categories.get(category.id, frozenset())
+        key = (category.id, snapshot.version)
+        if key not in self._subtrees:
+            categories = [category.id] + [
+                descendant.id
+                for descendant in snapshot.get_descendants(category)
+                if descendant.is_published and snapshot.is_leaf(descendant)
+            ]
+            self._subtrees[key] = frozenset().union(
+                *(self.categories.get(category_id, ()) for category_id in categories)
+            )
+        return self._subtrees[key]
+
+    def get_property_ordinals(
+        self, property_id: int, facet_filter: FacetFilter
+    ) -> frozenset[int]:
+        values = self.values.get(property_id, {})
+        ordinals = None
+        if facet_filter.values:
+            ordinals = frozenset().union(
+                *(values.get(value, ()) for value in facet_filter.values)
+            )
+        if facet_filter.min is not None or facet_filter.max is not None:
+            low = float("-inf") if facet_filter.min is None else float(facet_filter.min)
+            high = float("inf") if facet_filter.max is None else float(facet_filter.max)
+            in_range = frozenset().union(
+                *(
+                    values[value]
+                    for value, number in self.numbers.get(property_id, {}).items()
+                    if low <= number <= high and value in values
+                )
+            )
+            ordinals = in_range if ordinals is None else ordinals & in_range
+        if ordinals is None:
+            # Без значений и границ - любое значение свойства
+            ordinals = frozenset().union(*values.values())
+        return ordinals
+
+    def get_sort_key(self, by_stock: bool, sort_property_id: int | None):
+        """
+        Ключ сортировки номера как в get_category_product_list: в наличии
+        раньше, затем по числовому значению свойства (без значения -
+        в конце), затем по id
+        """
+        in_stock, ids = self.in_stock, self.ids
+        if not by_stock:
+            return ids.__getitem__
+        if sort_property_id is None:
+            return lambda ordinal: (ordinal not in in_stock, ids[ordinal])
+
+        numbers = {}
+        property_numbers = self.numbers.get(sort_property_id, {})
+        for value, ordinals in self.values.get(sort_property_id, {}).items():
+            if value in property_numbers:
+                numbers.update(dict.fromkeys(ordinals, property_numbers[value]))
+        return lambda ordinal: (
+            ordinal not in in_stock,
+            ordinal not in numbers,
+            numbers.get(ordinal, 0),
+            ids[ordinal],
+        )
+
+    def get_presorted(self, by_stock: bool, sort_property_id: int | None) -> list[int]:
+        key = (by_stock, sort_property_id)
+        if key not in self._orders:
+            ordinals = set(range(len(self.ids))) - self.retired
+            self._orders[key] = sorted(ordinals, key=self.get_sort_key(*key))
+        return self._orders[key]
+
+    def filter(
+        self,
+        category: Category,
+        property_filters: dict[int, FacetFilter],
+        by_stock: bool,
+        sort_property_id: int | None,
+    ) -> list[int]:
+        """
+        id товаров категории, прошедших фильтры, в порядке вывода
+        """
+        sets = [self.get_category_ordinals(category)]
+        sets.extend(
+            self.get_property_ordinals(property_id, facet_filter)
+            for property_id, facet_filter in property_filters.items()
+        )
+        sets.sort(key=len)
+        result = sets[0].intersection(*sets[1:]) - self.retired
+        if len(result) < len(self.ids) * PRESORTED_SHARE:
+            ordered = sorted(result, key=self.get_sort_key(by_stock, sort_property_id))
+        else:
+            ordered = [
+                ordinal
+                for ordinal in self.get_presorted(by_stock, sort_property_id)
+                if ordinal in result
+            ]
+        return [self.ids[ordinal] for ordinal in ordered]
+
+
+class ProductIdList(Sequence):
+    """
+    Отфильтрованные движком id товаров. Срез загружает товары страницы
+    одним запросом, len - количество без запроса
+    """
+
+    def __init__(self, ids: list[int]):
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.get_products(self.ids[index])
+        return self.get_products([self.ids[index]])[0]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    @staticmethod
+    def get_products(ids: list[int]) -> list[Product]:
+        products = annotate_product_list(Product.objects.filter(id__in=ids))
+        products = {product.id: product for product in products}
+        return [products[id] for id in ids if id in products]
+
+
+def build_filter_engine(version: int) -> CatalogFilterEngine:
+    engine = CatalogFilterEngine(version)
+    engine.load(Product.objects.all())
+    return engine
+
+
+def rebuild_filter_engine() -> None:
+    """
+    Строит движок заново. Пока он строится, страницы фильтруются в SQL
+    """
+    global _engine
+
+    if not _rebuild_lock.acquire(blocking=False):
+        return
+    try:
+        version = get_cache_version(CATALOG_VERSION)
+        _engine = build_filter_engine(version)
+        logger.info("Движок фильтров каталога построен: {} товаров", len(_engine.ids))
+    except Exception:
+        logger.exception("Не удалось построить движок фильтров каталога")
+    finally:
+        _rebuild_lock.release()
+
+
+def start_rebuild() -> None:
+    if _rebuild_lock.locked():
+        return
+
+    def run():
+        try:
+            rebuild_filter_engine()
+        finally:
+            # Соединение с БД этого потока больше не понадобится
+            connections.close_all()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def get_filter_engine() -> CatalogFilterEngine | None:
+    """
+    Движок фильтров процесса, если он включен и не отстает от каталога.
+    Не чаще раза в ENGINE_CHECK_INTERVAL сверяет версию каталога и
+    догружает изменения; если их не догрузить, перестраивается в фоне,
+    а до тех пор возвращает None
+    """
+    global _engine, _checked_at
+
+    if not settings.CATALOG_FILTER_ENGINE:
+        return None
+    engine, now = _engine, time.monotonic()
+    if engine is None:
+        start_rebuild()
+        return None
+    if now - _checked_at < ENGINE_CHECK_INTERVAL:
+        return engine
+
+    version = get_cache_version(CATALOG_VERSION)
+    _checked_at = now
+    if engine.version == version:
+        return engine
+    if version - engine.version > MAX_INCREMENTAL_VERSIONS or engine.is_fragmented:
+        start_rebuild()
+        return None
+
+    versions = range(engine.version + 1, version + 1)
+    changes = cache.get_many([CHANGES_KEY.format(version) for version in versions])
+    if len(changes) < len(versions):
+        # Изменения устарели или еще не записаны
+        start_rebuild()
+        return None
+    with _apply_lock:
+        engine = _engine
+        if engine is not None and engine.version < version:
+            product_ids, category_ids = set(), set()
+            for changed_products, changed_categories in changes.values():
+                product_ids.update(changed_products)
+                category_ids.update(changed_categories)
+            engine = engine.apply_changes(product_ids, category_ids, version)
+            _engine = engine
+    return engine
+
+
+def reset_filter_engine() -> None:
+    global _engine
+    _engine = None
+
+
+def record_catalog_changes(
+    product_ids: Iterable[int] = (), category_ids: Iterable[int] = ()
+) -> None:
+    """
+    Увеличивает версию каталога и сохраняет, какие товары и категории
+    изменились, чтобы движки процессов догрузили только их
+    """
+    if not settings.CATALOG_FILTER_ENGINE:
+        return
+    key = f"{VERSION_KEY_PREFIX}:{CATALOG_VERSION}"
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        version = 2
+        cache.set(key, version, timeout=None)
+    cache.set(
+        CHANGES_KEY.format(version),
+        (sorted(product_ids), sorted(category_ids)),
+        CHANGES_TIMEOUT,
+    )
+
+
+def mark_catalog_changed(product_ids: Iterable[int]) -> None:
+    """
+    Копит измененные в транзакции товары и записывает их одной версией
+    после фиксации
+    """
+    if not settings.CATALOG_FILTER_ENGINE:
+        return
+    if not hasattr(_dirty, "product_ids"):
+        _dirty.product_ids = set()
+    _dirty.product_ids.update(product_ids)
+    transaction.on_commit(flush_catalog_changes)
+
+
+def flush_catalog_changes() -> None:
+    product_ids = getattr(_dirty, "product_ids", set())
+    _dirty.product_ids = set()
+    if product_ids:
+        record_catalog_changes(product_ids=product_ids)
+
+
+def filter_category_products(
+    slug: str, filters: dict, facet_filters: dict[str, FacetFilter]
+) -> ProductIdList | None:
+    """
+    Товары категории из движка фильтров. None, если движок выключен,
+    отстает или запрос содержит фильтры, которых он не умеет (цена,
+    название, сортировка) - тогда товары выбираются SQL
+    """
+    if filters:
+        return None
+    engine = get_filter_engine()
+    if engine is None:
+        return None
+
+    category = get_category(slug)
+    property_ids = get_facet_property_ids(category, facet_filters)
+    property_filters = {
+        property_ids[code]: facet_filter for code, facet_filter in facet_filters.items()
+    }
+    # Сортировка как в get_category_product_list
+    by_stock, sort_property_id = True, None
+    if get_category_tree_snapshot().is_leaf(category):
+        sort_property = get_sort_property(category)
+        by_stock = sort_property is not None
+        sort_property_id = sort_property.id if sort_property else None
+    return ProductIdList(
+        engine.filter(category, property_filters, by_stock, sort_property_id)
+    )
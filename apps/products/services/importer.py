@@ -0,0 +1,343 @@
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from apps.products.models import (
+    SLUGIFY_FUNCTION,
+    Category,
+    Product,
+    ProductCategories,
+    ProductPropertyValue,
+)
+from apps.products.services.prices import recalculate_prices
+from apps.products.services.properties import (
+    fill_parsed_values,
+    get_category_property_mapping,
+)
+from apps.products.services.search import update_search_vectors
+
+BATCH_SIZE = 500
+
+
+@dataclass
+class ParsedProduct:
+    in_stock: bool
+    name: str
+    parse_url: str
+    size: str
+    mark: str
+    length: str
+    idt: str
+    idf: str
+    idb: str
+    price: float
+    weight: str = ""
+    # Название как на странице (без capitalize), по нему отбираются
+    # уникальные товары категории
+    source_name: str = ""
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    disappeared: int = 0
+    values_changed: int = 0
+    # Изменившиеся существующие товары и их главные категории: товары
+    # сопоставляются по parse_url во всем каталоге, поэтому среди них есть
+    # товары других категорий
+    product_ids: set[int] = field(default_factory=set)
+    category_ids: set[int] = field(default_factory=set)
+
+
+def normalize_product_name(name: str) -> str:
+    name = re.sub(r"\s+", " ", name).strip().lower()
+    return re.sub(r"(?<=\d)х(?=\d)", "x", name)
+
+
+@dataclass
+class ProductIndex:
+    """
+    Индекс товаров категории по parse_url и по нормализованному названию
+    """
+
+    by_parse_url: dict[str, int] = field(default_factory=dict)
+    by_name: dict[str, int] = field(default_factory=dict)
+    parse_urls: dict[int, str | None] = field(default_factory=dict)
+
+    @classmethod
+    def for_category(cls, category: Category) -> "ProductIndex":
+        index = cls()
+        for product_id, parse_url, name in Product.objects.filter(
+            primary_category=category
+        ).values_list("id", "parse_url", "name"):
+            index.parse_urls[product_id] = parse_url
+            if parse_url:
+                index.by_parse_url[parse_url] = product_id
+            index.by_name.setdefault(normalize_product_name(name), product_id)
+        return index
+
+    def match(self, product: ParsedProduct) -> int | None:
+        product_id = self.by_parse_url.get(product.parse_url)
+        if product_id is None:
+            product_id = self.by_name.get(normalize_product_name(product.name))
+        return product_id
+
+
+def _make_unique_slugs(names: list[str]) -> list[str]:
+    """
+    Формирует уникальные slug для новых товаров так же, как AutoSlugField,
+    но одним запросом на всю пачку
+    """
+    max_length = Product._meta.get_field("slug").max_length
+    slugs = [SLUGIFY_FUNCTION(name)[:max_length].strip("-") for name in names]
+    taken = set(Product.objects.filter(slug__in=slugs).values_list("slug", flat=True))
+    unique_slugs = []
+    for slug in slugs:
+        unique_slug, index = slug, 2
+        while unique_slug in taken:
+            suffix = f"-{index}"
+            unique_slug = slug[: max_length - len(suffix)] + suffix
+            index += 1
+        taken.add(unique_slug)
+        unique_slugs.append(unique_slug)
+    return unique_slugs
+
+
+def _to_price(price: float) -> Decimal:
+    return Decimal(str(price)).quantize(Decimal("0.01"))
+
+
+def _get_changed_fields(product: Product, parsed_product: ParsedProduct) -> tuple:
+    """
+    Изменяет товар по данным парсинга и возвращает список изменившихся полей
+    """
+    changed_fields = []
+    if product.parse_url != parsed_product.parse_url:
+        product.parse_url = parsed_product.parse_url
+        changed_fields.append("parse_url")
+    ton_price = _to_price(parsed_product.price)
+    if product.ton_price != ton_price:
+        product.ton_price = ton_price
+        changed_fields.append("ton_price")
+    if product.in_stock != parsed_product.in_stock:
+        product.in_stock = parsed_product.in_stock
+        changed_fields.append("in_stock")
+    return tuple(changed_fields)
+
+
+def save_category_products(
+    category: Category,
+    parsed_products: list[ParsedProduct],
+    property_ids: dict[str, int] | None = None,
+) -> ImportResult:
+    """
+    Сверяет спаршенные товары категории с БД и записывает только изменения:
+    новые товары создаются, у существующих обновляются только изменившиеся поля
+    и значения свойств. Число запросов не зависит от количества товаров.
+    """
+    result = ImportResult()
+    parsed_products = list(
+        {product.parse_url: product for product in parsed_products}.values()
+    )
+    parse_urls = {product.parse_url for product in parsed_products}
+    mapping = get_category_property_mapping(category, property_ids)
+    product_fields = ["id", "parse_url", "ton_price", "in_stock", "primary_category_id"]
+
+    with transaction.atomic():
+        products = {
+            product.parse_url: product
+            for product in Product.objects.filter(parse_url__in=parse_urls).only(
+                *product_fields
+            )
+        }
+        # Товары категории, у которых на mc.ru сменился URL, находим по названию
+        # и переносим на новый URL, чтобы не создавать дубли
+        index = ProductIndex.for_category(category)
+        moved_products: dict[int, str] = {}
+        for product in parsed_products:
+            if product.parse_url in products:
+                continue
+            product_id = index.match(product)
+            if (
+                product_id is not None
+                and product_id not in moved_products
+                and index.parse_urls[product_id] not in parse_urls
+            ):
+                moved_products[product_id] = product.parse_url
+        for product in Product.objects.filter(id__in=moved_products).only(
+            *product_fields
+        ):
+            products[moved_products[product.id]] = product
+
+        # Изменившиеся товары группируются по набору изменившихся полей, чтобы
+        # в UPDATE попадали только они
+        changed_products: dict[tuple, list[Product]] = defaultdict(list)
+        new_products = []
+        now = timezone.now()
+        for parsed_product in parsed_products:
+            product = products.get(parsed_product.parse_url)
+            if product is None:
+                new_products.append(parsed_product)
+                continue
+            changed_fields = _get_changed_fields(product, parsed_product)
+            if changed_fields:
+                product.updated_date = now
+                changed_products[changed_fields].append(product)
+            else:
+                result.unchanged += 1
+        for changed_fields, group in changed_products.items():
+            Product.objects.bulk_update(
+                group, [*changed_fields, "updated_date"], batch_size=BATCH_SIZE
+            )
+            result.updated += len(group)
+
+        slugs = _make_unique_slugs([product.name for product in new_products])
+        created_products = Product.objects.bulk_create(
+            [
+                Product(
+                    name=product.name,
+                    slug=slug,
+                    parse_url=product.parse_url,
+                    ton_price=_to_price(product.price),
+                    in_stock=product.in_stock,
+                    is_published=True,
+                    primary_category=category,
+                )
+                for product, slug in zip(new_products, slugs)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        products.update((product.parse_url, product) for product in created_products)
+        result.created = len(created_products)
+
+        # Категория становится главной для товаров без главной категории,
+        # у остальных товаров главная категория не меняется
+        orphan_ids = [
+            product.id
+            for product in products.values()
+            if product.primary_category_id is None
+        ]
+        Product.objects.filter(id__in=orphan_ids).update(primary_category=category)
+        for product in products.values():
+            product.primary_category_id = product.primary_category_id or category.id
+        updated_products = [
+            product for group in changed_products.values() for product in group
+        ]
+        updated_products.extend(
+            product for product in products.values() if product.id in orphan_ids
+        )
+
+        product_ids = [product.id for product in products.values()]
+        linked_ids = set(
+            ProductCategories.objects.filter(
+                category=category, product_id__in=product_ids
+            ).values_list("product_id", flat=True)
+        )
+        ProductCategories.objects.bulk_create(
+            [
+                ProductCategories(
+                    product_id=product.id,
+                    category=category,
+                    is_primary=product.primary_category_id == category.id,
+                    is_display=True,
+                )
+                for product in products.values()
+                if product.id not in linked_ids
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+        # Значения свойств: создаются недостающие и обновляются изменившиеся
+        values = {}
+        for parsed_product in parsed_products:
+            product_id = products[parsed_product.parse_url].id
+            for property_id, value in mapping.get_values(
+                parsed_product.size, parsed_product.mark, parsed_product.length
+            ):
+                values[product_id, property_id] = value
+        current_values = {
+            (product_id, property_id): (value_id, value)
+            for value_id, product_id, property_id, value in (
+                ProductPropertyValue.objects.filter(
+                    product_id__in=product_ids, property_id__in=mapping.property_ids
+                ).values_list("id", "product_id", "property_id", "value")
+            )
+        }
+        new_values, changed_values = [], []
+        for (product_id, property_id), value in values.items():
+            current = current_values.get((product_id, property_id))
+            if current is None:
+                new_values.append(
+                    fill_parsed_values(
+                        ProductPropertyValue(
+                            product_id=product_id, property_id=property_id, value=value
+                        )
+                    )
+                )
+            elif current[1] != value:
+                changed_values.append(
+                    fill_parsed_values(
+                        ProductPropertyValue(
+                            id=current[0],
+                            product_id=product_id,
+                            property_id=property_id,
+                            value=value,
+                        )
+                    )
+                )
+        ProductPropertyValue.objects.bulk_create(new_values, batch_size=BATCH_SIZE)
+        ProductPropertyValue.objects.bulk_update(
+            changed_values,
+            ["value", "numeric_value", "normalized_value"],
+            batch_size=BATCH_SIZE,
+        )
+        result.values_changed = len(new_values) + len(changed_values)
+        created_ids = {product.id for product in created_products}
+        changed_value_ids = {
+            value.product_id for value in (*new_values, *changed_values)
+        }
+        updated_products.extend(
+            product
+            for product in products.values()
+            if product.id in changed_value_ids and product.id not in created_ids
+        )
+
+        # Убираем отметку "В наличии" у продуктов, которые отсутствовали в
+        # результатах парсинга
+        disappeared_ids = list(
+            Product.objects.filter(primary_category=category, in_stock=True)
+            .exclude(parse_url__in=parse_urls)
+            .values_list("id", flat=True)
+        )
+        result.disappeared = Product.objects.filter(id__in=disappeared_ids).update(
+            in_stock=False
+        )
+        result.product_ids.update(disappeared_ids)
+        result.product_ids.update(product.id for product in updated_products)
+        result.category_ids.update(
+            product.primary_category_id for product in updated_products
+        )
+        if disappeared_ids:
+            result.category_ids.add(category.id)
+
+        # Цены пересчитываются только у товаров, у которых изменилась цена за
+        # тонну, значения свойств или главная категория
+        recalculate_ids = set(created_ids)
+        recalculate_ids.update(orphan_ids)
+        for changed_fields, group in changed_products.items():
+            if "ton_price" in changed_fields:
+                recalculate_ids.update(product.id for product in group)
+        recalculate_ids.update(changed_value_ids)
+        recalculate_prices(recalculate_ids)
+
+        # Поисковый вектор собирается из названия и значений свойств
+        update_search_vectors(created_ids | changed_value_ids)
+
+    return result
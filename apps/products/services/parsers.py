@@ -0,0 +1,268 @@
+import io
+import re
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+from django.conf import settings
+from loguru import logger
+from lxml import etree
+
+from apps.products.services.importer import ParsedProduct
+
+HOST = "https://mc.ru"
+PRODUCT_ITEMTYPE = "http://schema.org/Product"
+
+
+@dataclass
+class ParsedPage:
+    is_check_human: bool = False
+    is_empty: bool = False
+    title: str = ""
+    description: str = ""
+    h1: str = ""
+    products: list[ParsedProduct] = field(default_factory=list)
+
+
+def _normalize_name(name: str) -> str:
+    name = re.sub(r"\s+", " ", name)
+    return re.sub(r"(?<=\d)х(?=\d)", "x", name)
+
+
+def _make_product(
+    *,
+    name: str,
+    href: str,
+    size: str,
+    mark: str,
+    length: str,
+    price: float,
+    in_stock: bool,
+    idt: str,
+    idf: str,
+    idb: str,
+) -> ParsedProduct:
+    name = _normalize_name(name)
+    return ParsedProduct(
+        name=name.capitalize(),
+        source_name=name,
+        price=price,
+        in_stock=in_stock,
+        parse_url=HOST + href,
+        length=length,
+        mark=mark,
+        size=size,
+        idt=idt,
+        idf=idf,
+        idb=idb,
+    )
+
+
+def _parse_price(content: str | None) -> float:
+    try:
+        return float(content.strip())
+    except (AttributeError, ValueError):
+        logger.info("Цена отсутствует: {}", content)
+        return 0.0
+
+
+class CategoryPageParser(ABC):
+    """
+    Разбор страницы PageAll категории mc.ru: метаданные страницы и строки
+    таблицы товаров
+    """
+
+    @abstractmethod
+    def parse(self, html: str) -> ParsedPage:
+        pass
+
+
+class BS4CategoryPageParser(CategoryPageParser):
+    """
+    Эталонная реализация на BeautifulSoup: строит дерево всего документа
+    """
+
+    def parse(self, html: str) -> ParsedPage:
+        soup = BeautifulSoup(html, "html.parser")
+        page = ParsedPage(
+            is_check_human=soup.find("form", action="/check-human") is not None,
+            is_empty=soup.find("div", class_="catalogItems _empty") is not None,
+        )
+        if page.is_check_human or page.is_empty:
+            return page
+
+        if title := soup.find("title"):
+            page.title = title.text.strip()
+        if description := soup.find("meta", attrs={"name": "description"}):
+            page.description = description.get("content", "").strip()
+        if h1 := soup.find("h1"):
+            page.h1 = h1.text.strip()
+
+        for product in soup.find_all("tr", itemtype=PRODUCT_ITEMTYPE):
+            page.products.append(
+                _make_product(
+                    name=product["data-nm"],
+                    href=product.find("a")["href"],
+                    size=product.find("td", class_="_razmer").text.strip(),
+                    mark=product.find("td", class_="_mark").text.strip(),
+                    length=product.find("td", class_="_dlina").text.strip(),
+                    price=self._get_price(product),
+                    in_stock=self._is_in_stock(product),
+                    idt=product["idt"],
+                    idf=product["idf"],
+                    idb=product["idb"],
+                )
+            )
+        return page
+
+    def _is_in_stock(self, product: Tag) -> bool:
+        # определяем, в наличии ли товар (трубка или корзинка)
+        button_tag = product.find("button")
+        class_value = button_tag.get("class") if button_tag else None
+        if not class_value:
+            logger.error(
+                "Не удалось определить наличие у товара: {}", product["data-nm"]
+            )
+            return False
+
+        return "_basket" in class_value
+
+    def _get_price(self, product: Tag) -> float:
+        meta = product.find("meta", itemprop="price")
+        return _parse_price(meta.get("content") if meta else None)
+
+
+class LxmlCategoryPageParser(CategoryPageParser):
+    """
+    Потоковый разбор на lxml.iterparse: строки товаров разбираются по мере
+    чтения документа и сразу удаляются из дерева, поэтому целиком документ
+    в памяти не строится
+    """
+
+    tags = ("title", "meta", "h1", "form", "div", "tr")
+
+    def parse(self, html: str) -> ParsedPage:
+        page = ParsedPage()
+        for _event, element in self._iterparse(html):
+            tag = element.tag
+            if tag == "tr":
+                if element.get("itemtype") == PRODUCT_ITEMTYPE:
+                    page.products.append(self._parse_product(element))
+                    self._release(element)
+            elif tag == "form":
+                if element.get("action") == "/check-human":
+                    page.is_check_human = True
+            elif tag == "div":
+                if " ".join(element.get("class", "").split()) == "catalogItems _empty":
+                    page.is_empty = True
+            elif tag == "title":
+                if not page.title:
+                    page.title = self._text(element)
+            elif tag == "h1":
+                if not page.h1:
+                    page.h1 = self._text(element)
+            elif tag == "meta":
+                if element.get("name") == "description" and not page.description:
+                    page.description = element.get("content", "").strip()
+
+        if page.is_check_human or page.is_empty:
+            return ParsedPage(
+                is_check_human=page.is_check_human, is_empty=page.is_empty
+            )
+        return page
+
+    def _iterparse(self, html: str) -> Iterator:
+        return etree.iterparse(
+            io.BytesIO(html.encode("utf-8")),
+            events=("end",),
+            tag=self.tags,
+            html=True,
+            encoding="utf-8",
+            remove_comments=True,
+        )
+
+    def _parse_product(self, row) -> ParsedProduct:
+        cells = {}
+        button = link = price = None
+        for element in row.iter("td", "a", "button", "meta"):
+            tag = element.tag
+            if tag == "td":
+                for class_name in element.get("class", "").split():
+                    cells.setdefault(class_name, element)
+            elif tag == "a" and link is None:
+                link = element
+            elif tag == "button" and button is None:
+                button = element
+            elif tag == "meta" and price is None:
+                if element.get("itemprop") == "price":
+                    price = element
+
+        return _make_product(
+            name=row.get("data-nm"),
+            href=link.get("href"),
+            size=self._text(cells["_razmer"]),
+            mark=self._text(cells["_mark"]),
+            length=self._text(cells["_dlina"]),
+            price=_parse_price(price.get("content") if price is not None else None),
+            in_stock=self._is_in_stock(row, button),
+            idt=row.get("idt"),
+            idf=row.get("idf"),
+            idb=row.get("idb"),
+        )
+
+    def _is_in_stock(self, row, button) -> bool:
+        class_value = button.get("class", "").split() if button is not None else None
+        if not class_value:
+            logger.error(
+                "Не удалось определить наличие у товара: {}", row.get("data-nm")
+            )
+            return False
+
+        return "_basket" in class_value
+
+    @staticmethod
+    def _text(element) -> str:
+        return "".join(element.itertext()).strip()
+
+    @staticmethod
+    def _release(element) -> None:
+        # Освобождаем разобранную строку и уже пройденные соседние элементы
+        element.clear()
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
+
+
+PARSERS: dict[str, type[CategoryPageParser]] = {
+    "bs4": BS4CategoryPageParser,
+    "lxml": LxmlCategoryPageParser,
+}
+
+
+def get_category_page_parser(backend: str | None = None) -> CategoryPageParser:
+    return PARSERS[backend or settings.PARSER_BACKEND]()
+
+
+def get_unique_products(
+    products: Iterable[ParsedProduct],
+) -> dict[str, ParsedProduct]:
+    """
+    Оставляет по одному товару на название: в наличии и с меньшей ценой.
+    Названия сравниваются в том виде, в каком они на странице, до capitalize
+    """
+    parsed_products: dict[str, ParsedProduct] = {}
+    for parsed_product in products:
+        name = parsed_product.source_name or parsed_product.name
+        existing_product = parsed_products.get(name)
+        # TODO: проверить не нулевая ли цена
+        if existing_product is None:
+            parsed_products[name] = parsed_product
+        elif parsed_product.price < existing_product.price and parsed_product.in_stock:
+            parsed_products[name] = parsed_product
+        elif not existing_product.in_stock and parsed_product.in_stock:
+            parsed_products[name] = parsed_product
+
+    return parsed_products
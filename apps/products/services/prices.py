@@ -0,0 +1,172 @@
+import threading
+from collections.abc import Iterable
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, QuerySet, Subquery, Value, When
+from django.db.models.functions import Ceil, Coalesce, Floor, Round
+from django.db.models.lookups import Exact, GreaterThan
+
+from apps.products.models import Category, Product, ProductPropertyValue
+
+METER_WEIGHT_CODE = "ves-metra"
+LENGTH_CODE = "dlina"
+RECALCULATION_CHUNK_SIZE = 2000
+RECALCULATION_PROGRESS_KEY = "category-prices-progress:{}"
+
+_dirty = threading.local()
+
+
+def _get_property_number(code: str) -> Subquery:
+    # Для длины-диапазона "6000-12000" числовое значение - начало диапазона
+    return Subquery(
+        ProductPropertyValue.objects.filter(
+            product=OuterRef("pk"), property__code=code
+        ).values("numeric_value")[:1]
+    )
+
+
+def _get_ton_price():
+    return Case(
+        When(~Q(custom_ton_price=0), then=F("custom_ton_price")),
+        default=F("ton_price"),
+    )
+
+
+def _get_effective_prices(meter_price, unit_price) -> dict:
+    """
+    Итоговые цены для витрины: своя цена или спаршенная, умноженная на
+    коэфициент главной категории. Цена за тонну округляется вверх до сотен
+    """
+    coefficient = Coalesce(
+        Subquery(
+            Category.objects.filter(pk=OuterRef("primary_category_id")).values(
+                "price_coefficient"
+            )[:1]
+        ),
+        Value(Decimal(1)),
+    )
+    ton_price = _get_ton_price()
+    return {
+        "effective_ton_price": Case(
+            When(Exact(ton_price, 0), then=Value(Decimal(0))),
+            default=(Floor(Round(ton_price * coefficient) / 100) + 1) * 100,
+        ),
+        "effective_meter_price": Ceil(
+            Case(
+                When(~Q(custom_meter_price=0), then=F("custom_meter_price")),
+                default=meter_price,
+            )
+            * coefficient
+        ),
+        "effective_unit_price": Ceil(
+            Case(
+                When(~Q(custom_unit_price=0), then=F("custom_unit_price")),
+                default=unit_price,
+            )
+            * coefficient
+        ),
+    }
+
+
+def recalculate_prices(product_ids: Iterable[int]) -> int:
+    """
+    Пересчитывает цены группы Продуктов одним UPDATE: цены за метр и за штуку
+    по цене за тонну (своей или спаршенной) и числовым значениям веса метра
+    и длины, затем итоговые цены с коэфициентом главной категории.
+    Цена за метр считается, если известны цена за тонну и вес метра,
+    цена за штуку - если дополнительно известна длина.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+
+    ton_price = _get_ton_price()
+    meter_weight = _get_property_number(METER_WEIGHT_CODE)
+    length = _get_property_number(LENGTH_CODE)
+    has_meter_price = GreaterThan(ton_price, 0) & GreaterThan(meter_weight, 0)
+    new_meter_price = Ceil(ton_price / 1000 * meter_weight)
+    meter_price = Case(
+        When(has_meter_price, then=new_meter_price), default="meter_price"
+    )
+    unit_price = Case(
+        When(
+            has_meter_price & GreaterThan(length, 0),
+            then=Ceil(new_meter_price * length / 1000),
+        ),
+        default="unit_price",
+    )
+
+    return Product.objects.filter(id__in=product_ids).update(
+        meter_price=meter_price,
+        unit_price=unit_price,
+        **_get_effective_prices(meter_price, unit_price),
+    )
+
+
+def recalculate_effective_prices(products: QuerySet) -> int:
+    """
+    Пересчитывает только итоговые цены, например после изменения коэфициента
+    цены категории
+    """
+    return products.update(**_get_effective_prices(F("meter_price"), F("unit_price")))
+
+
+def recalculate_category_prices(
+    category: Category, chunk_size: int = RECALCULATION_CHUNK_SIZE
+) -> int:
+    """
+    Пересчитывает итоговые цены товаров, главная категория которых -
+    категория или ее потомок. UPDATE идут порциями по id,
+    чтобы не держать блокировки на все товары ветки разом
+    Ход пересчета сохраняется в кэш для админки
+    """
+    products = Product.objects.filter(primary_category__path__startswith=category.path)
+    total = products.count()
+    done = last_id = 0
+    set_recalculation_progress(category.id, "running", done, total)
+    while True:
+        chunk_ids = list(
+            products.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:chunk_size]
+        )
+        if not chunk_ids:
+            break
+        last_id = chunk_ids[-1]
+        done += recalculate_effective_prices(Product.objects.filter(id__in=chunk_ids))
+        set_recalculation_progress(category.id, "running", done, total)
+    set_recalculation_progress(category.id, "done", done, total)
+    return done
+
+
+def set_recalculation_progress(
+    category_id: int, status: str, done: int = 0, total: int = 0
+) -> None:
+    cache.set(
+        RECALCULATION_PROGRESS_KEY.format(category_id),
+        {"status": status, "done": done, "total": total},
+        timeout=60 * 60 * 24,
+    )
+
+
+def get_recalculation_progress(category_id: int) -> dict | None:
+    return cache.get(RECALCULATION_PROGRESS_KEY.format(category_id))
+
+
+def mark_prices_dirty(product_ids: Iterable[int]) -> None:
+    """
+    Откладывает пересчет цен Продуктов до фиксации транзакции, чтобы
+    при массовом изменении цены пересчитывались один раз
+    """
+    if not hasattr(_dirty, "product_ids"):
+        _dirty.product_ids = set()
+    _dirty.product_ids.update(product_ids)
+    transaction.on_commit(flush_dirty_prices)
+
+
+def flush_dirty_prices() -> None:
+    product_ids = getattr(_dirty, "product_ids", set())
+    _dirty.product_ids = set()
+    recalculate_prices(product_ids)
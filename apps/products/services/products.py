@@ -1,8 +1,8 @@
-from django.db.models import Subquery
+from django.db.models import Prefetch, Q, Subquery
 from django.db.models.query import QuerySet
 
 from apps.products.filters import ProductFilter
-from apps.products.models import Product
+from apps.products.models import Product, ProductPropertyValue
 
 
 def get_products_list(filters: dict = None) -> QuerySet:
@@ -11,7 +11,48 @@ def get_products_list(filters: dict = None) -> QuerySet:
     """
     filters = filters or {}
     qs = Product.objects.filter(is_published=True)
-    return ProductFilter(filters, qs).qs
+    return annotate_product_list(ProductFilter(filters, qs).qs)
+
+
+def get_products_batch(slugs: list[str], ids: list[int]) -> list[Product]:
+    """
+    Опубликованные товары по slug и id одним запросом, в порядке запроса.
+    Выбираются только поля цен и наличия: итоговые цены уже содержат
+    коэфициент главной категории
+    """
+    products = Product.objects.filter(
+        Q(slug__in=slugs) | Q(id__in=ids), is_published=True
+    ).only(
+        "id",
+        "slug",
+        "name",
+        "in_stock",
+        "always_in_stock",
+        "effective_ton_price",
+        "effective_meter_price",
+        "effective_unit_price",
+    )
+    by_slug = {product.slug: product for product in products}
+    by_id = {product.id: product for product in by_slug.values()}
+    found = [by_slug[slug] for slug in slugs if slug in by_slug]
+    found.extend(by_id[id] for id in ids if id in by_id)
+    return list({product.id: product for product in found}.values())
+
+
+def annotate_product_list(qs: QuerySet) -> QuerySet:
+    """
+    Добавляет к Продуктам главную категорию и свойства, отображаемые в списке,
+    чтобы сериализация не делала запросов на каждый Продукт
+    """
+    return qs.select_related("primary_category").prefetch_related(
+        Prefetch(
+            "properties_through",
+            queryset=ProductPropertyValue.objects.filter(
+                property__is_display_in_list=True
+            ).select_related("property"),
+            to_attr="display_properties",
+        )
+    )
 
 
 def add_product_properties(product: Product) -> None:
@@ -19,7 +60,7 @@ def add_product_properties(product: Product) -> None:
     Создает записи таблицы ProductPropertyValue (Свойство - Значение) для вновь
     созданного Продукта на основе принадлежности к Категории
     """
-    category = product.categories.filter(product_categories__is_primary=True).first()
+    category = product.primary_category
     if category is None:
         return
     properties = category.product_properties.difference(product.properties.all())
@@ -33,7 +74,7 @@ def remove_redundant_product_properties(product: Product) -> None:
     при смене Категории
     """
     # TODO: проверить на корректность работы
-    category = product.categories.filter(product_categories__is_primary=True).first()
+    category = product.primary_category
     remove_properties = product.properties.difference(category.product_properties.all())
     product.properties_through.filter(
         property_id__in=Subquery(remove_properties.values("id"))
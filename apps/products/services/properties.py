@@ -0,0 +1,88 @@
+import re
+from collections.abc import Iterator
+from dataclasses import dataclass
+from decimal import Decimal
+
+from apps.products.models import Category, ProductProperty, ProductPropertyValue
+
+DEFAULT_SIZE_CODE = "diametr"
+DEFAULT_MARK_CODE = "marka-stali"
+DEFAULT_LENGTH_CODE = "dlina"
+# Число в начале значения: "57", "2,5", "6000-12000" (начало диапазона)
+NUMERIC_VALUE_REGEX = re.compile(r"^\s*([0-9]{1,16}(?:[.,][0-9]+)?)\s*(?:-|$)")
+
+
+@dataclass(frozen=True)
+class CategoryPropertyMapping:
+    """
+    Id свойств, в которые записываются размер, марка и длина товаров категории
+    """
+
+    size_id: int | None = None
+    mark_id: int | None = None
+    length_id: int | None = None
+
+    @property
+    def property_ids(self) -> set[int]:
+        return {self.size_id, self.mark_id, self.length_id} - {None}
+
+    def get_values(
+        self, size: str, mark: str, length: str
+    ) -> Iterator[tuple[int, str]]:
+        # Если свойства совпадают, при записи остается последнее значение
+        for property_id, value in (
+            (self.length_id, length),
+            (self.mark_id, mark),
+            (self.size_id, size),
+        ):
+            if property_id is not None:
+                yield property_id, value
+
+
+def get_property_ids() -> dict[str, int]:
+    """
+    Возвращает id всех свойств по коду. Загружается один раз на запуск парсинга
+    """
+    return dict(ProductProperty.objects.values_list("code", "id"))
+
+
+def get_category_property_mapping(
+    category: Category, property_ids: dict[str, int] | None = None
+) -> CategoryPropertyMapping:
+    """
+    Определяет свойства категории по настройкам "Парсинг", для незаполненных
+    настроек берет свойства по умолчанию
+    """
+    if property_ids is None:
+        property_ids = get_property_ids()
+
+    mark_id = None
+    if category.is_mark_parsed:
+        mark_id = category.mark_property_id or property_ids.get(DEFAULT_MARK_CODE)
+
+    return CategoryPropertyMapping(
+        size_id=category.size_property_id or property_ids.get(DEFAULT_SIZE_CODE),
+        mark_id=mark_id,
+        length_id=category.length_property_id or property_ids.get(DEFAULT_LENGTH_CODE),
+    )
+
+
+def normalize_property_value(value: str) -> str:
+    value = re.sub(r"\s+", " ", value).strip().lower().replace(",", ".")
+    return re.sub(r"(?<=\d)х(?=\d)", "x", value)
+
+
+def parse_numeric_value(value: str) -> Decimal | None:
+    match = NUMERIC_VALUE_REGEX.match(value)
+    if match is None:
+        return None
+    return Decimal(match.group(1).replace(",", ".")).quantize(Decimal("0.0001"))
+
+
+def fill_parsed_values(property_value: ProductPropertyValue) -> ProductPropertyValue:
+    """
+    Заполняет числовое и нормализованное значение свойства по value
+    """
+    property_value.numeric_value = parse_numeric_value(property_value.value)
+    property_value.normalized_value = normalize_property_value(property_value.value)
+    return property_value
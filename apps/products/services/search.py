@@ -0,0 +1,166 @@
+import re
+import threading
+from collections import defaultdict
+from collections.abc import Iterable
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection, transaction
+from django.db.models import (
+    BooleanField,
+    F,
+    FloatField,
+    Func,
+    Q,
+    QuerySet,
+    TextField,
+    Value,
+)
+
+from apps.products.models import Product, ProductPropertyValue
+
+TOKEN_REGEX = re.compile(r"[0-9a-zа-я]+(?:[.\-][0-9a-zа-я]+)*")
+# Части составных токенов: размеры 57x3.5 и номера ГОСТ 8732-78
+TOKEN_PARTS_REGEX = re.compile(r"(?<=\d)x(?=\d)|-")
+BATCH_SIZE = 500
+
+_is_trigram_available = None
+_dirty = threading.local()
+
+
+def normalize_search_text(text: str) -> str:
+    """
+    Приводит нотацию металлопроката к одному виду: нижний регистр, ё -> е,
+    кириллическая х и * между цифрами -> латинская x, десятичная запятая -> точка
+    """
+    text = text.lower().replace("ё", "е")
+    text = re.sub(r"(?<=\d)\s*[xх*×]\s*(?=\d)", "x", text)
+    return re.sub(r"(?<=\d),(?=\d)", ".", text)
+
+
+def tokenize(text: str, with_parts: bool = True) -> list[str]:
+    """
+    Токены для поиска. Размер 57x3.5 и ГОСТ 8732-78 дают сам токен и его части,
+    чтобы находились и "57x3.5", и "57 3.5"
+    """
+    tokens = []
+    for token in TOKEN_REGEX.findall(normalize_search_text(text)):
+        tokens.append(token)
+        if with_parts:
+            tokens.extend(part for part in TOKEN_PARTS_REGEX.split(token) if part)
+    return list(dict.fromkeys(tokens))
+
+
+def build_search_vector(name: str, values: Iterable[str]) -> str:
+    """
+    Текстовое представление tsvector из готовых токенов: название с весом A,
+    значения свойств с весом B. Приведение к tsvector берет лексемы как есть,
+    без разбора парсером Postgres, который режет "57x3.5" и "57х3,5"
+    по-разному. Позиции нужны, без них веса не сохраняются
+    """
+    lexemes = [(token, "A") for token in tokenize(name)]
+    lexemes.extend((token, "B") for token in tokenize(" ".join(values)))
+    return " ".join(
+        f"'{token}':{position}{weight}"
+        for position, (token, weight) in enumerate(lexemes, start=1)
+    )
+
+
+class TokensQuery(Func):
+    """
+    tsquery из токенов запроса, каждый - как префикс. Приведение текста
+    к tsquery тоже не разбирает лексемы парсером
+    """
+
+    template = "%(expressions)s::tsquery"
+    output_field = TextField()
+
+    def __init__(self, tokens: list[str]):
+        query = " & ".join(f"'{token}':*" for token in tokens)
+        super().__init__(Value(query))
+
+
+class Matches(Func):
+    template = "%(expressions)s"
+    arg_joiner = " @@ "
+    output_field = BooleanField()
+
+
+class Rank(Func):
+    function = "ts_rank"
+    output_field = FloatField()
+
+
+def is_trigram_available() -> bool:
+    """
+    Расширение pg_trgm ставится миграцией, только если оно есть на сервере БД
+    """
+    global _is_trigram_available
+    if _is_trigram_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _is_trigram_available = cursor.fetchone() is not None
+    return _is_trigram_available
+
+
+def update_search_vectors(product_ids: Iterable[int]) -> None:
+    """
+    Пересчитывает поисковые векторы товаров
+    """
+    product_ids = list(product_ids)
+    while product_ids:
+        batch_ids, product_ids = product_ids[:BATCH_SIZE], product_ids[BATCH_SIZE:]
+        values = defaultdict(list)
+        for product_id, value in ProductPropertyValue.objects.filter(
+            product_id__in=batch_ids
+        ).values_list("product_id", "value"):
+            values[product_id].append(value)
+        products = list(Product.objects.filter(id__in=batch_ids).only("id", "name"))
+        for product in products:
+            product.search_vector = build_search_vector(
+                product.name, values[product.id]
+            )
+        Product.objects.bulk_update(products, ["search_vector"])
+
+
+def mark_search_dirty(product_ids: Iterable[int]) -> None:
+    """
+    Откладывает пересчет поисковых векторов до фиксации транзакции, когда
+    название и все значения свойств товара уже сохранены
+    """
+    if not hasattr(_dirty, "product_ids"):
+        _dirty.product_ids = set()
+    _dirty.product_ids.update(product_ids)
+    transaction.on_commit(flush_dirty_search)
+
+
+def flush_dirty_search() -> None:
+    product_ids = getattr(_dirty, "product_ids", set())
+    _dirty.product_ids = set()
+    update_search_vectors(product_ids)
+
+
+def search_products(query: str, products: QuerySet | None = None) -> QuerySet:
+    """
+    Товары по поисковому запросу, от более релевантных. По умолчанию ищет
+    среди опубликованных.
+    Полнотекстовый поиск идет по GIN-индексу поискового вектора, а при
+    наличии pg_trgm к нему добавляются похожие по триграммам названия,
+    чтобы находились запросы с опечатками
+    """
+    if products is None:
+        products = Product.objects.filter(is_published=True)
+    tokens = tokenize(query, with_parts=False)
+    if not tokens:
+        return products.none()
+
+    ts_query = TokensQuery(tokens)
+    matches = Q(Matches(F("search_vector"), ts_query))
+    rank = Rank(F("search_vector"), ts_query)
+    if is_trigram_available():
+        matches |= Q(name__trigram_similar=query)
+        rank = rank + TrigramSimilarity("name", query)
+    return (
+        products.filter(matches)
+        .annotate(rank=rank)
+        .order_by("-rank", "-in_stock", "id")
+    )
@@ -0,0 +1,184 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from django.db import connections
+from loguru import logger
+
+from apps.products.models import Product
+from apps.products.services.cache import (
+    CATEGORIES_VERSION,
+    PRODUCT_NAMES_VERSION,
+    get_cache_versions,
+)
+from apps.products.services.category_tree import get_category_tree_snapshot
+from apps.products.services.search import normalize_search_text
+
+# Как часто процесс сверяет версии каталога в кэше, секунды
+INDEX_CHECK_INTERVAL = 5
+# Ограничение памяти: в индекс попадает не больше товаров, чем здесь
+INDEX_MAX_PRODUCTS = 500_000
+# Сколько размеров с общим префиксом просматривается для выбора частых
+DIMENSIONS_SCAN_LIMIT = 200
+DIMENSION_REGEX = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?:x\d+(?:\.\d+)?)+(?![\w.])")
+
+_index = None
+_checked_at = 0.0
+_rebuild_lock = threading.Lock()
+
+
+def normalize_suggest_key(text: str) -> str:
+    """
+    Ключ для сравнения префиксов. Запятая после цифры в конце строки -
+    недописанная десятичная дробь "57х3,"
+    """
+    key = " ".join(normalize_search_text(text).split())
+    return re.sub(r"(?<=\d),$", ".", key)
+
+
+class PrefixIndex:
+    """
+    Отсортированный массив ключей и параллельный массив значений: строки
+    с префиксом занимают непрерывный отрезок, который находится бинарным
+    поиском
+    """
+
+    def __init__(self, items: dict[str, object]):
+        self.keys = sorted(items)
+        self.values = [items[key] for key in self.keys]
+
+    def find(self, prefix: str, limit: int) -> list:
+        start = bisect_left(self.keys, prefix)
+        found = []
+        for position in range(start, min(start + limit, len(self.keys))):
+            if not self.keys[position].startswith(prefix):
+                break
+            found.append(self.values[position])
+        return found
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class SuggestIndex:
+    """
+    Подсказки поиска в памяти процесса: названия товаров и категорий
+    и размеры (57x3.5), встречающиеся в названиях товаров.
+    Значения хранятся кортежами, чтобы индекс на сотни тысяч
+    названий занимал десятки мегабайт
+    """
+
+    def __init__(self, categories, products, versions: list[int]):
+        self.versions = versions
+        category_items = {}
+        for name, slug in categories:
+            category_items.setdefault(normalize_suggest_key(name), (name, slug))
+        self.categories = PrefixIndex(category_items)
+        dimensions = Counter()
+        product_items = {}
+        for name, slug in products:
+            key = normalize_suggest_key(name)
+            product_items.setdefault(key, (name, slug))
+            dimensions.update(DIMENSION_REGEX.findall(key))
+        self.products = PrefixIndex(product_items)
+        self.dimensions = PrefixIndex(
+            {dimension: (dimension, count) for dimension, count in dimensions.items()}
+        )
+
+    def suggest(self, q: str, limit: int) -> dict:
+        prefix = normalize_suggest_key(q)
+        if not prefix:
+            return {"categories": [], "products": [], "dimensions": []}
+        dimensions = sorted(
+            self.dimensions.find(prefix, DIMENSIONS_SCAN_LIMIT),
+            key=lambda dimension: -dimension[1],
+        )
+        return {
+            "categories": [
+                {"name": name, "slug": slug}
+                for name, slug in self.categories.find(prefix, limit)
+            ],
+            "products": [
+                {"name": name, "slug": slug}
+                for name, slug in self.products.find(prefix, limit)
+            ],
+            "dimensions": [dimension for dimension, _ in dimensions[:limit]],
+        }
+
+
+def build_suggest_index(versions: list[int]) -> SuggestIndex:
+    categories = [
+        (category.name, category.slug)
+        for category in get_category_tree_snapshot().by_slug.values()
+        if category.is_published
+    ]
+    products = (
+        Product.objects.filter(is_published=True)
+        .order_by("-in_stock", "id")
+        .values_list("name", "slug")[:INDEX_MAX_PRODUCTS]
+    )
+    return SuggestIndex(categories, products.iterator(chunk_size=5000), versions)
+
+
+def rebuild_suggest_index(versions: list[int]) -> None:
+    """
+    Строит индекс заново. Пока он строится, подсказки отдает прежний индекс
+    """
+    global _index
+
+    if not _rebuild_lock.acquire(blocking=False):
+        return
+    try:
+        _index = build_suggest_index(versions)
+    except Exception:
+        logger.exception("Не удалось построить индекс подсказок")
+    finally:
+        _rebuild_lock.release()
+
+
+def start_rebuild(versions: list[int]) -> None:
+    if _rebuild_lock.locked():
+        return
+
+    def run():
+        try:
+            rebuild_suggest_index(versions)
+        finally:
+            # Соединение с БД этого потока больше не понадобится
+            connections.close_all()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def get_suggest_index() -> SuggestIndex:
+    """
+    Индекс подсказок процесса. Строится при первом обращении, а когда
+    меняется версия дерева категорий или названий товаров, перестраивается
+    в фоне
+    """
+    global _index, _checked_at
+
+    index, now = _index, time.monotonic()
+    if index is not None and now - _checked_at < INDEX_CHECK_INTERVAL:
+        return index
+
+    # Версии читаются до выборки данных: изменения, сделанные во время
+    # построения, приведут к следующему перестроению
+    versions = get_cache_versions([CATEGORIES_VERSION, PRODUCT_NAMES_VERSION])
+    _checked_at = now
+    if index is None:
+        # Прежнего индекса нет - первый запрос ждет построения
+        with _rebuild_lock:
+            if _index is None:
+                _index = build_suggest_index(versions)
+            return _index
+    if index.versions != versions:
+        start_rebuild(versions)
+    return _index
+
+
+def reset_suggest_index() -> None:
+    global _index
+    _index = None
@@ -1,30 +1,70 @@
-import math
-
-from django.db.models.signals import post_save, pre_save  # m2m_changed, post_delete,
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
-from slugify import slugify
 
-from apps.products.models import (  # ProductProperty,
+from apps.products.models import (
     Category,
     Product,
+    ProductCategories,
+    ProductProperty,
     ProductPropertyValue,
 )
+from apps.products.services.cache import (
+    CATEGORIES_VERSION,
+    PRODUCT_NAMES_VERSION,
+    PRODUCTS_VERSION,
+    PROPERTIES_VERSION,
+    bump_cache_version_on_commit,
+    get_affected_category_version_names,
+    get_category_version_name,
+    get_product_category_version_names,
+    get_product_version_name,
+)
+from apps.products.services.category_tree import reset_category_tree_snapshot
+from apps.products.services.filter_engine import mark_catalog_changed
+from apps.products.services.prices import mark_prices_dirty, set_recalculation_progress
+from apps.products.services.properties import fill_parsed_values
+from apps.products.services.search import mark_search_dirty
+from apps.products.tasks import recalculate_category_prices_task
 
 # from apps.products.services.products import add_product_properties
 
 
-@receiver(pre_save, sender=Product)
-def generate_slug_signal(sender, instance, **kwargs):
-    if instance.slug == "":
-        instance.slug = slugify(instance.name)
-
-
 @receiver(pre_save, sender=Category)
 def fill_category_name_signal(sender, instance, **kwargs):
     if instance.name == "":
         instance.name = instance.parsed_name
 
 
+@receiver(pre_save, sender=Category)
+def remember_price_coefficient_signal(sender, instance, **kwargs):
+    instance._old_price_coefficient = (
+        Category.objects.filter(id=instance.id)
+        .values_list("price_coefficient", flat=True)
+        .first()
+        if instance.id
+        else None
+    )
+
+
+@receiver(post_save, sender=Category)
+def recalculate_prices_when_coefficient_changed_signal(
+    sender, instance, created, **kwargs
+):
+    """
+    Если изменился коэфициент цены - после фиксации транзакции запускаем
+    фоновый пересчет итоговых цен товаров ветки категории
+    """
+    if created or instance._old_price_coefficient == instance.price_coefficient:
+        return
+
+    def start_recalculation():
+        set_recalculation_progress(instance.id, "queued")
+        recalculate_category_prices_task.delay(instance.id)
+
+    transaction.on_commit(start_recalculation)
+
+
 @receiver(post_save, sender=Category)
 def fill_child_categories_properties_signal(sender, instance, **kwargs):
     if not instance.is_leaf() and instance.product_properties.exists():
@@ -48,72 +88,130 @@ def manage_product_properties_signal(sender, instance, **kwargs):
 #     logger.debug("PropCat post_save")
 
 
+@receiver(pre_save, sender=ProductPropertyValue)
+def fill_property_parsed_values_signal(sender, instance, **kwargs):
+    fill_parsed_values(instance)
+
+
 @receiver(post_save, sender=ProductPropertyValue)
 def calculate_prices_when_update_property_signal(sender, instance, **kwargs):
     """
-    Если указана длина и вес тонны - рассчитываем вес штуки, цену метра и цену штуки
+    Если изменилось значение свойства (вес метра, длина) - пересчитываем цены
+    товара после фиксации транзакции
+    """
+    mark_prices_dirty([instance.product_id])
+
+
+@receiver(post_save, sender=Product)
+def calculate_prices_when_ton_price_updated_signal(sender, instance, **kwargs):
+    mark_prices_dirty([instance.id])
+
+
+@receiver(post_save, sender=Product)
+@receiver([post_save, post_delete], sender=ProductPropertyValue)
+def update_search_vector_signal(sender, instance, **kwargs):
+    mark_search_dirty([instance.id if sender is Product else instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductPropertyValue)
+@receiver([post_save, post_delete], sender=ProductCategories)
+def mark_catalog_changed_signal(sender, instance, **kwargs):
+    mark_catalog_changed([instance.id if sender is Product else instance.product_id])
+
+
+@receiver(pre_save, sender=ProductCategories)
+def keep_single_primary_category_signal(sender, instance, **kwargs):
+    """
+    Новая главная категория снимает отметку с прежней
     """
-    meter_price = instance.product.meter_price
-    meter_weight = None
-    ton_price = (
-        instance.product.custom_ton_price
-        if instance.product.custom_ton_price
-        else instance.product.ton_price
+    if instance.is_primary:
+        ProductCategories.objects.filter(
+            product_id=instance.product_id, is_primary=True
+        ).exclude(id=instance.id).update(is_primary=False)
+
+
+@receiver(post_save, sender=ProductCategories)
+def sync_primary_category_signal(sender, instance, **kwargs):
+    product = Product.objects.filter(id=instance.product_id)
+    if instance.is_primary:
+        product.update(primary_category_id=instance.category_id)
+    else:
+        product.filter(primary_category_id=instance.category_id).update(
+            primary_category=None
+        )
+    # Итоговые цены зависят от коэфициента главной категории
+    mark_prices_dirty([instance.product_id])
+
+
+@receiver(post_delete, sender=ProductCategories)
+def clear_primary_category_signal(sender, instance, **kwargs):
+    if instance.is_primary:
+        Product.objects.filter(
+            id=instance.product_id, primary_category_id=instance.category_id
+        ).update(primary_category=None)
+        mark_prices_dirty([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_cache_signal(sender, instance, **kwargs):
+    reset_category_tree_snapshot()
+    bump_cache_version_on_commit(
+        CATEGORIES_VERSION, get_category_version_name(instance.id)
     )
-    if instance.property.code == "ves-metra" and ton_price:
-        try:
-            meter_weight = float(instance.value.replace(",", "."))
-        except ValueError:
-            pass
-        if meter_weight:
-            meter_price = math.ceil(float(ton_price) / 1_000 * meter_weight)
-            instance.product.meter_price = meter_price
-            instance.product.save()
-
-    if instance.property.code == "dlina" and meter_price:
-        try:
-            length = (
-                int(instance.value.split("-")[0])
-                if "-" in instance.value
-                else int(instance.value)
-            )
-        except ValueError:
-            pass
-
-        if length:
-            instance.product.unit_price = math.ceil(float(meter_price) * length / 1000)
-            instance.product.save()
+
+
+@receiver([post_save, post_delete], sender=ProductProperty)
+@receiver(m2m_changed, sender=ProductProperty.categories.through)
+def invalidate_properties_cache_signal(sender, **kwargs):
+    bump_cache_version_on_commit(PROPERTIES_VERSION)
 
 
 @receiver(pre_save, sender=Product)
-def calculate_prices_when_ton_price_updated_signal(sender, instance, **kwargs):
-    length = meter_weight = None
-    ton_price = float(instance.custom_ton_price) or float(instance.ton_price)
-    meter_weight_instance = ProductPropertyValue.objects.filter(
-        product=instance,
-        property__code="ves-metra",
-    ).first()
-    if meter_weight_instance:
-        try:
-            meter_weight = float(meter_weight_instance.value.replace(",", "."))
-        except ValueError:
-            pass
-    length_instance = ProductPropertyValue.objects.filter(
-        product=instance,
-        property__code="dlina",
-    ).first()
-
-    if length_instance:
-        try:
-            length = (
-                int(length_instance.value.split("-")[0])
-                if "-" in length_instance.value
-                else int(length_instance.value)
-            )
-        except ValueError:
-            pass
-
-    if ton_price and meter_weight:
-        instance.meter_price = math.ceil(ton_price / 1_000 * meter_weight)
-        if length:
-            instance.unit_price = math.ceil(instance.meter_price * length / 1000)
+def remember_product_suggest_fields_signal(sender, instance, **kwargs):
+    instance._old_suggest_fields = (
+        Product.objects.filter(id=instance.id)
+        .values_list("name", "slug", "is_published")
+        .first()
+        if instance.id
+        else None
+    )
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_cache_signal(sender, instance, signal, **kwargs):
+    names = [get_product_version_name(instance.id), PRODUCTS_VERSION]
+    # Наличие и публикация товара меняют количество товаров и фасеты его
+    # категорий и их предков. У удаленного товара связей уже нет
+    category_ids = (
+        [instance.primary_category_id] if instance.primary_category_id else []
+    )
+    if signal is post_save:
+        names.extend(get_product_category_version_names(instance.id, *category_ids))
+    else:
+        names.extend(get_affected_category_version_names(category_ids))
+    # Индекс подсказок перестраивается целиком, поэтому версия названий
+    # меняется, только если изменилось то, что в него попадает
+    suggest_fields = (instance.name, instance.slug, instance.is_published)
+    if signal is post_delete or instance._old_suggest_fields != suggest_fields:
+        names.append(PRODUCT_NAMES_VERSION)
+    bump_cache_version_on_commit(*names)
+
+
+@receiver([post_save, post_delete], sender=ProductPropertyValue)
+def invalidate_product_properties_cache_signal(sender, instance, **kwargs):
+    # Значения попадают в фасеты и фильтры всех категорий товара и их предков
+    bump_cache_version_on_commit(
+        get_product_version_name(instance.product_id),
+        PRODUCTS_VERSION,
+        *get_product_category_version_names(instance.product_id),
+    )
+
+
+@receiver([post_save, post_delete], sender=ProductCategories)
+def invalidate_product_categories_cache_signal(sender, instance, **kwargs):
+    bump_cache_version_on_commit(
+        get_product_version_name(instance.product_id),
+        PRODUCTS_VERSION,
+        *get_affected_category_version_names([instance.category_id]),
+    )
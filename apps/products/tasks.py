@@ -1,24 +1,37 @@
+import hashlib
 import re
-import time
-from dataclasses import dataclass
 from datetime import timedelta
 
 import requests
 from bs4 import BeautifulSoup
-from bs4.element import Tag
 from celery import current_task, shared_task  # group
+from celery.exceptions import SoftTimeLimitExceeded
 from django.db import transaction
-from django.db.models import Prefetch, Q
+from django.db.models import Q
 from django.utils import timezone
 from loguru import logger
 from requests.exceptions import HTTPError, RequestException
 
-from apps.products.models import (
-    Category,
-    Product,
-    ProductProperty,
-    ProductPropertyValue,
+from apps.products.models import Category, Product
+from apps.products.services.cache import (
+    PRODUCT_NAMES_VERSION,
+    PRODUCTS_VERSION,
+    bump_cache_version,
+    bump_cache_version_on_commit,
+    bump_categories_versions,
+    get_affected_category_ids,
+    get_affected_category_version_names,
+    get_product_version_name,
 )
+from apps.products.services.crawler import Crawler, CrawlRequest
+from apps.products.services.filter_engine import record_catalog_changes
+from apps.products.services.importer import save_category_products
+from apps.products.services.parsers import get_category_page_parser, get_unique_products
+from apps.products.services.prices import (
+    recalculate_category_prices,
+    set_recalculation_progress,
+)
+from apps.products.services.properties import get_property_ids
 from apps.utils.custom import get_object_or_None
 
 HEADERS = {
@@ -31,21 +44,14 @@ HEADERS = {
     "Accept-Language": "ru-RU",
     "Accept-Encoding": "gzip, deflate, br",
 }
+# httpx без пакета brotli не распаковывает br
+CRAWLER_HEADERS = {**HEADERS, "Accept-Encoding": "gzip, deflate"}
 
 
-@dataclass
-class ParsedProduct:
-    in_stock: bool
-    name: str
-    parse_url: str
-    size: str
-    mark: str
-    length: str
-    idt: str
-    idf: str
-    idb: str
-    price: float
-    weight: str = ""
+class ParsingBlockedError(HTTPError):
+    """
+    mc.ru отдал страницу проверки "вы не робот" вместо категории
+    """
 
 
 @shared_task
@@ -140,24 +146,15 @@ def parse_categories_task() -> list[dict[str, object]]:
     return categories
 
 
-@shared_task(soft_time_limit=600)
-def parse_products_task(categories_ids: list[int]):
-    # categories_id = Category.objects.values_list("id", flat=True)
-    # tasks = [
-    #     parse_category_products_task.s(category_id) for category_id in categories_id
-    # ]
-
-    # task_group = group(tasks)
-    # result = task_group.apply_async()
-    # result.ready()
-    # # дальнейшая логика
-    # if result.successful():
-    #     logger.info("Все задачи выполнены успешно")
-    # else:
-    #     logger.error("Парсинг завершился с ошибкой: {}", result.failed())
-
-    categories_id = [
-        cat.id
+@shared_task(soft_time_limit=60 * 60, time_limit=65 * 60)
+def parse_products_task(categories_ids: list[int]) -> str:
+    """
+    Загружает страницы PageAll листовых категорий асинхронным краулером
+    и передает каждую загруженную страницу на разбор и запись в БД.
+    Частота запросов к mc.ru задается настройками PARSER_*.
+    """
+    categories = [
+        cat
         for cat in Category.objects.filter(
             Q(id__in=categories_ids)
             & (
@@ -165,36 +162,94 @@ def parse_products_task(categories_ids: list[int]):
                 | Q(last_parsed_at__lt=timezone.now() - timedelta(days=1))
                 | Q(last_parsed_at__isnull=True)
             )
-        )
+        ).order_by("path")
         if cat.is_leaf()
     ]
+    crawl_requests = [
+        CrawlRequest(
+            key=cat.id,
+            url=get_category_page_url(cat),
+            headers=get_conditional_headers(cat),
+        )
+        for cat in categories
+    ]
+    categories_by_id = {cat.id: cat for cat in categories}
+
+    property_ids = get_property_ids()
+    crawler = Crawler(headers=CRAWLER_HEADERS)
+    failed_count = unchanged_count = 0
+    is_blocked = False
+    pages = crawler.crawl(crawl_requests)
+    for page in pages:
+        if page.error:
+            logger.error("Ошибка при загрузке категории {}: {}", page.url, page.error)
+            Category.objects.filter(id=page.key).update(
+                last_parsed_at=timezone.now(), is_parsing_successful=False
+            )
+            failed_count += 1
+            continue
 
-    for category_id in categories_id:
-        parse_category_products_task.delay(category_id)
-        time.sleep(15)
-
-
-def _is_in_stock(product: Tag) -> bool:
-    button_tag = product.find("button")
-    class_value = button_tag.get("class") if button_tag else None
-    logger.debug("Класс кнопки: {}", class_value)
-    # class_list = class_value.split() if class_value else None
-    if not class_value:
-        logger.error("Не удалось определить наличие у товара: {}", product["data-nm"])
-        return False
-
-    return True if "_basket" in class_value else False
-
+        # Страница не изменилась с прошлого успешного парсинга: товары
+        # не разбираем и не перезаписываем
+        category = categories_by_id[page.key]
+        content_hash = "" if page.is_not_modified else get_content_hash(page.text)
+        if page.is_not_modified or (
+            category.is_parsing_successful
+            and content_hash == category.parse_content_hash
+        ):
+            Category.objects.filter(id=page.key).update(last_parsed_at=timezone.now())
+            unchanged_count += 1
+            continue
 
-def _get_product_price(product: Tag) -> float:
-    try:
-        price = float(product.find("meta", itemprop="price")["content"].strip())
-    except ValueError:
-        logger.info(
-            "Цена отсутствует: {}",
+        # Ошибка разбора или записи одной категории не останавливает обход:
+        # изменения категории откатываются, она помечается неуспешной
+        try:
+            with transaction.atomic():
+                result = process_category_page(page.key, page.text, property_ids)
+        except SoftTimeLimitExceeded:
+            raise
+        except ParsingBlockedError:
+            # Остальные категории запрашивать бесполезно: сайт уже блокирует
+            # нас, новые запросы только продлят блокировку
+            logger.error("Парсинг заблокирован на категории {}", page.url)
+            Category.objects.filter(id=page.key).update(
+                last_parsed_at=timezone.now(), is_parsing_successful=False
+            )
+            failed_count += 1
+            is_blocked = True
+            pages.close()
+            break
+        except Exception as e:
+            logger.opt(exception=not isinstance(e, HTTPError)).error(
+                "Ошибка при разборе категории {}: {}", page.url, e
+            )
+            Category.objects.filter(id=page.key).update(
+                last_parsed_at=timezone.now(), is_parsing_successful=False
+            )
+            failed_count += 1
+            continue
+        Category.objects.filter(id=page.key).update(
+            parse_etag=page.headers.get("etag", "")[:250],
+            parse_last_modified=page.headers.get("last-modified", "")[:100],
+            parse_content_hash=content_hash,
         )
-        price = 0.0
-    return price
+        logger.info("{}: {}", page.url, result)
+
+    stats = crawler.stats
+    logger.info(
+        "Загружено {} страниц ({} КБ, {} без изменений) за {:.1f} с, {:.2f} стр/с",
+        stats.pages,
+        stats.bytes // 1024,
+        stats.not_modified,
+        stats.elapsed,
+        stats.pages_per_second,
+    )
+    result = f"Обработано {len(crawl_requests) - failed_count} категорий"
+    result += f" из {len(crawl_requests)}, без изменений {unchanged_count}."
+    result += f" Скорость загрузки {stats.pages_per_second:.2f} стр/с."
+    if is_blocked:
+        result += " Парсинг остановлен: сайт требует проверку на робота."
+    return result
 
 
 def _get_product_weight(idt: str, idf: str, idb: str) -> str:
@@ -223,53 +278,6 @@ def _get_product_weight(idt: str, idf: str, idb: str) -> str:
         return str(weight)
 
 
-def get_unique_products(soup: BeautifulSoup) -> dict[str, ParsedProduct]:
-    parsed_products: dict[str, ParsedProduct] = {}
-    host = "https://mc.ru"
-
-    # Логика
-    for product in soup.find_all("tr", itemtype="http://schema.org/Product"):
-        # определяем, в наличии ли товар (трубка или корзинка)
-        in_stock = _is_in_stock(product)
-        name = re.sub(r"\s+", " ", product["data-nm"])
-        name = re.sub(r"(?<=\d)х(?=\d)", "x", name)
-        parse_url = host + product.find("a")["href"]
-        size = product.find("td", class_="_razmer").text.strip()
-        mark = product.find("td", class_="_mark").text.strip()
-        length = product.find("td", class_="_dlina").text.strip()
-        logger.info("Длина товара: {}", length)
-
-        # получаем цену товара
-        price = _get_product_price(product)
-
-        parsed_product = ParsedProduct(
-            name=name.capitalize(),
-            price=price,
-            in_stock=in_stock,
-            parse_url=parse_url,
-            length=length,
-            mark=mark,
-            size=size,
-            idt=product["idt"],
-            idf=product["idf"],
-            idb=product["idb"],
-        )
-
-        # existing_product = parsed_products.get(parse_url)
-        # оставляем только уникальные названия
-        existing_product = parsed_products.get(name)
-        logger.debug("ex: {}\npars: {}", existing_product, parsed_product)
-        # TODO: проверить не нулевая ли цена
-        if existing_product is None:
-            parsed_products[name] = parsed_product
-        elif parsed_product.price < existing_product.price and parsed_product.in_stock:
-            parsed_products[name] = parsed_product
-        elif not existing_product.in_stock and parsed_product.in_stock:
-            parsed_products[name] = parsed_product
-
-    return parsed_products
-
-
 # def parse_category_properties(soup: BeautifulSoup):
 #     filter_body = soup.find("div", class_="filtr-body")
 #     filters_html = filter_body.select("div.sidebarBlock.filtr")
@@ -303,26 +311,8 @@ def get_unique_products(soup: BeautifulSoup) -> dict[str, ParsedProduct]:
 def parse_category_products_task(category_id: int):
     # https://mc.ru/metalloprokat/listovoy
     # https://mc.ru/region/nnovgorod/metalloprokat/listovoy/PageAll/1
-
-    # Достаем все продукты категории и категорию в один запрос
-    category = Category.objects.prefetch_related(
-        Prefetch(
-            "products",
-            queryset=Product.objects.filter(product_categories__is_primary=True),
-            to_attr="category_products",
-        )
-    ).get(id=category_id)
-
-    category_products: list = category.category_products
-
-    # category = Category.objects.get(id=category_id)
-    # products = category.products.filter(product_categories__is_primary=True)
-
-    url: str = (
-        category.parse_url.replace("https://mc.ru", "https://mc.ru/region/nnovgorod")
-        + "/PageAll/1"
-    )
-    category.last_parsed_at = timezone.now()
+    category = Category.objects.get(id=category_id)
+    url = get_category_page_url(category)
 
     try:
         response = requests.get(url, headers=HEADERS)  # allow_redirects=False
@@ -336,21 +326,57 @@ def parse_category_products_task(category_id: int):
             category.parsed_name,
             e,
         )
+        category.last_parsed_at = timezone.now()
         category.is_parsing_successful = False
         category.save()
         current_task().raise_exception(e)
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    return process_category_page(category_id, response.text)
+
+
+def get_conditional_headers(category: Category) -> dict[str, str]:
+    """
+    Заголовки условного запроса по валидаторам прошлого успешного парсинга
+    """
+    headers = {}
+    if not category.is_parsing_successful:
+        return headers
+    if category.parse_etag:
+        headers["If-None-Match"] = category.parse_etag
+    if category.parse_last_modified:
+        headers["If-Modified-Since"] = category.parse_last_modified
+    return headers
+
+
+def get_content_hash(html: str) -> str:
+    return hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+
+def get_category_page_url(category: Category) -> str:
+    return (
+        category.parse_url.replace("https://mc.ru", "https://mc.ru/region/nnovgorod")
+        + "/PageAll/1"
+    )
+
+
+def process_category_page(
+    category_id: int, html: str, property_ids: dict[str, int] | None = None
+) -> str | None:
+    """
+    Разбирает загруженную страницу категории и сохраняет товары в БД
+    """
+    category = Category.objects.get(id=category_id)
+    category.last_parsed_at = timezone.now()
+
+    page = get_category_page_parser().parse(html)
 
     # Проверяем, не выкинули нам капчу
-    is_check_human = soup.find("form", action="/check-human")
-    if is_check_human:
+    if page.is_check_human:
         category.is_parsing_successful = False
         category.save()
-        raise HTTPError("Блокировка парсинга")
+        raise ParsingBlockedError("Блокировка парсинга")
 
-    category_is_empty = soup.find("div", class_="catalogItems _empty")
-    if category_is_empty:
+    if page.is_empty:
         category.is_parsing_successful = True
         category.save()
         return f"Категория {category.parsed_name} пуста"
@@ -358,20 +384,19 @@ def parse_category_products_task(category_id: int):
     category_title = re.sub(
         r"\s+",
         " ",
-        soup.find("title").text.strip().replace("МЕТАЛЛСЕРВИС", "СПЕЦОПТТОРГ"),
+        page.title.replace("МЕТАЛЛСЕРВИС", "СПЕЦОПТТОРГ"),
     )[:350]
     category_description = re.sub(
         r"\s+",
         " ",
-        soup.find("meta", attrs={"name": "description"})["content"]
-        .strip()
-        .replace("МЕТАЛЛСЕРВИС", "СПЕЦОПТТОРГ")
-        .replace("стране", "городе"),
+        page.description.replace("МЕТАЛЛСЕРВИС", "СПЕЦОПТТОРГ").replace(
+            "стране", "городе"
+        ),
     )[:500]
     category_h1 = re.sub(
         r"\s+",
         " ",
-        soup.find("h1").text.strip().replace("МЕТАЛЛСЕРВИС", ""),
+        page.h1.replace("МЕТАЛЛСЕРВИС", ""),
     )[:250]
 
     if not category.seo_title:
@@ -387,200 +412,65 @@ def parse_category_products_task(category_id: int):
     if not category.is_leaf():
         return
 
-    parsed_products = get_unique_products(soup)
+    parsed_products = get_unique_products(page.products)
     logger.debug("Получено {} продуктов", len(parsed_products))
 
-    # Логика обновления продкутов в БД
-    instances_update_count = 0
-    instances_create_count = 0
-    exist_in_parsed_products = []
-    for name, product in parsed_products.items():
-        # product_instance = get_object_or_None(Product, parse_url=parse_url)
-        try:
-            product_instance = next(
-                p for p in category_products if p.parse_url == product.parse_url
-            )
-        except StopIteration:
-            # продукт с таким именем не найден
-            product_instance = None
-
-        # продукт существует в БД - обновляем
-        if product_instance:
-            product_instance.in_stock = product.in_stock
-            product_instance.ton_price = product.price
-            exist_in_parsed_products.append(product_instance.id)
-            # счетчик обновлений
-            instances_update_count += 1
-        else:
-            product_instance = Product(
-                name=product.name,
-                parse_url=product.parse_url,
-                ton_price=product.price,
-                in_stock=product.in_stock,
-                is_published=True,  # if product.in_stock else False,
-            )
-            # счетчик созданий
-            instances_create_count += 1
-            # Тут можно парсить вес и картинку с детальной страницы
-            # weight = _get_product_weight(product.idt, product.idf, product.idb)
-            # ProductPropertyValue.objects.get_or_create(
-            #     product=product_instance,
-            #     property=ProductProperty.objects.get(code="ves-metra"),
-            #     value=weight,
-            # )
-
-        product_instance.save()
-        product_instance.categories.add(
-            category,
-            through_defaults={"is_display": True, "is_primary": True},
-        )
-
-        # size, mark, length
-        size_is_h = [
-            "Балки (Двутавр)",
-            "Балки (Двутавр) низколегированные",
-            "Швеллер",
-            "Швеллер гнутый",
-            "Швеллер низколегированный",
-            "Уголок неравнополочный",
-            "Уголок нержавеющий никельсодержащий",
-            "Уголок равнополочный",
-            "Уголок равнополочный низколегированный",
-            "Уголок равнополочный судостроительный",
-            "Лист г/к",
-            "Лист г/к конструкционный",
-            "Лист г/к мостостроительный",
-            "Лист г/к низколегированный",
-            "Лист г/к Ст3",
-            "Лист г/к судостроительный",
-            "Лист нержавеющий без никеля",
-            "Лист нержавеющий никельсодержащий",
-            "Лист нержавеющий ПВЛ",
-            "Лист оцинкованный",
-            "Лист рифленый",
-            "Лист холоднокатанный х/к",
-            "Лист холоднокатанный х/к Ст",
-            "Лист просечно-вытяжной (ПВЛ)",
-        ]
-        size_is_b = [
-            "Полоса оцинкованная",
-            "Квадрат  горячекатаный",
-            "Полоса г/к",
-            "Полоса г/к оцинкованная",
-            "Полоса нержавеющая никельсодержащая",
-        ]
-        length_is_poverkhnost = [
-            "Лист г/к",
-            "Лист г/к конструкционный",
-            "Лист г/к мостостроительный",
-            "Лист г/к низколегированный",
-            "Лист г/к Ст3",
-            "Лист г/к судостроительный",
-            "Лист нержавеющий без никеля",
-            "Лист нержавеющий никельсодержащий",
-            "Лист нержавеющий ПВЛ",
-            "Лист оцинкованный",
-            "Лист рифленый",
-            "Лист холоднокатанный х/к",
-            "Лист холоднокатанный х/к Ст",
-            "Лист просечно-вытяжной (ПВЛ)",
-        ]
-        mark_is_dlina = [
-            "Лист рифленый",
-        ]
-        mark_is_shirina = [
-            "Рулоны г/к",
-            "Рулоны нержавеющие",
-            "Рулоны оцинкованные",
-            "Рулоны оцинкованные с полимерным покрытием",
-            "Рулоны х/к",
-        ]
-        mark_is_stenka = [
-            "Трубы стальные горячедеформированные",
-            "Трубы стальные холоднодеформированные",
-        ]
-        mark_is_none = [
-            "Трубы оцинкованные квадратные",
-            "Трубы оцинкованные круглые",
-            "Трубы оцинкованные прямоугольные",
-            "Доборные элементы",
-            "Саморезы кровельные",
-        ]
-        mark_is_profil = [
-            "Профнастил Н114",
-            "Профнастил Н57",
-            "Профнастил Н60",
-            "Профнастил Н75",
-            "Профнастил НС35",
-            "Профнастил НС44",
-            "Профнастил окрашенный",
-            "Профнастил оцинкованный",
-            "Профнастил С10",
-            "Профнастил С20",
-            "Профнастил С21",
-            "Профнастил С44",
-            "Профнастил С8",
-        ]
-
-        if category.parsed_name in size_is_h:
-            size_code = "vysota-h"
-        elif category.parsed_name in size_is_b:
-            size_code = "shirina-b"
-        else:
-            size_code = "diametr"
-
-        if category.parsed_name in mark_is_dlina:
-            mark_code = "dlina"
-        if category.parsed_name in mark_is_shirina:
-            mark_code = "shirina-b"
-        if category.parsed_name in mark_is_stenka:
-            mark_code = "stenka"
-        if category.parsed_name in mark_is_profil:
-            mark_code = "profil"
-        if category.parsed_name in mark_is_none:
-            mark_code = None
-        else:
-            mark_code = "marka-stali"
-
-        if category.parsed_name in length_is_poverkhnost:
-            length_code = "poverkhnost"
-        else:
-            length_code = "dlina"
-
-        ProductPropertyValue.objects.update_or_create(
-            product=product_instance,
-            property=ProductProperty.objects.get(code=length_code),
-            defaults={"value": product.length},
-        )
-        if mark_code:
-            ProductPropertyValue.objects.update_or_create(
-                product=product_instance,
-                property=ProductProperty.objects.get(code=mark_code),
-                defaults={"value": product.mark},
-            )
-        ProductPropertyValue.objects.update_or_create(
-            product=product_instance,
-            property=ProductProperty.objects.get(code=size_code),
-            defaults={"value": product.size},
+    result = save_category_products(
+        category, list(parsed_products.values()), property_ids
+    )
+    # Товары пишутся массовыми запросами без сигналов, поэтому кэш ответов
+    # по категориям и карточкам измененных товаров сбрасываем здесь. Среди них
+    # есть товары с другой главной категорией, найденные по parse_url. Выдача
+    # и фильтры родительских категорий включают товары потомков
+    category_ids = set(result.category_ids)
+    if result.created or result.updated or result.disappeared:
+        category_ids.add(category.id)
+    version_names = [*map(get_product_version_name, result.product_ids)]
+    version_names.extend(get_affected_category_version_names(category_ids))
+    if result.created:
+        version_names.append(PRODUCT_NAMES_VERSION)
+    if result.created or result.updated or result.disappeared or result.values_changed:
+        version_names.append(PRODUCTS_VERSION)
+    if version_names:
+        bump_cache_version_on_commit(*version_names)
+    if result.created or result.updated or result.disappeared or result.values_changed:
+        record_catalog_changes(
+            product_ids=result.product_ids,
+            category_ids={category.id, *result.category_ids},
         )
 
-    # Убираем отметку "В наличии" у продуктов, которые отсутствовали в
-    # результатах парсинга
-    Product.objects.filter(id__in=[prod.id for prod in category_products]).exclude(
-        id__in=exist_in_parsed_products
-    ).update(in_stock=False)
-    # category_products.exclude(id__in=exist_in_parsed_products).update(in_stock=False)
-
     # парсим фильтры
     # parse_category_properties(soup)
     if len(parsed_products) > 0:
         category.is_parsing_successful = True
         category.save()
 
-    result = f"Спаршено {len(parsed_products)} продуктов."
-    result += f" Обновлено {instances_update_count} продуктов."
-    result += f" Добавлено в БД {instances_create_count} продуктов."
-    return result
+    message = f"Спаршено {len(parsed_products)} продуктов."
+    message += f" Обновлено {result.updated} продуктов."
+    message += f" Добавлено в БД {result.created} продуктов."
+    message += f" Без изменений {result.unchanged} продуктов."
+    message += f" Снято с наличия {result.disappeared} продуктов."
+    return message
+
+
+@shared_task(soft_time_limit=30 * 60, time_limit=35 * 60)
+def recalculate_category_prices_task(category_id: int) -> str:
+    """
+    Пересчитывает итоговые цены ветки категории после изменения коэфициента
+    цены и сбрасывает закэшированные ответы API по затронутым категориям
+    """
+    category = get_object_or_None(Category, id=category_id)
+    if not category:
+        return f"Категория {category_id} не найдена"
+
+    try:
+        count = recalculate_category_prices(category)
+    except Exception:
+        set_recalculation_progress(category_id, "failed")
+        raise
+    bump_categories_versions(get_affected_category_ids(category))
+    bump_cache_version(PRODUCTS_VERSION)
+    return f"Пересчитаны цены {count} продуктов категории {category}"
 
 
 @shared_task
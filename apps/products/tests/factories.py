@@ -0,0 +1,39 @@
+from factory import Sequence
+from factory.django import DjangoModelFactory
+
+from apps.products.models import Category, Product, ProductProperty
+
+
+class CategoryFactory(DjangoModelFactory):
+    name = Sequence(lambda n: f"Категория {n}")
+    parsed_name = Sequence(lambda n: f"Категория {n}")
+    parse_url = Sequence(lambda n: f"https://mc.ru/metalloprokat/category_{n}")
+    is_published = True
+
+    class Meta:
+        model = Category
+
+    @classmethod
+    def _create(cls, model_class, *args, parent=None, **kwargs):
+        if parent is None:
+            return model_class.add_root(**kwargs)
+        return parent.add_child(**kwargs)
+
+
+class ProductPropertyFactory(DjangoModelFactory):
+    # Код свойства генерируется из названия
+    name = Sequence(lambda n: f"property-{n}")
+    is_published = True
+
+    class Meta:
+        model = ProductProperty
+
+
+class ProductFactory(DjangoModelFactory):
+    name = Sequence(lambda n: f"Труба {n}x3")
+    parse_url = Sequence(lambda n: f"https://mc.ru/product/{n}")
+    ton_price = 50000
+    is_published = True
+
+    class Meta:
+        model = Product
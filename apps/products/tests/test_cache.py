@@ -0,0 +1,115 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.products.models import ProductCategories
+from apps.products.services.cache import get_cache_version, get_category_version_name
+from apps.products.tests.factories import CategoryFactory, ProductFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def get(url, **headers):
+    with CaptureQueriesContext(connection) as queries:
+        response = APIClient().get(url, **headers)
+    # Точки сохранения ATOMIC_REQUESTS не считаем
+    return response, len(
+        [query for query in queries if "SAVEPOINT" not in query["sql"]]
+    )
+
+
+def test_menu_response_is_cached_with_etag():
+    CategoryFactory(parent=CategoryFactory())
+
+    response, _ = get("/api/categories/menu/")
+    cached_response, queries_count = get("/api/categories/menu/")
+
+    assert queries_count == 0
+    assert cached_response.json() == response.json()
+    assert cached_response["ETag"] == response["ETag"]
+
+    not_modified, queries_count = get(
+        "/api/categories/menu/", HTTP_IF_NONE_MATCH=response["ETag"]
+    )
+    assert not_modified.status_code == 304
+    assert queries_count == 0
+
+
+def test_query_params_order_does_not_change_cache_key():
+    category = CategoryFactory()
+    url = f"/api/categories/{category.slug}/children/"
+
+    first, _ = get(f"{url}?a=1&b=2")
+    second, _ = get(f"{url}?b=2&a=1")
+
+    assert first["ETag"] == second["ETag"]
+
+
+def test_category_save_invalidates_menu(django_capture_on_commit_callbacks):
+    category = CategoryFactory()
+    response, _ = get("/api/categories/menu/")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        category.name = "Трубы"
+        category.save()
+
+    new_response, queries_count = get(
+        "/api/categories/menu/", HTTP_IF_NONE_MATCH=response["ETag"]
+    )
+    assert new_response.status_code == 200
+    assert queries_count > 0
+    assert new_response.json()[0]["name"] == "Трубы"
+
+
+def test_product_detail_is_invalidated_by_product_and_coefficient(
+    django_capture_on_commit_callbacks,
+):
+    category = CategoryFactory()
+    with django_capture_on_commit_callbacks(execute=True):
+        product = ProductFactory(ton_price=50000)
+        ProductCategories.objects.create(
+            product=product, category=category, is_primary=True
+        )
+    url = f"/api/products/{product.slug}/"
+    etag = get(url)[0]["ETag"]
+    assert get(url)[1] == 1  # только поиск версий товара
+
+    product.refresh_from_db()
+    with django_capture_on_commit_callbacks(execute=True):
+        product.name = "Труба"
+        product.save()
+    response, _ = get(url)
+    assert response["ETag"] != etag
+    assert response.json()["name"] == "Труба"
+
+    with django_capture_on_commit_callbacks(execute=True):
+        category.price_coefficient = 2
+        category.save()
+    assert get(url)[0].json()["ton_price_with_coef"] == 100100
+
+
+def test_product_changes_invalidate_ancestor_categories(
+    django_capture_on_commit_callbacks,
+):
+    root = CategoryFactory()
+    leaf = CategoryFactory(parent=CategoryFactory(parent=root))
+    version_name = get_category_version_name(root.id)
+    version = get_cache_version(version_name)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product = ProductFactory()
+        link = ProductCategories.objects.create(
+            product=product, category=leaf, is_primary=True
+        )
+    assert get_cache_version(version_name) == version + 1
+
+    product.refresh_from_db()
+    with django_capture_on_commit_callbacks(execute=True):
+        product.is_published = False
+        product.save()
+    assert get_cache_version(version_name) == version + 2
+
+    with django_capture_on_commit_callbacks(execute=True):
+        link.delete()
+    assert get_cache_version(version_name) == version + 3
@@ -0,0 +1,114 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from apps.products.models import ProductCategories
+from apps.products.services.categories import (
+    get_category_ancestors,
+    get_category_product_list,
+    get_category_tree,
+    get_children_categories,
+)
+from apps.products.services.category_tree import get_category_tree_snapshot
+from apps.products.tests.factories import CategoryFactory, ProductFactory
+from apps.utils.custom import create_breadcrumbs
+
+pytestmark = pytest.mark.django_db
+
+
+def test_category_product_list_includes_leaf_descendants():
+    root = CategoryFactory()
+    group = CategoryFactory(parent=root)
+    first_leaf, second_leaf = CategoryFactory(parent=group), CategoryFactory(
+        parent=group
+    )
+    hidden_leaf = CategoryFactory(parent=root, is_published=False)
+    other_root = CategoryFactory()
+    products = ProductFactory.create_batch(4)
+    products[0].categories.add(first_leaf, second_leaf)
+    products[1].categories.add(second_leaf)
+    products[2].categories.add(hidden_leaf)
+    products[3].categories.add(other_root)
+    out_of_stock = ProductFactory(in_stock=False)
+    out_of_stock.categories.add(first_leaf)
+
+    assert list(get_category_product_list(root.slug)) == [
+        products[0],
+        products[1],
+        out_of_stock,
+    ]
+    assert list(get_category_product_list(group.slug, {"name": products[1].name})) == [
+        products[1]
+    ]
+
+
+def test_primary_category_follows_product_categories():
+    first_category, second_category = CategoryFactory(), CategoryFactory()
+    product = ProductFactory()
+
+    first_link = ProductCategories.objects.create(
+        product=product, category=first_category, is_primary=True
+    )
+    product.refresh_from_db()
+    assert product.primary_category == first_category
+
+    ProductCategories.objects.create(
+        product=product, category=second_category, is_primary=True
+    )
+    product.refresh_from_db()
+    first_link.refresh_from_db()
+    assert product.primary_category == second_category
+    assert not first_link.is_primary
+
+    ProductCategories.objects.filter(category=second_category).get().delete()
+    product.refresh_from_db()
+    assert product.primary_category is None
+
+
+def test_category_tree_is_built_with_one_query():
+    second_root = CategoryFactory(name="Б", ordering=1)
+    first_root = CategoryFactory(name="А", ordering=2)
+    group = CategoryFactory(parent=first_root, name="Трубы")
+    leaf = CategoryFactory(parent=group, name="Трубы круглые")
+    hidden_group = CategoryFactory(parent=first_root, is_published=False)
+    CategoryFactory(parent=hidden_group)
+
+    with CaptureQueriesContext(connection) as queries:
+        tree = get_category_tree()
+
+    assert len(queries) == 1
+    assert tree == [second_root, first_root]
+    assert tree[0].submenu_items == []
+    assert tree[1].submenu_items == [group]
+    assert tree[1].submenu_items[0].submenu_items == [leaf]
+
+
+def test_breadcrumbs_use_cached_ancestors():
+    root = CategoryFactory()
+    group = CategoryFactory(parent=root)
+    leaf = CategoryFactory(parent=group)
+    get_category_ancestors(leaf)
+
+    with CaptureQueriesContext(connection) as queries:
+        breadcrumbs = create_breadcrumbs(leaf, ancestors=get_category_ancestors(leaf))
+
+    assert len(queries) == 0
+    assert breadcrumbs == create_breadcrumbs(leaf)
+    assert [item["name"] for item in breadcrumbs] == [
+        root.name,
+        group.name,
+        leaf.name,
+    ]
+
+
+def test_category_tree_snapshot_reloads_after_category_change():
+    root = CategoryFactory()
+    first_snapshot = get_category_tree_snapshot()
+
+    CategoryFactory(parent=root, name="Трубы")
+
+    with CaptureQueriesContext(connection) as queries:
+        assert [child.name for child in get_children_categories(root.slug)] == ["Трубы"]
+        assert get_category_tree_snapshot() is not first_snapshot
+        get_children_categories(root.slug)
+    assert len(queries) == 1
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import httpx
+
+from apps.products.services.crawler import Crawler, CrawlRequest
+
+
+def make_crawler(handler, **kwargs):
+    options = {"concurrency": 4, "rate_limit": 1000, "rate_burst": 100, "backoff": 0}
+    options.update(kwargs)
+    return Crawler(transport=httpx.MockTransport(handler), **options)
+
+
+def make_requests(count):
+    return [
+        CrawlRequest(key=key, url=f"https://mc.ru/category_{key}")
+        for key in range(count)
+    ]
+
+
+def test_pages_are_returned_in_request_order():
+    async def handler(request):
+        # Первые страницы отвечают дольше последних
+        key = int(request.url.path.rsplit("_", 1)[1])
+        await asyncio.sleep((10 - key) * 0.005)
+        return httpx.Response(200, text=str(key))
+
+    pages = list(make_crawler(handler).crawl(make_requests(10)))
+
+    assert [page.key for page in pages] == list(range(10))
+    assert [page.text for page in pages] == [str(key) for key in range(10)]
+
+
+def test_rate_limit_per_host():
+    def handler(request):
+        return httpx.Response(200)
+
+    crawler = make_crawler(handler, rate_limit=20, rate_burst=1)
+    started_at = time.monotonic()
+    pages = list(crawler.crawl(make_requests(5)))
+
+    # Первый запрос - из "пачки", остальные четыре - не чаще 20 в секунду
+    assert time.monotonic() - started_at >= 4 / 20
+    assert crawler.stats.pages == len(pages) == 5
+
+
+def test_retries_server_errors_and_too_many_requests():
+    responses = {
+        "/category_0": [httpx.Response(503), httpx.Response(200, text="ok")],
+        "/category_1": [
+            httpx.Response(429, headers={"retry-after": "0"}),
+            httpx.Response(200, text="ok"),
+        ],
+        "/category_2": [httpx.Response(500)] * 3,
+        "/category_3": [httpx.Response(404), httpx.Response(200)],
+    }
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return responses[request.url.path].pop(0)
+
+    crawler = make_crawler(handler, retries=2)
+    pages = list(crawler.crawl(make_requests(4)))
+
+    assert [(page.status_code, page.error) for page in pages] == [
+        (200, None),
+        (200, None),
+        (500, "HTTP 500"),
+        (404, "HTTP 404"),
+    ]
+    assert calls.count("/category_2") == 3
+    assert calls.count("/category_3") == 1
+    assert crawler.stats.errors == 2
+
+
+def test_crawl_stops_when_consumer_closes_generator():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200)
+
+    crawler = make_crawler(handler, concurrency=2)
+    pages = crawler.crawl(make_requests(40))
+    next(pages)
+    started_at = time.monotonic()
+    pages.close()
+
+    assert time.monotonic() - started_at < 0.5
+    assert len(calls) < 10
@@ -0,0 +1,126 @@
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.products.models import ProductCategories, ProductPropertyValue
+from apps.products.tests.factories import (
+    CategoryFactory,
+    ProductFactory,
+    ProductPropertyFactory,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def category():
+    category = CategoryFactory()
+    diametr = ProductPropertyFactory(name="diametr", is_display_in_list=True)
+    gost = ProductPropertyFactory(name="gost", is_display_in_list=True)
+    diametr.categories.add(category)
+    gost.categories.add(category)
+    for name, values in [
+        ("first", {diametr: "57", gost: "ГОСТ 8732-78"}),
+        ("second", {diametr: "57", gost: "ГОСТ  8734-75"}),
+        ("third", {diametr: "108", gost: "ГОСТ 8732-78"}),
+        ("fourth", {diametr: "32,5"}),
+    ]:
+        product = ProductFactory(name=name)
+        ProductCategories.objects.create(
+            product=product, category=category, is_primary=True
+        )
+        for property, value in values.items():
+            ProductPropertyValue.objects.create(
+                product=product, property=property, value=value
+            )
+    return category
+
+
+def get_product_names(category, params):
+    response = APIClient().get(f"/api/categories/{category.slug}/products/", params)
+    assert response.status_code == 200
+    return {product["name"] for product in response.json()["results"]}
+
+
+@pytest.mark.parametrize(
+    "params,names",
+    [
+        ({"prop[diametr]": "57"}, {"first", "second"}),
+        ({"prop[diametr]": ["57", "32.5"]}, {"first", "second", "fourth"}),
+        ({"prop[gost]": "гост 8734-75"}, {"second"}),
+        ({"prop[diametr][min]": "40"}, {"first", "second", "third"}),
+        ({"prop[diametr][min]": "40", "prop[diametr][max]": "60"}, {"first", "second"}),
+        ({"prop[diametr]": "57", "prop[gost]": "ГОСТ 8732-78"}, {"first"}),
+    ],
+)
+def test_category_products_facet_filters(category, params, names):
+    assert get_product_names(category, params) == names
+
+
+def test_category_products_unknown_facet_is_rejected(category):
+    response = APIClient().get(
+        f"/api/categories/{category.slug}/products/", {"prop[unknown]": "1"}
+    )
+
+    assert response.status_code == 400
+    assert "prop[unknown]" in response.json()
+
+
+def test_category_facets_counts_are_cached(category):
+    url = f"/api/categories/{category.slug}/facets/"
+    with CaptureQueriesContext(connection) as queries:
+        diametr, gost = APIClient().get(url).json()
+
+    assert len([query for query in queries if "GROUP BY" in query["sql"]]) == 1
+    assert [(value["value"], value["count"]) for value in diametr["values"]] == [
+        ("32,5", 1),
+        ("57", 2),
+        ("108", 1),
+    ]
+    assert (Decimal(diametr["min"]), Decimal(diametr["max"])) == (32.5, 108)
+    assert [value["count"] for value in gost["values"]] == [2, 1]
+
+    with CaptureQueriesContext(connection) as queries:
+        APIClient().get(url)
+    assert not [query for query in queries if "GROUP BY" in query["sql"]]
+
+
+def get_diametr_values(category):
+    diametr = APIClient().get(f"/api/categories/{category.slug}/facets/").json()[0]
+    return [(value["value"], value["count"]) for value in diametr["values"]]
+
+
+def test_category_facets_follow_property_values(
+    category, django_capture_on_commit_callbacks
+):
+    parent = CategoryFactory()
+    leaf = CategoryFactory(parent=parent)
+    ProductCategories.objects.filter(category=category).update(category=leaf)
+    ProductPropertyValue.objects.first().property.categories.add(parent, leaf)
+    assert get_diametr_values(parent) == [("32,5", 1), ("57", 2), ("108", 1)]
+
+    value = ProductPropertyValue.objects.get(product__name="first", value="57")
+    with django_capture_on_commit_callbacks(execute=True):
+        value.value = "89"
+        value.save()
+    assert get_diametr_values(parent) == [
+        ("32,5", 1),
+        ("57", 1),
+        ("89", 1),
+        ("108", 1),
+    ]
+
+    product = value.product
+    with django_capture_on_commit_callbacks(execute=True):
+        product.is_published = False
+        product.save()
+    assert get_diametr_values(parent) == [("32,5", 1), ("57", 1), ("108", 1)]
+
+
+def test_legacy_property_filter(category):
+    response = APIClient().get("/api/products/", {"gost": "8734"})
+
+    assert [product["name"] for product in response.json()] == ["second"]
@@ -0,0 +1,129 @@
+import pytest
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from apps.products.models import (
+    ProductCategories,
+    ProductProperty,
+    ProductPropertyValue,
+)
+from apps.products.services import filter_engine
+from apps.products.services.facets import FacetFilter
+from apps.products.tests.factories import (
+    CategoryFactory,
+    ProductFactory,
+    ProductPropertyFactory,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def engine_enabled(settings, monkeypatch):
+    settings.CATALOG_FILTER_ENGINE = True
+    monkeypatch.setattr(filter_engine, "ENGINE_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(
+        filter_engine, "start_rebuild", filter_engine.rebuild_filter_engine
+    )
+
+
+@pytest.fixture
+def categories():
+    parent = CategoryFactory()
+    diametr = ProductPropertyFactory(name="diametr", is_display_in_list=True)
+    mark = ProductPropertyFactory(name="mark", is_display_in_list=True)
+    leaves = [CategoryFactory(parent=parent), CategoryFactory(parent=parent)]
+    for category in [parent, *leaves]:
+        diametr.categories.add(category)
+        mark.categories.add(category)
+
+    for number in range(12):
+        product = ProductFactory(in_stock=number % 3 != 0)
+        ProductCategories.objects.create(
+            product=product, category=leaves[number % 2], is_primary=True
+        )
+        values = {diametr: str(57 + number % 4 * 10), mark: ["ст20", "ст3"][number % 2]}
+        if number == 5:
+            del values[diametr]
+        for property, value in values.items():
+            ProductPropertyValue.objects.update_or_create(
+                product=product, property=property, defaults={"value": value}
+            )
+    ProductFactory(is_published=False).categories.add(leaves[0])
+    return {"parent": parent, "first": leaves[0], "second": leaves[1]}
+
+
+def get_page(category, params):
+    response = APIClient().get(f"/api/categories/{category.slug}/products/", params)
+    assert response.status_code == 200
+    data = response.json()
+    return data["count"], [product["id"] for product in data["results"]]
+
+
+@pytest.mark.parametrize("category", ["parent", "first", "second"])
+@pytest.mark.parametrize(
+    "params",
+    [
+        {},
+        {"limit": 4, "offset": 2},
+        {"prop[diametr]": "67"},
+        {"prop[diametr]": ["57", "77"], "prop[mark]": "ст20"},
+        {"prop[diametr][min]": "60", "prop[diametr][max]": "80"},
+        {"prop[mark]": ""},
+    ],
+)
+def test_engine_matches_sql(categories, settings, monkeypatch, category, params):
+    category = categories[category]
+    expected = get_page(category, params)
+    settings.CATALOG_FILTER_ENGINE = True
+    monkeypatch.setattr(
+        filter_engine, "start_rebuild", filter_engine.rebuild_filter_engine
+    )
+    filter_engine.rebuild_filter_engine()
+
+    assert filter_engine.get_filter_engine() is not None
+    assert get_page(category, params) == expected
+
+
+def test_engine_is_not_used_for_unsupported_filters(categories, engine_enabled):
+    filter_engine.rebuild_filter_engine()
+    slug = categories["parent"].slug
+
+    assert filter_engine.filter_category_products(slug, {"name": "x"}, {}) is None
+    assert filter_engine.filter_category_products(slug, {}, {}) is not None
+
+
+def test_engine_applies_changes_incrementally(
+    categories, engine_enabled, django_capture_on_commit_callbacks
+):
+    filter_engine.rebuild_filter_engine()
+    engine = filter_engine.get_filter_engine()
+    parent = categories["parent"]
+    count, ids = get_page(parent, {"prop[diametr]": "57"})
+    diametr = FacetFilter(values=["57"])
+    diametr_id = ProductProperty.objects.get(code="diametr").id
+    ids_before = engine.filter(parent, {diametr_id: diametr}, True, None)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ProductPropertyValue.objects.get(product_id=ids[0], value="57").delete()
+
+    new_engine = filter_engine.get_filter_engine()
+    # Прежний движок, который могут читать другие потоки, не изменился
+    assert new_engine is not engine
+    assert (len(engine.retired), len(new_engine.retired)) == (0, 1)
+    assert engine.filter(parent, {diametr_id: diametr}, True, None) == ids_before
+    assert get_page(parent, {"prop[diametr]": "57"}) == (count - 1, ids[1:])
+
+
+def test_engine_falls_back_to_sql_when_changes_are_lost(
+    categories, engine_enabled, monkeypatch
+):
+    filter_engine.rebuild_filter_engine()
+    engine = filter_engine.get_filter_engine()
+    filter_engine.record_catalog_changes(product_ids=[engine.ids[0]])
+    cache.delete(filter_engine.CHANGES_KEY.format(engine.version + 1))
+    rebuilds = []
+    monkeypatch.setattr(filter_engine, "start_rebuild", lambda: rebuilds.append(1))
+
+    assert filter_engine.get_filter_engine() is None
+    assert rebuilds == [1]
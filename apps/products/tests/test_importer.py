@@ -0,0 +1,200 @@
+from datetime import datetime, timezone
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from apps.products.models import Product, ProductCategories, ProductPropertyValue
+from apps.products.services.importer import ParsedProduct, save_category_products
+from apps.products.tests.factories import CategoryFactory, ProductPropertyFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def make_parsed_products(count: int, price: float = 50000.0) -> list[ParsedProduct]:
+    return [
+        ParsedProduct(
+            in_stock=True,
+            name=f"Труба {n}x3",
+            parse_url=f"https://mc.ru/product/{n}",
+            size=str(n),
+            mark="Ст20",
+            length="6000",
+            idt="",
+            idf="",
+            idb="",
+            price=price,
+        )
+        for n in range(count)
+    ]
+
+
+@pytest.fixture
+def properties():
+    return [
+        ProductPropertyFactory(name=code)
+        for code in ("diametr", "marka-stali", "dlina", "ves-metra")
+    ]
+
+
+def test_save_category_products_creates_products(properties):
+    category = CategoryFactory()
+
+    result = save_category_products(category, make_parsed_products(3))
+
+    assert (result.created, result.updated) == (3, 0)
+    assert Product.objects.count() == 3
+    assert (
+        ProductCategories.objects.filter(
+            category=category, is_primary=True, is_display=True
+        ).count()
+        == 3
+    )
+    assert ProductPropertyValue.objects.count() == 9
+
+
+def test_save_category_products_updates_and_marks_disappeared(properties):
+    category = CategoryFactory()
+    save_category_products(category, make_parsed_products(3))
+
+    result = save_category_products(category, make_parsed_products(2, price=60000))
+
+    assert (result.created, result.updated, result.disappeared) == (0, 2, 1)
+    assert Product.objects.count() == 3
+    assert ProductCategories.objects.count() == 3
+    assert set(Product.objects.values_list("ton_price", "in_stock")) == {
+        (60000, True),
+        (50000, False),
+    }
+
+
+def test_save_category_products_recalculates_prices(properties):
+    category = CategoryFactory()
+    save_category_products(category, make_parsed_products(1))
+    product = Product.objects.get()
+    ProductPropertyValue.objects.create(
+        product=product, property=properties[3], value="2,5"
+    )
+
+    save_category_products(category, make_parsed_products(1, price=40000))
+
+    product.refresh_from_db()
+    assert product.meter_price == 100
+    assert product.unit_price == 600
+
+
+def test_save_category_products_query_count_is_constant(properties):
+    small_category, large_category = CategoryFactory(), CategoryFactory()
+
+    with CaptureQueriesContext(connection) as small:
+        save_category_products(small_category, make_parsed_products(2))
+    with CaptureQueriesContext(connection) as large:
+        save_category_products(large_category, make_parsed_products(50)[2:])
+
+    assert len(small) == len(large)
+
+
+def test_save_category_products_matches_moved_product_by_name(properties):
+    category = CategoryFactory()
+    save_category_products(category, make_parsed_products(2))
+    moved_products = make_parsed_products(2)
+    moved_products[0].parse_url = "https://mc.ru/product/new"
+    moved_products[0].name = "ТРУБА  0х3"
+
+    result = save_category_products(category, moved_products)
+
+    assert (result.created, result.updated, result.unchanged) == (0, 1, 1)
+    assert set(Product.objects.values_list("parse_url", flat=True)) == {
+        "https://mc.ru/product/new",
+        "https://mc.ru/product/1",
+    }
+
+
+def test_save_category_products_uses_category_properties(properties):
+    stenka = ProductPropertyFactory(name="stenka")
+    category = CategoryFactory(mark_property=stenka)
+    pipe_category = CategoryFactory(is_mark_parsed=False)
+
+    save_category_products(category, make_parsed_products(1))
+    save_category_products(pipe_category, make_parsed_products(2)[1:])
+
+    assert set(
+        ProductPropertyValue.objects.values_list(
+            "product__parse_url", "property__code", "value"
+        )
+    ) == {
+        ("https://mc.ru/product/0", "diametr", "0"),
+        ("https://mc.ru/product/0", "stenka", "Ст20"),
+        ("https://mc.ru/product/0", "dlina", "6000"),
+        ("https://mc.ru/product/1", "diametr", "1"),
+        ("https://mc.ru/product/1", "dlina", "6000"),
+    }
+
+
+def test_save_category_products_skips_unchanged_products(properties):
+    category = CategoryFactory()
+    save_category_products(category, make_parsed_products(3))
+    Product.objects.update(updated_date=datetime(2020, 1, 1, tzinfo=timezone.utc))
+    parsed_products = make_parsed_products(3)
+    parsed_products[0].in_stock = False
+    parsed_products[1].length = "12000"
+
+    with CaptureQueriesContext(connection) as queries:
+        result = save_category_products(category, parsed_products)
+
+    assert (result.created, result.updated, result.unchanged) == (0, 1, 2)
+    assert list(
+        Product.objects.filter(updated_date__year=2020)
+        .order_by("parse_url")
+        .values_list("parse_url", flat=True)
+    ) == ["https://mc.ru/product/1", "https://mc.ru/product/2"]
+    assert (
+        ProductPropertyValue.objects.get(
+            product__parse_url="https://mc.ru/product/1", property__code="dlina"
+        ).value
+        == "12000"
+    )
+    updates = [query["sql"] for query in queries if query["sql"].startswith("UPDATE")]
+    # товар, значение свойства, пересчет цен и поискового вектора товара
+    # с изменившимся значением; пропавших товаров нет - снимать с наличия нечего
+    assert len(updates) == 4
+    assert '"ton_price"' not in updates[0]
+
+
+def test_save_category_products_keeps_existing_primary_category(properties):
+    category, other_category = CategoryFactory(), CategoryFactory()
+    save_category_products(other_category, make_parsed_products(1))
+
+    save_category_products(category, make_parsed_products(2))
+
+    assert dict(Product.objects.values_list("parse_url", "primary_category")) == {
+        "https://mc.ru/product/0": other_category.id,
+        "https://mc.ru/product/1": category.id,
+    }
+    assert set(
+        ProductCategories.objects.values_list(
+            "product__parse_url", "category", "is_primary"
+        )
+    ) == {
+        ("https://mc.ru/product/0", other_category.id, True),
+        ("https://mc.ru/product/0", category.id, False),
+        ("https://mc.ru/product/1", category.id, True),
+    }
+
+
+def test_save_category_products_reports_updated_products_of_other_categories(
+    properties,
+):
+    category, other_category = CategoryFactory(), CategoryFactory()
+    save_category_products(other_category, make_parsed_products(1))
+    save_category_products(category, make_parsed_products(3)[1:])
+    product_ids = dict(Product.objects.values_list("parse_url", "id"))
+
+    result = save_category_products(category, make_parsed_products(2, price=60000))
+
+    assert result.product_ids == {
+        product_ids["https://mc.ru/product/0"],
+        product_ids["https://mc.ru/product/1"],
+        product_ids["https://mc.ru/product/2"],
+    }
+    assert result.category_ids == {category.id, other_category.id}
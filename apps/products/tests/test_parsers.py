@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import pytest
+
+from apps.products.services.importer import ParsedProduct
+from apps.products.services.parsers import (
+    BS4CategoryPageParser,
+    LxmlCategoryPageParser,
+    get_unique_products,
+)
+
+PAGES_DIR = Path(__file__).parent / "pages"
+
+
+@pytest.mark.parametrize(
+    "page_name", sorted(path.name for path in PAGES_DIR.glob("*.html"))
+)
+def test_lxml_parser_matches_bs4_parser(page_name):
+    html = (PAGES_DIR / page_name).read_text()
+
+    assert LxmlCategoryPageParser().parse(html) == BS4CategoryPageParser().parse(html)
+
+
+def test_lxml_parser_parses_category_page():
+    html = (PAGES_DIR / "category.html").read_text()
+
+    page = LxmlCategoryPageParser().parse(html)
+
+    assert page.title == "Трубы электросварные   купить в Москве | МЕТАЛЛСЕРВИС"
+    assert page.h1 == "Трубы электросварные МЕТАЛЛСЕРВИС"
+    assert len(page.products) == 6
+    product = page.products[0]
+    assert product.name == "Труба электросварная 57x3,5"
+    assert product.parse_url == "https://mc.ru/metalloprokat/truba_57x3_5_st20"
+    assert (product.size, product.mark, product.length) == ("57x3,5", "Ст20", "12000")
+    assert (product.price, product.in_stock) == (65900.0, True)
+    assert (page.products[2].price, page.products[2].in_stock) == (0.0, False)
+
+
+def test_lxml_parser_detects_empty_and_blocked_pages():
+    parser = LxmlCategoryPageParser()
+
+    assert parser.parse((PAGES_DIR / "category_empty.html").read_text()).is_empty
+    assert parser.parse((PAGES_DIR / "check_human.html").read_text()).is_check_human
+
+
+def test_get_unique_products_prefers_cheaper_products_in_stock():
+    html = (PAGES_DIR / "category.html").read_text()
+
+    products = get_unique_products(LxmlCategoryPageParser().parse(html).products)
+
+    assert len(products) == 4
+    assert products["Труба электросварная 57x3,5"].price == 64900.0
+    assert products["Труба электросварная 89x4"].in_stock
+
+
+def test_get_unique_products_keeps_names_differing_in_case():
+    products = [
+        ParsedProduct(
+            in_stock=True,
+            name=name.capitalize(),
+            source_name=name,
+            parse_url=f"https://mc.ru/product/{n}",
+            size="",
+            mark="",
+            length="",
+            idt="",
+            idf="",
+            idb="",
+            price=1000.0,
+        )
+        for n, name in enumerate(["Лист AISI 304", "Лист aisi 304"])
+    ]
+
+    assert list(get_unique_products(products)) == ["Лист AISI 304", "Лист aisi 304"]
@@ -0,0 +1,173 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from apps.products.models import Product, ProductPropertyValue
+from apps.products.services.cache import get_cache_version, get_category_version_name
+from apps.products.services.prices import (
+    get_recalculation_progress,
+    recalculate_category_prices,
+    recalculate_prices,
+)
+from apps.products.tests.factories import (
+    CategoryFactory,
+    ProductFactory,
+    ProductPropertyFactory,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def properties():
+    return ProductPropertyFactory(name="ves-metra"), ProductPropertyFactory(
+        name="dlina"
+    )
+
+
+def make_product(properties, meter_weight, length, **kwargs):
+    product = ProductFactory(**kwargs)
+    for property, value in zip(properties, (meter_weight, length)):
+        if value is not None:
+            ProductPropertyValue.objects.create(
+                product=product, property=property, value=value
+            )
+    return product
+
+
+@pytest.mark.parametrize(
+    "meter_weight,length,prices",
+    [
+        ("2,5", "6000", (125, 750)),
+        ("2.5", "6000-12000", (125, 750)),
+        (" 0,33 ", "11700", (17, 199)),
+        ("2,5", "н/д", (125, 0)),
+        ("н/д", "6000", (0, 0)),
+        (None, "6000", (0, 0)),
+    ],
+)
+def test_recalculate_prices(properties, meter_weight, length, prices):
+    product = make_product(properties, meter_weight, length, ton_price=49990)
+
+    recalculate_prices([product.id])
+
+    product.refresh_from_db()
+    assert (product.meter_price, product.unit_price) == prices
+
+
+def test_recalculate_prices_prefers_custom_ton_price(properties):
+    product = make_product(
+        properties, "2", "6000", ton_price=50000, custom_ton_price=60000
+    )
+
+    recalculate_prices([product.id])
+
+    product.refresh_from_db()
+    assert (product.meter_price, product.unit_price) == (120, 720)
+
+
+def test_recalculate_prices_runs_single_query(properties):
+    products = [make_product(properties, "2", "6000") for _ in range(10)]
+
+    with CaptureQueriesContext(connection) as queries:
+        assert recalculate_prices([product.id for product in products]) == 10
+
+    assert len(queries) == 1
+
+
+def test_signals_recalculate_prices_once_on_commit(
+    properties, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        product = make_product(properties, "2", "6000", ton_price=50000)
+        product.ton_price = 40000
+        product.save()
+
+    assert Product.objects.filter(
+        id=product.id, meter_price=80, unit_price=480
+    ).exists()
+
+
+def test_recalculate_prices_fills_effective_prices(properties):
+    category = CategoryFactory(price_coefficient="1.1")
+    product = make_product(
+        properties,
+        "2",
+        "6000",
+        ton_price=50000,
+        custom_unit_price=700,
+        primary_category=category,
+    )
+
+    recalculate_prices([product.id])
+
+    product.refresh_from_db()
+    assert (
+        product.effective_ton_price,
+        product.effective_meter_price,
+        product.effective_unit_price,
+    ) == (55100, 110, 770)
+
+
+def test_coefficient_change_recalculates_effective_prices(
+    properties, django_capture_on_commit_callbacks
+):
+    category = CategoryFactory()
+    product = make_product(
+        properties, "2", "6000", ton_price=50000, primary_category=category
+    )
+    recalculate_prices([product.id])
+
+    with django_capture_on_commit_callbacks(execute=True):
+        category.price_coefficient = 2
+        category.save()
+
+    product.refresh_from_db()
+    assert (product.effective_ton_price, product.effective_meter_price) == (
+        100100,
+        200,
+    )
+
+
+def test_recalculate_category_prices_updates_subtree_in_chunks(properties):
+    root = CategoryFactory(price_coefficient=2)
+    child = CategoryFactory(parent=root, price_coefficient=3)
+    other = CategoryFactory(price_coefficient=4)
+    products = [
+        make_product(properties, "2", "6000", ton_price=100, primary_category=category)
+        for category in (root, child, child, other)
+    ]
+    recalculate_prices([product.id for product in products])
+    Product.objects.update(effective_ton_price=0)
+
+    with CaptureQueriesContext(connection) as queries:
+        assert recalculate_category_prices(root, chunk_size=2) == 3
+
+    # COUNT, две порции по выборке id и UPDATE, пустая выборка
+    assert len(queries) == 6
+    assert list(
+        Product.objects.order_by("id").values_list("effective_ton_price", flat=True)
+    ) == [300, 400, 400, 0]
+    assert get_recalculation_progress(root.id) == {
+        "status": "done",
+        "done": 3,
+        "total": 3,
+    }
+
+
+def test_coefficient_change_bumps_cache_versions(
+    properties, django_capture_on_commit_callbacks
+):
+    root = CategoryFactory()
+    child = CategoryFactory(parent=root)
+    versions = {
+        category.id: get_cache_version(get_category_version_name(category.id))
+        for category in (root, child)
+    }
+
+    with django_capture_on_commit_callbacks(execute=True):
+        child.price_coefficient = 2
+        child.save()
+
+    for category_id, version in versions.items():
+        assert get_cache_version(get_category_version_name(category_id)) > version
@@ -0,0 +1,67 @@
+from decimal import Decimal
+
+import pytest
+
+from apps.products.models import ProductPropertyValue
+from apps.products.services.categories import get_category_product_list
+from apps.products.services.properties import (
+    normalize_property_value,
+    parse_numeric_value,
+)
+from apps.products.tests.factories import (
+    CategoryFactory,
+    ProductFactory,
+    ProductPropertyFactory,
+)
+
+
+@pytest.mark.parametrize(
+    "value,numeric_value",
+    [
+        ("57", Decimal("57")),
+        (" 2,5 ", Decimal("2.5")),
+        ("0.33", Decimal("0.33")),
+        ("6000-12000", Decimal("6000")),
+        ("57х3", None),
+        ("Ст20", None),
+        ("", None),
+    ],
+)
+def test_parse_numeric_value(value, numeric_value):
+    assert parse_numeric_value(value) == numeric_value
+
+
+def test_normalize_property_value():
+    assert normalize_property_value("  57Х3,5  ГОСТ ") == "57x3.5 гост"
+
+
+@pytest.mark.django_db
+def test_property_value_save_fills_parsed_values():
+    value = ProductPropertyValue.objects.create(
+        product=ProductFactory(), property=ProductPropertyFactory(), value="2,5"
+    )
+
+    value.refresh_from_db()
+    assert (value.numeric_value, value.normalized_value) == (Decimal("2.5"), "2.5")
+
+
+@pytest.mark.django_db
+def test_category_products_sorted_by_numeric_value():
+    category = CategoryFactory()
+    diametr = ProductPropertyFactory(name="diametr")
+    diametr.categories.add(category)
+    for value, in_stock in (("100", True), ("9,5", True), ("10", True), ("5", False)):
+        product = ProductFactory(in_stock=in_stock)
+        product.categories.add(category)
+        ProductPropertyValue.objects.create(
+            product=product, property=diametr, value=value
+        )
+
+    products = get_category_product_list(category.slug)
+
+    assert [product.property_value for product in products] == [
+        Decimal("9.5"),
+        Decimal("10"),
+        Decimal("100"),
+        Decimal("5"),
+    ]
@@ -0,0 +1,127 @@
+import pytest
+from django.contrib import admin
+from django.db import connection
+from rest_framework.test import APIClient
+
+from apps.products.admin import ProductAdmin
+from apps.products.models import Product, ProductPropertyValue
+from apps.products.services.search import (
+    is_trigram_available,
+    search_products,
+    tokenize,
+    update_search_vectors,
+)
+from apps.products.tests.factories import ProductFactory, ProductPropertyFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.mark.parametrize(
+    "text,tokens",
+    [
+        ("Труба 57х3,5", ["труба", "57x3.5", "57", "3.5"]),
+        ("57 X 3.5", ["57x3.5", "57", "3.5"]),
+        ("ГОСТ 8732-78", ["гост", "8732-78", "8732", "78"]),
+        ("Сталь 09Г2С", ["сталь", "09г2с"]),
+    ],
+)
+def test_tokenize(text, tokens):
+    assert tokenize(text) == tokens
+
+
+@pytest.fixture
+def products(django_capture_on_commit_callbacks):
+    mark = ProductPropertyFactory(name="mark")
+    with django_capture_on_commit_callbacks(execute=True):
+        pipe = ProductFactory(name="Труба 57х3,5")
+        ProductPropertyValue.objects.create(product=pipe, property=mark, value="ст20")
+        ProductFactory(name="Труба 108х4")
+        ProductFactory(name="Лист 3 мм", is_published=False)
+        sheet = ProductFactory(name="Лист 57")
+        ProductPropertyValue.objects.create(product=sheet, property=mark, value="ст3")
+
+
+def search(q):
+    response = APIClient().get("/api/products/search/", {"q": q})
+    assert response.status_code == 200
+    return [product["name"] for product in response.json()["results"]]
+
+
+@pytest.mark.parametrize(
+    "q,names",
+    [
+        ("труба 57x3.5 ст20", ["Труба 57х3,5"]),
+        ("57 3,5", ["Труба 57х3,5"]),
+        ("тру", ["Труба 108х4", "Труба 57х3,5"]),
+        ("лист", ["Лист 57"]),
+        ("!!!", []),
+    ],
+)
+def test_search_products(products, q, names):
+    assert sorted(search(q)) == names
+
+
+def test_name_match_ranks_above_property_match():
+    diametr = ProductPropertyFactory(name="diametr")
+    sheet = ProductFactory(name="Лист")
+    ProductPropertyValue.objects.create(product=sheet, property=diametr, value="57")
+    pipe = ProductFactory(name="Труба 57")
+    update_search_vectors([sheet.id, pipe.id])
+
+    assert list(search_products("57")) == [pipe, sheet]
+
+
+def test_search_requires_query():
+    assert APIClient().get("/api/products/search/").status_code == 400
+
+
+def test_admin_search_by_number_matches_id_and_name():
+    sheet = ProductFactory(name="Лист")
+    pipe = ProductFactory(name=f"Труба {sheet.id}")
+    ProductFactory(name="Балка")
+    update_search_vectors([sheet.id, pipe.id])
+    product_admin = ProductAdmin(Product, admin.site)
+
+    found, _ = product_admin.get_search_results(
+        None, Product.objects.all(), f" {sheet.id} "
+    )
+
+    assert set(found) == {sheet, pipe}
+
+
+@pytest.fixture
+def trigram():
+    if not is_trigram_available():
+        pytest.skip("Расширение pg_trgm не установлено")
+
+
+def test_trigram_search_finds_names_with_typos(trigram):
+    pipe = ProductFactory(name="Труба электросварная 57х3,5")
+    sheet = ProductFactory(name="Лист 108")
+    update_search_vectors([pipe.id, sheet.id])
+
+    assert list(search_products("труба элекросварная 57х3,5")) == [pipe]
+
+
+def test_full_text_match_ranks_above_trigram_match(trigram):
+    similar = ProductFactory(name="Трубка 57")
+    exact = ProductFactory(name="Труба 57")
+    update_search_vectors([similar.id, exact.id])
+
+    assert list(search_products("труба 57")) == [exact, similar]
+
+
+def test_property_values_are_not_matched_by_trigrams(trigram):
+    mark = ProductPropertyFactory(name="mark")
+    sheet = ProductFactory(name="Лист")
+    ProductPropertyValue.objects.create(product=sheet, property=mark, value="09г2с")
+    update_search_vectors([sheet.id])
+
+    # Значения свойств ищутся только по поисковому вектору
+    assert list(search_products("09г2с")) == [sheet]
+    assert not search_products("09г3с").exists()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT tablename FROM pg_indexes WHERE indexdef LIKE '%gin_trgm_ops%'"
+        )
+        assert cursor.fetchall() == [("products_product",)]
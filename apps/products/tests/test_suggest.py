@@ -0,0 +1,104 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.products.services import suggest as suggest_service
+from apps.products.services.cache import PRODUCT_NAMES_VERSION, get_cache_version
+from apps.products.tests.factories import CategoryFactory, ProductFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def catalog():
+    CategoryFactory(name="Трубы", slug="truby")
+    CategoryFactory(name="Трубы скрытые", slug="hidden", is_published=False)
+    ProductFactory(name="Труба 57х3,5", slug="truba-57")
+    ProductFactory(name="Труба 57x3.5 ст20", slug="truba-57-st20")
+    ProductFactory(name="Труба 108х4", slug="truba-108")
+    ProductFactory(name="Лист 57х1,5", slug="list-57")
+    ProductFactory(name="Труба снята", is_published=False)
+
+
+def suggest(q, **params):
+    response = APIClient().get("/api/products/suggest/", {"q": q, **params})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_suggest(catalog):
+    data = suggest("тру")
+
+    assert data["categories"] == [{"name": "Трубы", "slug": "truby"}]
+    assert [product["slug"] for product in data["products"]] == [
+        "truba-108",
+        "truba-57",
+        "truba-57-st20",
+    ]
+
+
+def test_suggest_normalizes_dimension_notation(catalog):
+    assert [product["slug"] for product in suggest("ТРУБА 57Х3,")["products"]] == [
+        "truba-57",
+        "truba-57-st20",
+    ]
+    # Частые размеры идут первыми
+    assert suggest("57")["dimensions"] == ["57x3.5", "57x1.5"]
+    assert suggest("57", limit=1)["dimensions"] == ["57x3.5"]
+
+
+def test_suggest_index_is_rebuilt_when_catalog_changes(
+    catalog, django_capture_on_commit_callbacks, monkeypatch
+):
+    monkeypatch.setattr(suggest_service, "INDEX_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(
+        suggest_service, "start_rebuild", suggest_service.rebuild_suggest_index
+    )
+    suggest_service.get_suggest_index()
+    with CaptureQueriesContext(connection) as queries:
+        suggest("тру")
+    assert not [query for query in queries if "SAVEPOINT" not in query["sql"]]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ProductFactory(name="Тройник 57", slug="troinik")
+
+    assert [product["slug"] for product in suggest("тро")["products"]] == ["troinik"]
+
+
+def test_suggest_serves_old_index_while_rebuilding(
+    catalog, django_capture_on_commit_callbacks, monkeypatch
+):
+    monkeypatch.setattr(suggest_service, "INDEX_CHECK_INTERVAL", 0)
+    rebuilds = []
+    monkeypatch.setattr(suggest_service, "start_rebuild", rebuilds.append)
+    suggest_service.get_suggest_index()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ProductFactory(name="Тройник 57", slug="troinik")
+
+    assert suggest("тро")["products"] == []
+    assert len(rebuilds) == 1
+
+
+def test_product_names_version_changes_only_with_suggest_fields(
+    django_capture_on_commit_callbacks,
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        product = ProductFactory(name="Труба 57", ton_price=50000)
+    version = get_cache_version(PRODUCT_NAMES_VERSION)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product.ton_price = 60000
+        product.in_stock = not product.in_stock
+        product.save()
+    assert get_cache_version(PRODUCT_NAMES_VERSION) == version
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product.name = "Труба 57х3"
+        product.save()
+    assert get_cache_version(PRODUCT_NAMES_VERSION) == version + 1
+
+
+def test_suggest_requires_query():
+    assert APIClient().get("/api/products/suggest/", {"q": " "}).status_code == 400
@@ -0,0 +1,132 @@
+from pathlib import Path
+
+import pytest
+
+from apps.products import tasks
+from apps.products.models import Category, Product
+from apps.products.services.crawler import CrawledPage, CrawlStats
+from apps.products.tests.factories import CategoryFactory, ProductPropertyFactory
+
+pytestmark = pytest.mark.django_db
+
+PAGES_DIR = Path(__file__).parent / "pages"
+
+
+class FakeCrawler:
+    """
+    Краулер, который вместо загрузки отдает заранее заданные страницы
+    """
+
+    def __init__(self, responses, **kwargs):
+        self.responses = responses
+        self.requests = []
+        self.stats = CrawlStats()
+
+    def crawl(self, requests):
+        for request in requests:
+            self.requests.append(request)
+            status_code, text, headers = self.responses[request.key]
+            yield CrawledPage(
+                key=request.key,
+                url=request.url,
+                status_code=status_code,
+                text=text,
+                headers=headers,
+            )
+
+
+@pytest.fixture
+def category():
+    for code in ("diametr", "marka-stali", "dlina"):
+        ProductPropertyFactory(name=code)
+    return CategoryFactory()
+
+
+@pytest.fixture
+def crawl(monkeypatch):
+    def crawl(responses):
+        crawler = FakeCrawler(responses)
+        monkeypatch.setattr(tasks, "Crawler", lambda **kwargs: crawler)
+        tasks.parse_products_task([category.id for category in Category.objects.all()])
+        return crawler
+
+    return crawl
+
+
+def test_parse_products_task_stores_validators(category, crawl):
+    html = (PAGES_DIR / "category.html").read_text()
+
+    crawl({category.id: (200, html, {"etag": '"v1"'})})
+
+    category.refresh_from_db()
+    assert category.is_parsing_successful
+    assert category.parse_etag == '"v1"'
+    assert category.parse_content_hash == tasks.get_content_hash(html)
+    assert Product.objects.exists()
+
+
+def test_parse_products_task_sends_conditional_request(category, crawl):
+    html = (PAGES_DIR / "category.html").read_text()
+    crawl({category.id: (200, html, {"etag": '"v1"'})})
+    Category.objects.update(last_parsed_at=None)
+    Product.objects.all().delete()
+
+    crawler = crawl({category.id: (304, "", {})})
+
+    assert crawler.requests[0].headers == {"If-None-Match": '"v1"'}
+    category.refresh_from_db()
+    assert category.last_parsed_at is not None
+    assert not Product.objects.exists()
+
+
+def test_parse_products_task_skips_unchanged_page(category, crawl):
+    html = (PAGES_DIR / "category.html").read_text()
+    crawl({category.id: (200, html, {})})
+    Category.objects.update(last_parsed_at=None)
+    Product.objects.all().delete()
+
+    crawl({category.id: (200, html, {})})
+
+    assert not Product.objects.exists()
+
+
+def test_parse_products_task_continues_after_category_error(
+    category, crawl, monkeypatch
+):
+    other_category = CategoryFactory()
+    html = (PAGES_DIR / "category.html").read_text()
+    process_category_page = tasks.process_category_page
+
+    def process(category_id, *args):
+        if category_id == category.id:
+            raise ValueError("Неизвестная разметка")
+        return process_category_page(category_id, *args)
+
+    monkeypatch.setattr(tasks, "process_category_page", process)
+
+    crawler = crawl({category.id: (200, html, {}), other_category.id: (200, html, {})})
+
+    assert crawler.requests[0].key == category.id
+    category.refresh_from_db()
+    other_category.refresh_from_db()
+    assert not category.is_parsing_successful
+    assert category.last_parsed_at is not None
+    assert other_category.is_parsing_successful
+    assert Product.objects.exists()
+
+
+def test_parse_products_task_stops_when_blocked(category, crawl):
+    other_category = CategoryFactory()
+    html = (PAGES_DIR / "category.html").read_text()
+    check_human = (PAGES_DIR / "check_human.html").read_text()
+
+    crawler = crawl(
+        {category.id: (200, check_human, {}), other_category.id: (200, html, {})}
+    )
+
+    assert [request.key for request in crawler.requests] == [category.id]
+    category.refresh_from_db()
+    other_category.refresh_from_db()
+    assert not category.is_parsing_successful
+    assert other_category.last_parsed_at is None
+    assert not Product.objects.exists()
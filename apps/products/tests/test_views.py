@@ -0,0 +1,314 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.products import pagination
+from apps.products.models import ProductCategories, ProductPropertyValue
+from apps.products.pagination import LimitOffsetPagination
+from apps.products.services.category_tree import get_category_tree_snapshot
+from apps.products.tests.factories import (
+    CategoryFactory,
+    ProductFactory,
+    ProductPropertyFactory,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+def create_category_products(category, count):
+    diametr = ProductPropertyFactory(name=f"diametr-{category.id}")
+    diametr.is_display_in_list = True
+    diametr.save()
+    for product in ProductFactory.create_batch(count):
+        ProductCategories.objects.create(
+            product=product, category=category, is_primary=True
+        )
+        ProductPropertyValue.objects.create(
+            product=product, property=diametr, value="57"
+        )
+
+
+def get_queries_count(url):
+    with CaptureQueriesContext(connection) as queries:
+        response = APIClient().get(url)
+    assert response.status_code == 200
+    return len(queries)
+
+
+def test_category_products_query_count_is_constant():
+    small, large = CategoryFactory(), CategoryFactory()
+    create_category_products(small, 2)
+    create_category_products(large, 20)
+    get_category_tree_snapshot()
+
+    assert get_queries_count(
+        f"/api/categories/{small.slug}/products/"
+    ) == get_queries_count(f"/api/categories/{large.slug}/products/?limit=20")
+
+
+def test_category_products_prices_use_primary_category_coefficient(
+    django_capture_on_commit_callbacks,
+):
+    category = CategoryFactory(price_coefficient="1.5")
+    with django_capture_on_commit_callbacks(execute=True):
+        product = ProductFactory(ton_price=50000, meter_price=100, unit_price=600)
+        ProductCategories.objects.create(
+            product=product, category=category, is_primary=True
+        )
+
+    response = APIClient().get(f"/api/categories/{category.slug}/products/")
+
+    [data] = response.json()["results"]
+    assert (
+        data["ton_price_with_coef"],
+        data["meter_price_with_coef"],
+        data["unit_price_with_coef"],
+    ) == (75100, 150, 900)
+
+
+def test_product_detail_uses_primary_category():
+    category = CategoryFactory(parent=CategoryFactory())
+    product = ProductFactory()
+    ProductCategories.objects.create(
+        product=product, category=category, is_primary=True
+    )
+
+    response = APIClient().get(f"/api/products/{product.slug}/")
+
+    assert response.json()["category"] == category.name
+    assert response.json()["breadcrumbs"][-1]["name"] == product.name
+
+
+def test_category_products_price_filter_and_ordering():
+    category = CategoryFactory()
+    for price in (30000, 10000, 20000):
+        product = ProductFactory(effective_ton_price=price)
+        ProductCategories.objects.create(
+            product=product, category=category, is_primary=True
+        )
+
+    response = APIClient().get(
+        f"/api/categories/{category.slug}/products/",
+        {"min_price": 15000, "ordering": "-price"},
+    )
+
+    assert [
+        product["ton_price_with_coef"] for product in response.json()["results"]
+    ] == [30000, 20000]
+
+
+def get_cursor_pages(url, params):
+    pages = []
+    response = APIClient().get(url, {**params, "pagination": "cursor", "limit": 2})
+    while True:
+        data = response.json()
+        pages.append([product["id"] for product in data["results"]])
+        if not data["next"]:
+            return pages, data
+        response = APIClient().get(data["next"])
+
+
+@pytest.mark.parametrize("params", [{}, {"ordering": "-price"}])
+def test_category_products_cursor_pagination_matches_offset(params):
+    category = CategoryFactory()
+    diametr = ProductPropertyFactory(name="diametr")
+    diametr.categories.add(category)
+    for in_stock, value, price in [
+        (True, "57", 100),
+        (True, None, 200),
+        (False, "32", 200),
+        (True, "32", 300),
+        (True, "57", 100),
+        (False, None, 400),
+        (True, "108", 200),
+    ]:
+        product = ProductFactory(in_stock=in_stock, effective_ton_price=price)
+        ProductCategories.objects.create(
+            product=product, category=category, is_primary=True
+        )
+        if value:
+            ProductPropertyValue.objects.create(
+                product=product, property=diametr, value=value
+            )
+    url = f"/api/categories/{category.slug}/products/"
+    expected = [
+        product["id"]
+        for product in APIClient().get(url, {**params, "limit": 50}).json()["results"]
+    ]
+
+    cache.clear()
+    with CaptureQueriesContext(connection) as queries:
+        pages, last_page = get_cursor_pages(url, params)
+
+    assert [id for page in pages for id in page] == expected
+    # Количество считается один раз - для первой страницы
+    assert len([query for query in queries if "COUNT(" in query["sql"]]) == 1
+    assert last_page["count"] is None
+    assert (
+        APIClient().get(last_page["previous"]).json()["results"][-1]["id"]
+        == pages[-2][-1]
+    )
+
+
+def test_category_products_invalid_cursor():
+    category = CategoryFactory()
+
+    response = APIClient().get(
+        f"/api/categories/{category.slug}/products/",
+        {"pagination": "cursor", "cursor": "bad"},
+    )
+
+    assert response.status_code == 404
+
+
+def test_category_products_count_is_cached_until_products_change(
+    django_capture_on_commit_callbacks,
+):
+    category = CategoryFactory()
+    create_category_products(category, 3)
+    url = f"/api/categories/{category.slug}/products/"
+    APIClient().get(url)
+
+    with CaptureQueriesContext(connection) as queries:
+        data = APIClient().get(url).json()
+    assert not [query for query in queries if "COUNT(" in query["sql"]]
+    assert (data["count"], data["count_is_estimated"]) == (3, False)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ProductCategories.objects.create(
+            product=ProductFactory(), category=category, is_primary=True
+        )
+    assert APIClient().get(url).json()["count"] == 4
+
+
+def test_category_products_count_is_estimated_only_without_filters(monkeypatch):
+    monkeypatch.setattr(LimitOffsetPagination, "count_estimate_threshold", 0)
+    category = CategoryFactory()
+    create_category_products(category, 3)
+    url = f"/api/categories/{category.slug}/products/"
+
+    assert APIClient().get(url, {"limit": 2}).json()["count_is_estimated"]
+    data = APIClient().get(url, {"min_price": 0}).json()
+    assert (data["count"], data["count_is_estimated"]) == (3, False)
+
+
+def test_parent_category_count_follows_leaf_products(
+    django_capture_on_commit_callbacks,
+):
+    root = CategoryFactory()
+    leaf = CategoryFactory(parent=root)
+    with django_capture_on_commit_callbacks(execute=True):
+        create_category_products(leaf, 2)
+    url = f"/api/categories/{root.slug}/products/"
+    assert APIClient().get(url).json()["count"] == 2
+
+    product = leaf.products.first()
+    with django_capture_on_commit_callbacks(execute=True):
+        product.is_published = False
+        product.save()
+
+    data = APIClient().get(url).json()
+    assert (data["count"], len(data["results"])) == (1, 1)
+
+
+def test_filtered_category_count_follows_property_values(
+    django_capture_on_commit_callbacks,
+):
+    category = CategoryFactory()
+    with django_capture_on_commit_callbacks(execute=True):
+        create_category_products(category, 2)
+        value = ProductPropertyValue.objects.first()
+        value.property.categories.add(category)
+    url = f"/api/categories/{category.slug}/products/"
+    params = {f"prop[{value.property.code}]": "57"}
+    assert APIClient().get(url, params).json()["count"] == 2
+
+    with django_capture_on_commit_callbacks(execute=True):
+        value.value = "89"
+        value.save()
+
+    data = APIClient().get(url, params).json()
+    assert (data["count"], len(data["results"])) == (1, 1)
+
+
+def test_search_count_follows_product_changes(django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        products = ProductFactory.create_batch(2, name="Труба 57")
+    url = "/api/products/search/"
+    assert APIClient().get(url, {"q": "труба"}).json()["count"] == 2
+
+    with django_capture_on_commit_callbacks(execute=True):
+        products[0].name = "Лист"
+        products[0].save()
+
+    data = APIClient().get(url, {"q": "труба"}).json()
+    assert (data["count"], len(data["results"])) == (1, 1)
+
+
+def test_category_products_next_link_ignores_estimated_count(monkeypatch):
+    monkeypatch.setattr(LimitOffsetPagination, "count_estimate_threshold", 0)
+    # Оценка Postgres сильно больше реального количества
+    monkeypatch.setattr(pagination, "estimate_count", lambda queryset: 1000)
+    category = CategoryFactory()
+    create_category_products(category, 3)
+    url = f"/api/categories/{category.slug}/products/"
+
+    data = APIClient().get(url, {"limit": 2}).json()
+    assert (data["count"], len(data["results"])) == (1000, 2)
+    assert "offset=2" in data["next"]
+    data = APIClient().get(url, {"limit": 2, "offset": 2}).json()
+    assert (len(data["results"]), data["next"]) == (1, None)
+
+
+def test_category_products_count_is_exact_near_estimate_threshold(monkeypatch):
+    monkeypatch.setattr(LimitOffsetPagination, "count_estimate_threshold", 10)
+    monkeypatch.setattr(pagination, "estimate_count", lambda queryset: 15)
+    category = CategoryFactory()
+    create_category_products(category, 3)
+
+    data = APIClient().get(f"/api/categories/{category.slug}/products/").json()
+    assert (data["count"], data["count_is_estimated"]) == (3, False)
+
+
+def test_product_batch_returns_prices_in_one_query(
+    django_capture_on_commit_callbacks,
+):
+    category = CategoryFactory(price_coefficient=2)
+    with django_capture_on_commit_callbacks(execute=True):
+        products = ProductFactory.create_batch(3, ton_price=50000, in_stock=False)
+        for product in products:
+            ProductCategories.objects.create(
+                product=product, category=category, is_primary=True
+            )
+    ProductFactory(is_published=False, slug="hidden")
+    products[1].refresh_from_db()
+    products[1].always_in_stock = True
+    products[1].save()
+
+    with CaptureQueriesContext(connection) as queries:
+        response = APIClient().post(
+            "/api/products/batch/",
+            {
+                "slugs": [products[2].slug, "hidden", "missing", products[1].slug],
+                "ids": [products[0].id, products[2].id],
+            },
+            format="json",
+        )
+
+    assert response.status_code == 200
+    assert len([query for query in queries if "SAVEPOINT" not in query["sql"]]) == 1
+    assert [(item["id"], item["in_stock"]) for item in response.json()] == [
+        (products[2].id, False),
+        (products[1].id, True),
+        (products[0].id, False),
+    ]
+    assert response.json()[0]["ton_price_with_coef"] == 100100
+
+
+@pytest.mark.parametrize("data", [{}, {"ids": list(range(1, 302))}])
+def test_product_batch_validates_size(data):
+    response = APIClient().post("/api/products/batch/", data, format="json")
+
+    assert response.status_code == 400
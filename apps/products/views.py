@@ -7,21 +7,50 @@ from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet, ViewSet
 
 from apps.products.models import Category, Product
-from apps.products.pagination import LimitOffsetPagination, get_paginated_response
+from apps.products.pagination import (
+    KeysetPagination,
+    LimitOffsetPagination,
+    get_paginated_response,
+)
 from apps.products.serializers import (
     CatalogLeftMenuSerializer,
     CategoryDetailOutputSerializer,
+    CategoryFacetSerializer,
     CategoryListOutputSerializer,
+    ProductBatchInputSerializer,
+    ProductBatchOutputSerializer,
     ProductDetailOutputSerializer,
     ProductFilterSerializer,
     ProductListOutputSerializer,
+    ProductSearchSerializer,
+    SuggestInputSerializer,
+    SuggestOutputSerializer,
+)
+from apps.products.services.cache import (
+    CATEGORIES_VERSION,
+    PRODUCTS_VERSION,
+    PROPERTIES_VERSION,
+    cache_response,
+    get_category_version_name,
+    get_product_version_names,
 )
 from apps.products.services.categories import (
+    get_category,
+    get_category_facets,
     get_category_product_list,
+    get_category_tree,
     get_children_categories,
     get_root_categories,
 )
-from apps.products.services.products import get_products_list
+from apps.products.services.facets import parse_facet_params
+from apps.products.services.filter_engine import filter_category_products
+from apps.products.services.products import (
+    annotate_product_list,
+    get_products_batch,
+    get_products_list,
+)
+from apps.products.services.search import search_products
+from apps.products.services.suggest import get_suggest_index
 from apps.utils.custom import get_object_or_None
 
 
@@ -33,8 +62,11 @@ class ProductViewSet(ViewSet):
 
     lookup_field = "slug"
 
+    class Pagination(LimitOffsetPagination):
+        default_limit = 20
+
     def get_permissions(self):
-        if self.action in ("list", "retrieve"):
+        if self.action in ("list", "retrieve", "search", "suggest", "batch"):
             permission_classes = [
                 AllowAny,
             ]
@@ -64,6 +96,25 @@ class ProductViewSet(ViewSet):
                 required=False,
                 type=str,
             ),
+            OpenApiParameter(
+                name="min_price",
+                description="Минимальная цена за тонну",
+                required=False,
+                type=float,
+            ),
+            OpenApiParameter(
+                name="max_price",
+                description="Максимальная цена за тонну",
+                required=False,
+                type=float,
+            ),
+            OpenApiParameter(
+                name="ordering",
+                description="Сортировка: price, meter_price, unit_price, name "
+                "(с минусом - по убыванию)",
+                required=False,
+                type=str,
+            ),
         ],
         responses={
             200: ProductListOutputSerializer(many=True),
@@ -78,14 +129,91 @@ class ProductViewSet(ViewSet):
 
         return Response(data, status=status.HTTP_200_OK)
 
+    @cache_response(get_product_version_names)
     def retrieve(self, request, slug=None):
-        qs = Product.objects.prefetch_related(
-            "properties_through__property", "categories"
+        qs = annotate_product_list(
+            Product.objects.prefetch_related("properties_through__property")
         )
         product = get_object_or_None(qs, slug=slug)
         data = ProductDetailOutputSerializer(product).data
         return Response(data)
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="q",
+                description="Поисковый запрос: название, размер (57х3,5), "
+                "марка стали, ГОСТ",
+                required=True,
+                type=str,
+            ),
+        ],
+        responses={
+            200: ProductListOutputSerializer(many=True),
+            400: OpenApiResponse(description="Не передан поисковый запрос"),
+        },
+    )
+    def get_count_version_names(self):
+        # Результаты поиска зависят от всех товаров
+        return [PRODUCTS_VERSION]
+
+    @action(methods=["GET"], detail=False)
+    def search(self, request):
+        search_serializer = ProductSearchSerializer(data=request.query_params)
+        search_serializer.is_valid(raise_exception=True)
+        products = annotate_product_list(
+            search_products(search_serializer.validated_data["q"])
+        )
+        return get_paginated_response(
+            pagination_class=self.Pagination,
+            serializer_class=ProductListOutputSerializer,
+            queryset=products,
+            request=request,
+            view=self,
+        )
+
+    @extend_schema(
+        request=ProductBatchInputSerializer,
+        responses={
+            200: ProductBatchOutputSerializer(many=True),
+            400: OpenApiResponse(description="Не переданы товары или их слишком много"),
+        },
+    )
+    @action(methods=["POST"], detail=False)
+    def batch(self, request):
+        """
+        Цены и наличие нескольких товаров, например для пересчета корзины.
+        Неопубликованных и несуществующих товаров в ответе нет
+        """
+        input_serializer = ProductBatchInputSerializer(data=request.data)
+        input_serializer.is_valid(raise_exception=True)
+        products = get_products_batch(**input_serializer.validated_data)
+        return Response(ProductBatchOutputSerializer(products, many=True).data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="q",
+                description="Начало названия товара, категории или размера",
+                required=True,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="limit",
+                description="Количество подсказок каждого вида, от 1 до 20",
+                required=False,
+                type=int,
+            ),
+        ],
+        responses=SuggestOutputSerializer,
+    )
+    @action(methods=["GET"], detail=False)
+    def suggest(self, request):
+        input_serializer = SuggestInputSerializer(data=request.query_params)
+        input_serializer.is_valid(raise_exception=True)
+        suggestions = get_suggest_index().suggest(**input_serializer.validated_data)
+        return Response(SuggestOutputSerializer(suggestions).data)
+
 
 @extend_schema(tags=["Catalog"])
 class CategoryViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
@@ -97,6 +225,9 @@ class CategoryViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
     class Pagination(LimitOffsetPagination):
         default_limit = 20
 
+    class CursorPagination(KeysetPagination):
+        default_limit = 20
+
     # filter_backends = [DjangoFilterBackend, filters.OrderingFilter,
     # filters.SearchFilter]
     # filterset_fields = ('category', 'in_stock')
@@ -119,7 +250,12 @@ class CategoryViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
     # def get_queryset(self, *args, **kwargs):
     #     return self.queryset
 
+    @cache_response([CATEGORIES_VERSION, PROPERTIES_VERSION])
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(methods=["GET"], detail=False)
+    @cache_response([CATEGORIES_VERSION])
     def root(self, request):
         root_categories = get_root_categories()
         serializer = self.get_serializer(root_categories, many=True)
@@ -127,30 +263,82 @@ class CategoryViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
         return Response(data=serializer.data, status=status.HTTP_200_OK)
 
     @action(methods=["GET"], detail=True)
+    @cache_response([CATEGORIES_VERSION])
     def children(self, request, slug=None):
         children_categories = get_children_categories(slug=slug)
         serializer = self.get_serializer(children_categories, many=True)
 
         return Response(data=serializer.data, status=status.HTTP_200_OK)
 
+    def get_count_version_names(self):
+        # Количество товаров категории кэшируется до изменения товаров ее ветки
+        # (версию сбрасывают и изменения в потомках) или свойств
+        category = get_category(self.kwargs["slug"])
+        return [get_category_version_name(category.id), PROPERTIES_VERSION]
+
+    def get_products_pagination_class(self):
+        if self.request.query_params.get("pagination") == "cursor":
+            return self.CursorPagination
+        return self.Pagination
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="pagination",
+                description="cursor - постраничная навигация по курсору "
+                "из ссылок next и previous вместо limit и offset",
+                required=False,
+                type=str,
+                enum=["cursor"],
+            ),
+            OpenApiParameter(
+                name="cursor",
+                description="Курсор страницы при pagination=cursor",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="prop[code]",
+                description="Фильтр по значению свойства с кодом code из фасетов "
+                "категории, можно передать несколько раз. prop[code][min] и "
+                "prop[code][max] - диапазон числового значения",
+                required=False,
+                type=str,
+            ),
+        ],
+    )
     @action(methods=["GET"], detail=True)
     def products(self, request, slug=None):
         filters_serializer = ProductFilterSerializer(data=request.query_params)
         filters_serializer.is_valid(raise_exception=True)
-        products = get_category_product_list(
-            slug=slug, filters=filters_serializer.validated_data
-        )
+        filters = filters_serializer.validated_data
+        facet_filters = parse_facet_params(request.query_params)
+        pagination_class = self.get_products_pagination_class()
+        products = None
+        # Движок фильтров отдает список id, по нему листается только limit/offset
+        if pagination_class is self.Pagination:
+            products = filter_category_products(slug, filters, facet_filters)
+        if products is None:
+            products = get_category_product_list(
+                slug=slug, filters=filters, facet_filters=facet_filters
+            )
         return get_paginated_response(
-            pagination_class=self.Pagination,
+            pagination_class=pagination_class,
             serializer_class=ProductListOutputSerializer,
             queryset=products,
             request=request,
             view=self,
         )
 
+    @extend_schema(responses=CategoryFacetSerializer(many=True))
+    @action(methods=["GET"], detail=True)
+    def facets(self, request, slug=None):
+        data = CategoryFacetSerializer(get_category_facets(slug), many=True).data
+        return Response(data, status=status.HTTP_200_OK)
+
     @action(methods=["GET"], detail=False)
+    @cache_response([CATEGORIES_VERSION])
     def menu(self, request):
-        items = get_root_categories().filter(is_published=True).order_by("ordering")
-        data = CatalogLeftMenuSerializer(items, many=True).data
+        data = CatalogLeftMenuSerializer(get_category_tree(), many=True).data
 
         return Response(data, status=status.HTTP_200_OK)
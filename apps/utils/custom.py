@@ -22,8 +22,15 @@ def get_object_or_None(klass, *args, **kwargs):
 
 
 def create_breadcrumbs(
-    obj: Model, root_path: str = "/catalog", disable_last: bool = True
+    obj: Model,
+    root_path: str = "/catalog",
+    disable_last: bool = True,
+    ancestors: list[Model] | None = None,
 ) -> list[dict]:
+    """
+    Хлебные крошки узла дерева. Если предки уже известны, они передаются
+    в ancestors, иначе запрашиваются через get_ancestors
+    """
     if hasattr(obj, "parsed_name") and obj.name == "":
         obj.name = obj.parsed_name
     last_item = {
@@ -36,7 +43,9 @@ def create_breadcrumbs(
         return [last_item]
 
     breadcrumbs = []
-    for ancestor in obj.get_ancestors():
+    if ancestors is None:
+        ancestors = obj.get_ancestors()
+    for ancestor in ancestors:
         if hasattr(ancestor, "parsed_name") and ancestor.name == "":
             ancestor.name = ancestor.parsed_name
         item = {
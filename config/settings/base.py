@@ -61,6 +61,7 @@ DJANGO_APPS = [
     "django.contrib.staticfiles",
     # "django.contrib.humanize", # Handy template tags
     "django.contrib.admin",
+    "django.contrib.postgres",
     "django.forms",
 ]
 THIRD_PARTY_APPS = [
@@ -336,6 +337,7 @@ CORS_ALLOWED_ORIGINS = [
 ]
 CORS_ALLOW_METHODS = [
     "GET",
+    "POST",
 ]
 
 # By Default swagger ui is available only to admin user(s). You can change
@@ -350,3 +352,21 @@ SPECTACULAR_SETTINGS = {
 }
 # Your stuff...
 # ------------------------------------------------------------------------------
+
+# Parsing
+# ------------------------------------------------------------------------------
+# Максимальное число одновременных запросов краулера
+PARSER_CONCURRENCY = env.int("PARSER_CONCURRENCY", default=4)
+# Бюджет вежливости: запросов в секунду к одному хосту и допустимая "пачка"
+PARSER_RATE_LIMIT = env.float("PARSER_RATE_LIMIT", default=0.5)
+PARSER_RATE_BURST = env.int("PARSER_RATE_BURST", default=2)
+# Таймаут запроса и число повторов при сетевых ошибках и ответах 5xx
+PARSER_TIMEOUT = env.float("PARSER_TIMEOUT", default=30.0)
+PARSER_RETRIES = env.int("PARSER_RETRIES", default=2)
+# Разбор страниц категорий: "lxml" (потоковый) или "bs4" (эталонный)
+PARSER_BACKEND = env("PARSER_BACKEND", default="lxml")
+
+# Catalog
+# ------------------------------------------------------------------------------
+# Фильтрация страниц категорий в памяти процесса вместо SQL
+CATALOG_FILTER_ENGINE = env.bool("CATALOG_FILTER_ENGINE", default=False)